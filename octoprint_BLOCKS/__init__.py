@@ -4,6 +4,7 @@ from __future__ import absolute_import
 
 import os
 import socket
+import threading
 import netifaces
 import logging
 import octoprint.events
@@ -14,6 +15,13 @@ from octoprint.util import RepeatedTimer
 from octoprint.util.comm import parse_firmware_line
 
 from .wifisetup import Wifisetup
+from .wpa_ctrl import WpaMonitor
+from .executor import default_executor
+from .scanresults import to_wire
+from .netlink import LinkWatcher
+from .python3wifi.iwlibs import (default_channel, default_nl80211,
+                                 iwranges, wireless_interfaces)
+from .python3wifi.procwireless import proc_wireless
 
 
 class BlocksPlugin(octoprint.plugin.SettingsPlugin,
@@ -31,6 +39,11 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
         self._interfaces = []
         self._printer_name = None
         self._printerSerialNumber = None
+        self._wifi_monitor = None
+        self._link_watcher = None
+        self._wifi_status_lock = threading.Lock()
+        # Seconds the status waits for the interfaces, None for the default
+        self._wifi_status_timeout = None
 
     # def on_startup(self):
 
@@ -38,7 +51,36 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
     def on_after_startup(self):
         self._logger.info("Blocks initializing...")
         # , condition = self._wifi_reporting_enabled)
-        self._wifi_update = RepeatedTimer(6.0, self.wifiStatus, run_first=True)
+        # Link, carrier and address changes are pushed by the kernel and
+        # reported right away, the timer only keeps the signal level fresh.
+        # Without netlink it's the only thing noticing changes, so it polls
+        # like it used to
+        self._link_watcher = LinkWatcher(self._on_link_change)
+        try:
+            self._link_watcher.start()
+            _status_interval = self._settings.get_float(["signalPollInterval"])
+        except OSError as error:
+            self._logger.warning("Can't watch links, polling: %s", error)
+            self._link_watcher = None
+            _status_interval = 6.0
+        # An interface that doesn't answer by then is reported as failed,
+        # the timer isn't held past its next tick
+        self._wifi_status_timeout = _status_interval / 2
+        self._wifi_update = RepeatedTimer(
+            _status_interval, self.wifiStatus, run_first=True)
+        _scan_cache = self._wifiSetUp.scan_cache
+        _scan_cache.ttl = self._settings.get_float(["scanCacheTTL"])
+        _scan_cache.max_staleness = self._settings.get_float(
+            ["scanMaxStaleness"])
+        # With several radios, which connected one the M550 level is about
+        self._wifiSetUp.indicator_policy = self._settings.get(
+            ["wifiIndicatorInterface"])
+        # The timer is served from the scan cache, the radio only scans when
+        # the results are stale. When the backend pushes events the results
+        # of those scans come in through the monitor as soon as they're done
+        self._wifi_monitor = self._wifiSetUp.start_monitor(
+            self._on_wifi_event)
+        self._wifiSetUp.saved_networks.watch()
         self._wifi_networks_list = RepeatedTimer(
             7.0, self._available_networks, run_first=True)
 
@@ -50,6 +92,21 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
         # # Sends a M115 V to request the serial number
 
         # self._serialNumberRequest.start()
+
+    # ~~ ShutdownPlugin mixin
+
+    def on_shutdown(self):
+        if self._wifi_monitor is not None:
+            self._wifi_monitor.stop()
+        if self._link_watcher is not None:
+            self._link_watcher.stop()
+        self._wifiSetUp.saved_networks.stop()
+        self._wifiSetUp.shutdown()
+        default_executor.shutdown()
+        default_channel.close()
+        default_nl80211.close()
+        proc_wireless.close()
+
     # ~~ Wifi
 
     def _wifi_reporting_enabled(self):
@@ -63,18 +120,59 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
     def get_saved_networks(self):
         return self._wifiSetUp.list_existing_networks()
 
-    def _available_networks(self):
+    def _available_networks(self, force=False):
         """Get a list with all the networks from a BSS scan
             and send a notification with that list to any message listeners.
 
+        Args:
+            force (type: boolean): rescan even if the cached scan is fresh.
+
         """
         self._AP_result = []
-        self._AP_result = self._wifiSetUp.list_available_networks()
+        self._AP_result = self._wifiSetUp.list_available_networks(force=force)
+        self._send_network_list()
+
+    def _on_wifi_event(self, event, text):
+        """Handles the events pushed by the wpa_supplicant monitor.
+            Runs on the monitor thread.
+
+        Args:
+            event (type: string): the wpa_supplicant event name.
+            text (type: string): the rest of the event line.
+
+        """
+        if event == WpaMonitor.SCAN_RESULTS:
+            self._AP_result = self._wifiSetUp.list_scanned_networks()
+            self._send_network_list()
+        elif event in (WpaMonitor.CONNECTED, WpaMonitor.DISCONNECTED):
+            self._logger.info("Wifi %s", text)
+            self.wifiStatus()
+
+    def _on_link_change(self, interface):
+        """Handles link, carrier and address changes.
+            Runs on the link watcher thread.
+
+        Args:
+            interface (type: string): the interface that changed, None when
+                changes were missed.
+
+        """
+        self._logger.debug("Link change on %s", interface)
+        # An interface came or went, which ones are wireless and their
+        # driver's range data may have changed
+        wireless_interfaces.link_changed(interface)
+        iwranges.link_changed(interface)
+        # The checker's own cadence is far slower than the link going away
+        self._connectivity_checker.check_immediately()
+        self.wifiStatus()
+
+    def _send_network_list(self):
         # Now i need to send this to the web page
+        # [[ssid, signal, bands, security], ...] strongest first
         notification = {
             "type": "WifiSetUp",
             "hide": "true",
-            "message": self._AP_result
+            "message": to_wire(self._AP_result)
         }
 
         # Sends a message to any message listeners
@@ -115,15 +213,30 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
             self._logger.info("Successfully added %s network" %
                               _data["ip"]["ssid"])
         else:
-            self._logger.info("Error while adding %s network" %
-                              _data["ip"]["ssid"])
+            notification = {
+                "type": "error",
+                "action": "popup",
+                "hide": "false",
+                "message": "Could not add %s network (%s)" % (
+                    _data["ip"]["ssid"], _output.reason)
+            }
+            self._plugin_manager.send_plugin_message(
+                self._identifier, notification)
+            self._logger.info("Error while adding %s network: %s" %
+                              (_data["ip"]["ssid"], _output))
 
     def wifiStatus(self):
         """
             Controls the wifi status, sends a wifi signal strength integer to marlin.
+            Called by the timer and on link changes, one at a time.
         """
+        with self._wifi_status_lock:
+            self._wifi_status()
+
+    def _wifi_status(self):
         _info = None
-        _info = self._wifiSetUp.find_connection()
+        _info = self._wifiSetUp.find_connection(
+            timeout=self._wifi_status_timeout) or (None, None)
 
         _interface = _info[0]
         _ssid = _info[-1]
@@ -171,13 +284,16 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
 
     def get_api_commands(self):
         return dict(
-            wifi_SetUp=["ip"]
+            wifi_SetUp=["ip"],
+            wifi_Scan=[]
         )
 
     def on_api_command(self, command, data):
         if command == "wifi_SetUp":
             self._logger.info("Wifi setup in progress.")
             self.setNewWifi(data)
+        elif command == "wifi_Scan":
+            self._available_networks(force=bool(data.get("force", False)))
 
     # ~~ AssetPlugin mixi
 
@@ -199,6 +315,14 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
             # Settings that are saved on machine shutdown
             "themeType": False,
             "Machine_Type": "undefined",
+            # Seconds a wifi scan is fresh / may still be shown while rescanning
+            "scanCacheTTL": 25.0,
+            "scanMaxStaleness": 120.0,
+            # Seconds between signal level updates, link changes are immediate
+            "signalPollInterval": 30.0,
+            # Interface whose signal the printer shows: "primary",
+            # "strongest" or an interface name
+            "wifiIndicatorInterface": "primary",
         }
 
     def on_settings_initialized(self):
@@ -227,6 +351,9 @@ class BlocksPlugin(octoprint.plugin.SettingsPlugin,
         if 'MachineSerial' in data and data['MachineSerial']:
             self._settings.set(["MachineSerial"], machine_serial)
             self._logger("Saving Settings.")
+        if 'wifiIndicatorInterface' in data:
+            self._wifiSetUp.indicator_policy = self._settings.get(
+                ["wifiIndicatorInterface"])
 
     # ~~ TemplatePlugin mixin
 
@@ -0,0 +1,760 @@
+# coding=utf-8
+import os
+import io
+import time
+import socket
+import logging
+from .python3wifi.iwlibs import Wireless, iwranges
+from .python3wifi.procwireless import proc_wireless
+from .wpa_ctrl import WPA_CTRL_DIR, WpaCtrl, WpaCtrlError, WpaMonitor
+from .nm_dbus import NetworkManagerDBus, NetworkManagerError
+from .executor import default_executor
+from .psk import default_psk_cache
+from .hostname import HostnameService
+from .registry import SavedNetwork
+from .scanresults import (ScanRecord, parse_scan_results, parse_nmcli_scan,
+                          unescape_ssid)
+
+OS_RELEASE_PATH = "/etc/os-release"
+NM_RUN_DIR = "/run/NetworkManager"
+WPA_CONFIG_PATH = "/etc/wpa_supplicant/wpa_supplicant.conf"
+NM_CONNECTIONS_DIR = "/etc/NetworkManager/system-connections"
+
+_logger = logging.getLogger(__name__)
+
+
+def quality_percent(interface, quality):
+    """Scales a driver's link quality to 0-100 with the driver's maximum.
+
+    Args:
+        interface (type: string): the wireless interface.
+        quality (type: int): the link quality the driver reported.
+
+    Returns:
+        type: int. Unscaled when the driver doesn't tell its maximum.
+
+    """
+    try:
+        _scale = iwranges.get(interface).quality_scale
+    except OSError:
+        _scale = 0
+    if not _scale:
+        return quality
+    return min(100, int(quality * _scale))
+
+
+def run_command(argv, timeout=None):
+    """Runs a command through the shared executor, without a shell.
+
+    Args:
+        argv (type: list): The program and its arguments.
+        timeout (type: float): Seconds before it's killed. Defaults to the
+            executor's timeout.
+
+    Returns:
+        type: bytes. The complete output that resulted from the command,
+            None if it couldn't be run or timed out.
+
+    """
+    _result = default_executor.run(argv, timeout=timeout)
+    if _result.error is not None or _result.timed_out:
+        _logger.error('Error running command : %s', " ".join(argv))
+        return None
+    return _result.output
+
+
+def read_os_release(path=OS_RELEASE_PATH):
+    """Parses the os-release file.
+
+    Args:
+        path (type: string): Defaults to /etc/os-release.
+
+    Returns:
+        type: dict. KEY -> value, empty if the file can't be read.
+
+    """
+    _release = {}
+    try:
+        with io.open(path, "r", encoding="utf-8") as _fileHandle:
+            for _line in _fileHandle:
+                _key, _sep, _value = _line.strip().partition("=")
+                if _sep and not _key.startswith("#"):
+                    _release[_key] = _value.strip("\"'")
+    except IOError as error:
+        _logger.warning("Can't read %s: %s", path, error)
+    return _release
+
+
+class ApplyResult(object):
+    """Outcome of adding a network.
+
+    Truthy when the network was added, so it can be used like the boolean
+    add_network used to return.
+
+    Attributes:
+        ok (type: boolean): the network is connected and saved.
+        reason (type: string): why it failed, e.g. "auth-failed",
+            "association-timeout", "dhcp-timeout", "rejected".
+        network_id (type: string): the id the network got, if it was kept.
+        detail (type: string): extra information, e.g. the failing reply.
+
+    """
+
+    def __init__(self, ok, reason=None, network_id=None, detail=None):
+        self.ok = ok
+        self.reason = reason
+        self.network_id = network_id
+        self.detail = detail
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return "ApplyResult(ok=%r, reason=%r, network_id=%r, detail=%r)" % (
+            self.ok, self.reason, self.network_id, self.detail)
+
+
+class NetworkBackend(object):
+    """Base class of the ways the plugin can manage the network.
+
+    A backend is picked once by detect_backend() and Wifisetup only ever
+    talks to it, so adding a faster way of doing things means adding a
+    backend, not another "if platform" branch.
+
+    Args:
+        interface (type: string): the wireless interface to manage.
+
+    """
+
+    name = None
+    # The file or directory the saved networks live in
+    config_path = None
+    # True when request_scan() only returns once the results are in
+    instant_scan = False
+
+    def __init__(self, interface="wlan0"):
+        self.interface = interface
+        self.hostname_service = HostnameService()
+        self.logger = logging.getLogger(__name__)
+
+    def for_interface(self, interface):
+        """Returns a backend of the same kind managing another interface.
+
+        Args:
+            interface (type: string): the wireless interface.
+
+        Returns:
+            type: NetworkBackend.
+
+        """
+        return type(self)(interface)
+
+    def scan(self):
+        """Requests a BSS scan and returns the networks found."""
+        self.request_scan()
+        return self.scan_results()
+
+    def request_scan(self):
+        """Asks for a new BSS scan without waiting for it.
+
+        Returns:
+            type: boolean. True if the scan was accepted.
+
+        """
+        raise NotImplementedError()
+
+    def scan_results(self):
+        """Returns the networks seen by the last finished scan.
+
+        Returns:
+            type: List. ScanRecord objects, strongest signal first.
+
+        """
+        raise NotImplementedError()
+
+    def status(self, interface):
+        """Returns the SSID (or connection name) an interface is connected
+            to, None if it isn't.
+        """
+        raise NotImplementedError()
+
+    def stats(self, interface):
+        """Returns the link statistics of a connected interface.
+
+        Returns:
+            type: dict. "Quality" (0-100), "Signal" when the driver knows it.
+
+        """
+        raise NotImplementedError()
+
+    def link_stats(self, interface):
+        """Returns the statistics /proc/net/wireless lists for an
+            interface. Every interface comes from a single read of a file
+            kept open, far cheaper than asking the driver or
+            NetworkManager.
+
+        Returns:
+            type: dict. Like stats(), None if the interface isn't listed.
+
+        """
+        try:
+            _stats = proc_wireless.get(interface)
+        except OSError:
+            return None
+        if _stats is None:
+            return None
+        return {"Quality": quality_percent(interface, _stats.quality),
+                "Signal": _stats.level}
+
+    def add_network(self, ssid, psk, existing=None):
+        """Adds a new network, connects to it and saves the configuration.
+            Nothing is left behind when it fails.
+
+        Args:
+            ssid (type: string): network name.
+            psk (type: string): network password.
+            existing (type: SavedNetwork): the saved entry of the same SSID,
+                updated instead of adding another one.
+
+        Returns:
+            type: ApplyResult.
+
+        """
+        raise NotImplementedError()
+
+    def select_network(self, network_id):
+        """Connects to an already configured network."""
+        raise NotImplementedError()
+
+    def list_networks(self):
+        """Returns the configured networks."""
+        raise NotImplementedError()
+
+    def saved_networks(self):
+        """Returns the configured networks.
+
+        Returns:
+            type: List. SavedNetwork objects.
+
+        """
+        raise NotImplementedError()
+
+    def monitor(self, callback):
+        """Starts pushing scan and connection events to callback(event, text).
+
+        Returns:
+            type: The running monitor, None if the backend can't push events.
+
+        """
+        return None
+
+    def hostname(self):
+        """Returns the current hostname."""
+        return self.hostname_service.current()
+
+    def set_hostname(self, newHostname):
+        """Changes the hostname, live, when it's different.
+
+        Returns:
+            type: boolean. True if it was changed.
+
+        """
+        return self.hostname_service.change(newHostname)
+
+
+class WpaSupplicantBackend(NetworkBackend):
+    """Manages wpa_supplicant directly through its control socket
+    (Raspbian).
+    """
+
+    name = "wpa_supplicant"
+
+    # Seconds add_network waits for association and an IP address
+    APPLY_TIMEOUT = 30.0
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, interface="wlan0", ctrl_dir=WPA_CTRL_DIR,
+                 config_path=WPA_CONFIG_PATH):
+        NetworkBackend.__init__(self, interface)
+        self.ctrl_dir = ctrl_dir
+        self.config_path = config_path
+        self.apply_timeout = self.APPLY_TIMEOUT
+        # Kept open for the whole plugin lifetime, opened on first use
+        self._wpa = WpaCtrl(interface, ctrl_dir=ctrl_dir)
+
+    def for_interface(self, interface):
+        return WpaSupplicantBackend(interface, ctrl_dir=self.ctrl_dir,
+                                    config_path=self.config_path)
+
+    def wpa_request(self, command):
+        """Sends a command to wpa_supplicant over its control socket.
+
+        Args:
+            command (type: string): The wpa_supplicant control command.
+
+        Returns:
+            type: String. The reply, None if wpa_supplicant couldn't be reached.
+
+        """
+        try:
+            return self._wpa.request(command)
+        except WpaCtrlError as error:
+            self.logger.error("wpa_supplicant request failed: %s", error)
+
+    def request_scan(self):
+        return self.wpa_request("SCAN") == "OK"
+
+    def scan_results(self):
+        _output = self.wpa_request("SCAN_RESULTS")
+        if _output is None:
+            return []
+        return parse_scan_results(_output)
+
+    def status(self, interface):
+        return Wireless(interface).getEssid()
+
+    def stats(self, interface):
+        _stats = self.link_stats(interface)
+        if _stats is not None:
+            return _stats
+        _, quality, _, _ = Wireless(interface).getStatistics()
+        return {"Quality": quality_percent(interface, quality.quality),
+                "Signal": quality.siglevel}
+
+    def add_network(self, ssid, psk, existing=None):
+        """Stages the network in wpa_supplicant, switches to it and waits
+            for association and DHCP. Only then is the configuration saved,
+            otherwise the staged network is removed and the previous
+            networks are brought back. An existing entry of the same SSID
+            is replaced by the staged one, keeping its priority.
+        """
+        # SELECT_NETWORK disables every other network, only the ones that
+        # were enabled are enabled again afterwards
+        _enabled = self._enabled_networks()
+        _network_id = self.wpa_request("ADD_NETWORK")
+        if not _network_id or not _network_id.isdigit():
+            return ApplyResult(False, "rejected", detail=_network_id)
+        _psk = self.set_pass_encryp(_ssid=ssid, _password=psk)
+        # Hex ssid, so quotes in the name can't break the command
+        for _command in ("SET_NETWORK %s ssid %s" %
+                         (_network_id, ssid.encode("utf-8").hex()),
+                         "SET_NETWORK %s psk %s" %
+                         (_network_id, _psk or '"%s"' % psk),
+                         "SET_NETWORK %s priority %d" %
+                         (_network_id, existing.priority if existing else 0),
+                         "SELECT_NETWORK %s" % _network_id):
+            _reply = self.wpa_request(_command)
+            if _reply != "OK":
+                return self._rollback(_network_id, _enabled, "rejected",
+                                      "%s: %s" % (_command.split(" ", 2)[0],
+                                                  _reply))
+
+        _reason = self._wait_connected(_network_id)
+        if _reason is not None:
+            return self._rollback(_network_id, _enabled, _reason)
+
+        if existing is not None:
+            self.wpa_request("REMOVE_NETWORK %s" % existing.id)
+        # They must not be saved disabled
+        self._enable_networks(_id for _id in _enabled
+                              if existing is None or _id != existing.id)
+        _returnSave = self.wpa_request("SAVE_CONFIG")
+        if _returnSave != "OK":
+            return ApplyResult(False, "save-failed", _network_id, _returnSave)
+        return ApplyResult(True, network_id=_network_id)
+
+    def _wait_connected(self, network_id):
+        """Polls STATUS until network_id is associated and has an address.
+
+        Returns:
+            type: String. The failure reason, None when connected.
+
+        """
+        _deadline = time.monotonic() + self.apply_timeout
+        _associated = False
+        while time.monotonic() < _deadline:
+            _status = self.wpa_status()
+            if _status.get("wpa_state") == "COMPLETED" and \
+                    _status.get("id") == network_id:
+                _associated = True
+                if _status.get("ip_address"):
+                    return None
+            elif not _associated and self._temp_disabled(network_id):
+                # wpa_supplicant gave up on it, usually a wrong password
+                return "auth-failed"
+            time.sleep(self.POLL_INTERVAL)
+        return "dhcp-timeout" if _associated else "association-timeout"
+
+    def _temp_disabled(self, network_id):
+        for _line in self.list_networks()[1:]:
+            _fields = _line.split("\t")
+            if _fields[0] == network_id:
+                return "[TEMP-DISABLED]" in _fields[-1]
+        return False
+
+    def _enabled_networks(self):
+        """Returns the ids of the networks that aren't [DISABLED]."""
+        _enabled = []
+        for _line in self.list_networks()[1:]:
+            _fields = _line.split("\t")
+            if len(_fields) == 4 and "[DISABLED]" not in _fields[3]:
+                _enabled.append(_fields[0])
+        return _enabled
+
+    def _enable_networks(self, network_ids):
+        for _id in network_ids:
+            self.wpa_request("ENABLE_NETWORK %s" % _id)
+
+    def _rollback(self, network_id, enabled, reason, detail=None):
+        self.logger.info("Removing network %s: %s", network_id, reason)
+        self.wpa_request("REMOVE_NETWORK %s" % network_id)
+        self._enable_networks(_id for _id in enabled if _id != network_id)
+        self.wpa_request("REASSOCIATE")
+        return ApplyResult(False, reason, detail=detail)
+
+    def wpa_status(self):
+        """Returns wpa_supplicant's STATUS as a dict."""
+        _output = self.wpa_request("STATUS") or ""
+        return dict(_line.split("=", 1) for _line in _output.split("\n")
+                    if "=" in _line)
+
+    def set_pass_encryp(self, _ssid=None, _password=None):
+        """Derives the encryption for a network password, what the
+            wpa_passphrase command would print, without running it.
+        Args:
+            _ssid (type): ssid for the network. Defaults to None.
+            _password (type): password of the network(not encrypted). Defaults to None.
+
+        Returns:
+            type: String, the encrypted password. None if it couldn't be made.
+
+        """
+        try:
+            return default_psk_cache.get(_ssid, _password)
+        except ValueError as error:
+            self.logger.error("Can't use the %s password: %s", _ssid, error)
+            return None
+
+    def select_network(self, network_id):
+        return self.wpa_request("SELECT_NETWORK %s" % network_id)
+
+    def list_networks(self):
+        _output = self.wpa_request("LIST_NETWORKS")
+        return _output.split("\n") if _output is not None else []
+
+    def saved_networks(self):
+        _networks = []
+        # "network id / ssid / bssid / flags" header first
+        for _line in self.list_networks()[1:]:
+            _fields = _line.split("\t")
+            if len(_fields) != 4:
+                continue
+            _id, _ssid, _, _flags = _fields
+            # Priorities can be negative
+            try:
+                _priority = int(self.wpa_request(
+                    "GET_NETWORK %s priority" % _id))
+            except (TypeError, ValueError):
+                _priority = 0
+            # Escaped like in SCAN_RESULTS, keyed like the scan's SSIDs
+            _networks.append(SavedNetwork(
+                unescape_ssid(_ssid), _id, _priority,
+                time.time() if "[CURRENT]" in _flags else None,
+                "[DISABLED]" in _flags))
+        return _networks
+
+    def monitor(self, callback):
+        _monitor = WpaMonitor(callback, interface=self.interface,
+                              ctrl_dir=self.ctrl_dir)
+        _monitor.start()
+        return _monitor
+
+
+class NetworkManagerBackend(NetworkBackend):
+    """Manages the network through NetworkManager (Debian).
+
+    State is read over D-Bus when possible and with nmcli otherwise.
+    """
+
+    name = "NetworkManager"
+    config_path = NM_CONNECTIONS_DIR
+
+    def __init__(self, interface="wlan0", bus="SYSTEM"):
+        NetworkBackend.__init__(self, interface)
+        self.bus = bus
+        self._nm = NetworkManagerDBus(bus=bus)
+
+    def for_interface(self, interface):
+        return NetworkManagerBackend(interface, bus=self.bus)
+
+    def nm_query(self, query, *args):
+        """Reads a value through the NetworkManager D-Bus client.
+
+        Args:
+            query (type: function): a NetworkManagerDBus query method.
+            *args: the query arguments.
+
+        Returns:
+            type: The query result, False if NetworkManager couldn't be
+                reached over D-Bus and nmcli has to be used instead.
+
+        """
+        if not self._nm.available():
+            return False
+        try:
+            self._nm.open()
+            return query(*args)
+        except NetworkManagerError as error:
+            self.logger.debug("NetworkManager D-Bus query failed: %s", error)
+            self._nm.close()
+            return False
+
+    def request_scan(self):
+        _result = default_executor.run(
+            ["nmcli", "device", "wifi", "rescan", "ifname", self.interface])
+        return _result.ok
+
+    def scan_results(self):
+        _output = run_command(
+            ["nmcli", "-t", "-f", "BSSID,FREQ,SIGNAL,SECURITY,SSID", "device",
+             "wifi", "list", "ifname", self.interface, "--rescan", "no"])
+        if _output is None:
+            return []
+        return parse_nmcli_scan(_output.decode(encoding="UTF-8"))
+
+    def status(self, interface):
+        _ssid = self.nm_query(self._nm.active_connection, interface)
+        if _ssid is False:
+            _ssid = None
+            _output = run_command(
+                ["nmcli", "-t", "-f", "DEVICE,NAME", "connection", "show",
+                 "--active"])
+            # One line per active connection, on any device
+            for _line in (_output or b"").decode(encoding="UTF-8").split("\n"):
+                _device, _, _name = _line.partition(":")
+                if _device == interface and _name:
+                    _ssid = _name.replace("\\:", ":")
+                    break
+        return _ssid
+
+    def stats(self, interface):
+        _stats = self.link_stats(interface)
+        if _stats is not None:
+            return _stats
+        _wifiStrength = self.nm_query(self._nm.signal_strength, interface)
+        if _wifiStrength is False:
+            _wifiStrength = None
+            _output = run_command(
+                ["nmcli", "-t", "-f", "IN-USE,SIGNAL", "device", "wifi",
+                 "list", "ifname", interface, "--rescan", "no"])
+            # The access point in use is the line marked "*:<signal>"
+            for _line in (_output or b"").decode(encoding="UTF-8").split("\n"):
+                if _line.startswith("*:"):
+                    _wifiStrength = int(_line[2:])
+        return {"Quality": _wifiStrength}
+
+    def add_network(self, ssid, psk, existing=None):
+        """nmcli only returns once the connection is activated (associated
+            and addressed) or failed. On failure the profile it created is
+            deleted again, an existing profile gets its old password back.
+        """
+        if existing is not None:
+            return self._update_network(existing, psk)
+        _existing = [_line.split(":", 1)[0] for _line in self.list_networks()]
+        # Associating and getting an address can take a while
+        _result = default_executor.run(
+            ["nmcli", "device", "wifi", "connect", ssid, "password", psk,
+             "ifname", self.interface], timeout=60.0)
+        self.logger.info(_result.text().strip())
+        if _result.ok:
+            return ApplyResult(True, network_id=ssid)
+
+        if ssid not in _existing:
+            run_command(["nmcli", "connection", "delete", "id", ssid])
+        return ApplyResult(False, self._failure_reason(_result),
+                           detail=_result.text().strip())
+
+    def _update_network(self, existing, psk):
+        _old_psk = run_command(["nmcli", "-s", "-g",
+                                "802-11-wireless-security.psk", "connection",
+                                "show", existing.id])
+        _result = default_executor.run(
+            ["nmcli", "connection", "modify", existing.id,
+             "wifi-sec.key-mgmt", "wpa-psk", "wifi-sec.psk", psk])
+        if _result.ok:
+            _result = default_executor.run(
+                ["nmcli", "connection", "up", existing.id,
+                 "ifname", self.interface], timeout=60.0)
+        self.logger.info(_result.text().strip())
+        if _result.ok:
+            return ApplyResult(True, network_id=existing.id)
+
+        if _old_psk:
+            run_command(["nmcli", "connection", "modify", existing.id,
+                         "wifi-sec.psk", _old_psk.decode("UTF-8").strip()])
+        return ApplyResult(False, self._failure_reason(_result),
+                           detail=_result.text().strip())
+
+    @staticmethod
+    def _failure_reason(result):
+        if result.timed_out:
+            return "association-timeout"
+        if "Secrets were required" in result.text():
+            return "auth-failed"
+        return "activation-failed"
+
+    def select_network(self, network_id):
+        _output = run_command(["nmcli", "connection", "up", network_id],
+                              timeout=60.0)
+        return _output.decode(encoding="UTF-8") if _output is not None else None
+
+    def list_networks(self):
+        _output = run_command(["nmcli", "-t", "-f", "NAME,TYPE", "connection", "show"])
+        if _output is None:
+            return []
+        return _output.decode(encoding="UTF-8").split("\n")
+
+    def saved_networks(self):
+        # Profiles made by "nmcli device wifi connect" are named after the SSID
+        _output = run_command(
+            ["nmcli", "-t", "-f",
+             "TYPE,AUTOCONNECT,AUTOCONNECT-PRIORITY,TIMESTAMP,NAME",
+             "connection", "show"])
+        _networks = []
+        for _line in (_output or b"").decode(encoding="UTF-8").split("\n"):
+            _fields = _line.split(":", 4)
+            if len(_fields) != 5 or _fields[0] != "802-11-wireless":
+                continue
+            _, _autoconnect, _priority, _timestamp, _name = _fields
+            _name = _name.replace("\\:", ":")
+            try:
+                _priority = int(_priority)
+                _timestamp = int(_timestamp) or None
+            except ValueError:
+                _priority, _timestamp = 0, None
+            _networks.append(SavedNetwork(_name, _name, _priority, _timestamp,
+                                          _autoconnect == "no"))
+        return _networks
+
+
+class SimulatedBackend(NetworkBackend):
+    """Stands in for a real backend on development machines and unknown
+    systems, so the plugin keeps working instead of returning None.
+    """
+
+    name = "simulated"
+    instant_scan = True
+
+    # ssid, signal (dBm), frequency (MHz)
+    NETWORKS = [("Blocks", -48, 5180), ("Blocks", -55, 2412),
+                ("Workshop", -67, 2437)]
+
+    def __init__(self, interface="wlan0", networks=None):
+        NetworkBackend.__init__(self, interface)
+        self.networks = list(networks if networks is not None else self.NETWORKS)
+        self.saved = []
+        self.connected = None
+        self._hostname = socket.gethostname()
+
+    def for_interface(self, interface):
+        # Another radio in the same room sees the same networks
+        return SimulatedBackend(interface, networks=self.networks)
+
+    def request_scan(self):
+        return True
+
+    def scan_results(self):
+        _records = {}
+        for _ssid, _signal, _frequency in self.networks:
+            if _ssid in _records:
+                _records[_ssid].merge(None, _signal, _frequency, "WPA2")
+            else:
+                _records[_ssid] = ScanRecord(_ssid, None, _signal,
+                                             _frequency, "WPA2")
+        return sorted(_records.values(), key=lambda r: r.signal, reverse=True)
+
+    def status(self, interface):
+        return self.connected if interface == self.interface else None
+
+    def stats(self, interface):
+        return {"Quality": 70 if self.status(interface) else None}
+
+    def add_network(self, ssid, psk, existing=None):
+        if ssid not in self.saved:
+            self.saved.append(ssid)
+        self.connected = ssid
+        return ApplyResult(True, network_id=str(self.saved.index(ssid)))
+
+    def select_network(self, network_id):
+        self.connected = self.saved[int(network_id)]
+        return "OK"
+
+    def list_networks(self):
+        return ["%d\t%s" % (_id, _ssid) for _id, _ssid in enumerate(self.saved)]
+
+    def saved_networks(self):
+        return [SavedNetwork(_ssid, str(_id),
+                             last_connected=None if _ssid != self.connected
+                             else time.time())
+                for _id, _ssid in enumerate(self.saved)]
+
+    def hostname(self):
+        return self._hostname
+
+    def set_hostname(self, newHostname):
+        if newHostname.strip() == self._hostname:
+            return False
+        self._hostname = newHostname.strip()
+        return True
+
+
+def _wpa_interfaces(ctrl_dir):
+    try:
+        return sorted(_name for _name in os.listdir(ctrl_dir)
+                      if not _name.startswith("p2p-"))
+    except OSError:
+        return []
+
+
+def detect_backend(interface=None, os_release_path=OS_RELEASE_PATH,
+                   ctrl_dir=WPA_CTRL_DIR, nm_run_dir=NM_RUN_DIR):
+    """Picks the network backend for this system. Meant to run once, when
+    the plugin loads.
+
+    The running services decide: NetworkManager if it's running, else
+    wpa_supplicant if it has a control socket. When neither can be seen
+    (yet) os-release decides like it used to, Raspbian means
+    wpa_supplicant and Debian means NetworkManager. Anything else gets
+    the simulated backend.
+
+    Args:
+        interface (type: string): the wireless interface, found out if None.
+
+    Returns:
+        type: NetworkBackend.
+
+    """
+    _release = read_os_release(os_release_path)
+    _ids = [_release.get("ID", "")] + _release.get("ID_LIKE", "").split()
+    _wpa_ifaces = _wpa_interfaces(ctrl_dir)
+
+    if os.path.isdir(nm_run_dir):
+        _backend = NetworkManagerBackend
+    elif _wpa_ifaces:
+        _backend = WpaSupplicantBackend
+    elif "raspbian" in _ids:
+        _backend = WpaSupplicantBackend
+    elif "debian" in _ids:
+        _backend = NetworkManagerBackend
+    else:
+        _backend = SimulatedBackend
+
+    if interface is None:
+        interface = _wpa_ifaces[0] if _wpa_ifaces else "wlan0"
+    if _backend is WpaSupplicantBackend:
+        _result = _backend(interface, ctrl_dir=ctrl_dir)
+    else:
+        _result = _backend(interface)
+    _logger.info("Using the %s network backend on %s (%s)", _result.name,
+                 interface, _release.get("PRETTY_NAME", "unknown system"))
+    return _result
@@ -0,0 +1,180 @@
+# coding=utf-8
+import time
+import threading
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class CommandResult(object):
+    """What running a command produced.
+
+    Attributes:
+        argv (type: tuple): the command that ran.
+        returncode (type: int): exit status, None if it never ran.
+        output (type: bytes): stdout and stderr together.
+        duration (type: float): seconds the process was alive.
+        timed_out (type: boolean): killed because it ran past its timeout.
+        cancelled (type: boolean): killed by CommandExecutor.cancel().
+        error (type: string): why it couldn't be started, if it couldn't.
+
+    """
+
+    def __init__(self, argv, returncode=None, output=b"", duration=0.0,
+                 timed_out=False, cancelled=False, error=None):
+        self.argv = argv
+        self.returncode = returncode
+        self.output = output
+        self.duration = duration
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def text(self):
+        """Returns the output decoded as UTF-8."""
+        return self.output.decode("UTF-8", "replace")
+
+
+class CommandExecutor(object):
+    """Runs external commands off the calling thread, without a shell.
+
+    - every command gets a timeout, after which it is killed,
+    - at most `max_workers` commands run at once,
+    - a command that is already running isn't started again, callers
+      asking for the same argv share the result of the running one
+      ("singleflight"),
+    - forks, their total duration, timeouts and shared calls are counted
+      (see stats()).
+
+    Args:
+        max_workers (type: int): commands allowed to run concurrently.
+        timeout (type: float): default per command timeout in seconds.
+
+    """
+
+    def __init__(self, max_workers=2, timeout=10.0):
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix="BlocksCommand")
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._running = set()
+        self._cancelled = set()
+        self._stats = {"forks": 0, "fork_time": 0.0, "timeouts": 0,
+                       "cancelled": 0, "shared": 0, "failed": 0}
+        self.logger = logging.getLogger(__name__)
+
+    def submit(self, argv, timeout=None):
+        """Starts a command, or joins the identical one already running.
+
+        Args:
+            argv (type: list): the program and its arguments.
+            timeout (type: float): seconds before it's killed.
+
+        Returns:
+            type: Future. Resolves to a CommandResult.
+
+        """
+        _key = tuple(argv)
+        with self._lock:
+            _future = self._inflight.get(_key)
+            if _future is not None:
+                self._stats["shared"] += 1
+                return _future
+            _future = self._pool.submit(
+                self._execute, _key,
+                self.timeout if timeout is None else timeout)
+            self._inflight[_key] = _future
+        _future.add_done_callback(lambda done: self._forget(_key, done))
+        return _future
+
+    def run(self, argv, timeout=None):
+        """Runs a command and waits for it.
+
+        The wait is bounded too: when all workers are busy the caller gives
+        up after twice the timeout instead of queuing forever.
+
+        Returns:
+            type: CommandResult.
+
+        """
+        _timeout = self.timeout if timeout is None else timeout
+        try:
+            return self.submit(argv, _timeout).result(timeout=2 * _timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            return CommandResult(tuple(argv), timed_out=True,
+                                 error="waited too long for a free worker")
+
+    def cancel(self):
+        """Kills every command that is currently running."""
+        with self._lock:
+            _running = list(self._running)
+            self._cancelled.update(_running)
+        for _proc in _running:
+            _proc.kill()
+
+    def shutdown(self):
+        """Kills running commands and stops the workers."""
+        self.cancel()
+        self._pool.shutdown(wait=False)
+
+    def stats(self):
+        """Returns a copy of the counters.
+
+        Returns:
+            type: dict. forks, fork_time (seconds), timeouts, cancelled,
+                shared (calls served by an in-flight command) and failed
+                (commands that couldn't be started).
+
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _execute(self, argv, timeout):
+        _start = time.monotonic()
+        try:
+            _proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT)
+        except OSError as error:
+            with self._lock:
+                self._stats["failed"] += 1
+            self.logger.error("Can't run %s: %s", argv[0], error)
+            return CommandResult(argv, error=str(error))
+        with self._lock:
+            self._stats["forks"] += 1
+            self._running.add(_proc)
+        _timed_out = False
+        try:
+            _output, _ = _proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _proc.kill()
+            _output, _ = _proc.communicate()
+            _timed_out = True
+            self.logger.warning("%s killed after %.1f s", argv[0], timeout)
+        _duration = time.monotonic() - _start
+        with self._lock:
+            self._running.discard(_proc)
+            _cancelled = _proc in self._cancelled
+            self._cancelled.discard(_proc)
+            self._stats["fork_time"] += _duration
+            self._stats["timeouts"] += _timed_out
+            self._stats["cancelled"] += _cancelled
+        return CommandResult(argv, _proc.returncode, _output, _duration,
+                             timed_out=_timed_out, cancelled=_cancelled)
+
+
+# Shared by everything in the plugin so the limits apply to all of it
+default_executor = CommandExecutor()
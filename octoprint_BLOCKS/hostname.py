@@ -0,0 +1,172 @@
+# coding=utf-8
+import os
+import io
+import re
+import socket
+import tempfile
+import logging
+from .executor import default_executor
+
+HOST_LINE_ADDRESS = "127.0.1.1"
+
+# RFC 1123 host name label
+_HOSTNAME_PATTERN = re.compile(r"^(?!-)[A-Za-z0-9-]{1,63}(?<!-)$")
+
+
+class HostnameService(object):
+    """Changes the machine's hostname while it keeps running, no reboot.
+
+    /etc/hostname and the 127.0.1.1 line of /etc/hosts are rewritten
+    atomically (a temp file renamed over the old one), the kernel gets the
+    new name through hostnamectl (hostname where there's no systemd) and
+    avahi re-announces the machine under it, so <name>.local works right
+    away.
+
+    Args:
+        root (type: string): the filesystem root the files are under, a
+            fixture directory in tests. Defaults to "/".
+        run (type: callable): runs an argv list and returns a
+            CommandResult. Defaults to the shared executor.
+
+    """
+
+    def __init__(self, root="/", run=None):
+        self.root = root
+        self._run = run or default_executor.run
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def hostname_path(self):
+        return os.path.join(self.root, "etc", "hostname")
+
+    @property
+    def hosts_path(self):
+        return os.path.join(self.root, "etc", "hosts")
+
+    def current(self):
+        """Returns the configured hostname, the kernel's one if there's no
+            /etc/hostname.
+        """
+        try:
+            with io.open(self.hostname_path, "r", encoding="utf-8") as _fileHandle:
+                _name = _fileHandle.read().strip()
+            if _name:
+                return _name
+        except IOError:
+            pass
+        return socket.gethostname()
+
+    def change(self, newHostname):
+        """Sets the hostname if it's different from the current one.
+
+        Args:
+            newHostname (type: string): the new hostname.
+
+        Returns:
+            type: boolean. True if it was changed, False if it was already
+                set, isn't a valid hostname or couldn't be applied, the
+                files are left as they were then.
+
+        """
+        _name = newHostname.strip()
+        if not _HOSTNAME_PATTERN.match(_name):
+            self.logger.error("Not a valid hostname: %r", _name)
+            return False
+        if _name == self.current():
+            return False
+
+        # Put back if the name can't be applied, so the next change retries
+        _oldFiles = self._read_files()
+        try:
+            self._write_atomic(self.hostname_path, _name + "\n")
+            self._write_atomic(self.hosts_path, self._hosts_with(_name))
+        except (IOError, OSError) as error:
+            self.logger.error("Failed to update the hostname files: %s", error)
+            self._restore_files(_oldFiles)
+            return False
+
+        if not self._run(["sudo", "hostnamectl", "set-hostname", _name]).ok \
+                and not self._run(["sudo", "hostname", _name]).ok:
+            self.logger.error("Failed to set the hostname to %s", _name)
+            self._restore_files(_oldFiles)
+            return False
+        # Re-announces the host and its services under the new name
+        if not self._run(["sudo", "avahi-set-host-name", _name]).ok:
+            self.logger.warning("avahi didn't take the new hostname")
+        self.logger.info("Hostname changed to %s", _name)
+        return True
+
+    def _read_files(self):
+        """Returns {path: content} of both files, None for a missing one."""
+        _files = {}
+        for _path in (self.hostname_path, self.hosts_path):
+            try:
+                with io.open(_path, "r", encoding="utf-8") as _fileHandle:
+                    _files[_path] = _fileHandle.read()
+            except IOError:
+                _files[_path] = None
+        return _files
+
+    def _restore_files(self, files):
+        """Writes back what _read_files returned."""
+        for _path, _content in files.items():
+            try:
+                if _content is not None:
+                    self._write_atomic(_path, _content)
+                elif os.path.exists(_path):
+                    os.unlink(_path)
+            except (IOError, OSError) as error:
+                self.logger.error("Failed to restore %s: %s", _path, error)
+
+    def _hosts_with(self, name):
+        """Returns /etc/hosts with the 127.0.1.1 line pointing to name."""
+        _lines = []
+        try:
+            with io.open(self.hosts_path, "r", encoding="utf-8") as _fileHandle:
+                _lines = _fileHandle.read().splitlines()
+        except IOError as error:
+            self.logger.warning("Can't read %s: %s", self.hosts_path, error)
+        _hostLine = "%s\t%s" % (HOST_LINE_ADDRESS, name)
+        _newFile = [_hostLine if _line.split()[:1] == [HOST_LINE_ADDRESS]
+                    else _line for _line in _lines]
+        if _hostLine not in _newFile:
+            _newFile.append(_hostLine)
+        return "\n".join(_newFile) + "\n"
+
+    def _write_atomic(self, path, content):
+        """Replaces a file in one step, readers see the old or the new
+            content, never a mix.
+        """
+        _directory = os.path.dirname(path)
+        try:
+            _fd, _tmp = tempfile.mkstemp(dir=_directory, prefix=".blocks-")
+        except PermissionError:
+            self._write_privileged(path, content)
+            return
+        try:
+            with io.open(_fd, "w", encoding="utf-8") as _fileHandle:
+                _fileHandle.write(content)
+                _fileHandle.flush()
+                os.fsync(_fileHandle.fileno())
+            os.chmod(_tmp, 0o644)
+            os.replace(_tmp, path)
+        except BaseException:
+            os.unlink(_tmp)
+            raise
+
+    def _write_privileged(self, path, content):
+        """The plugin can't create files in /etc, stage the file next to
+            the target with sudo and rename it from there.
+        """
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8") as _fileHandle:
+            _fileHandle.write(content)
+            _fileHandle.flush()
+            _staged = os.path.join(os.path.dirname(path),
+                                   ".blocks-" + os.path.basename(path))
+            for _argv in (["sudo", "install", "-m", "644", _fileHandle.name,
+                           _staged],
+                          ["sudo", "mv", "-f", _staged, path]):
+                _result = self._run(_argv)
+                if not _result.ok:
+                    raise IOError("%s failed: %s" % (
+                        " ".join(_argv[:2]), _result.text().strip()))
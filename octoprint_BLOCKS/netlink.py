@@ -0,0 +1,282 @@
+# coding=utf-8
+import errno
+import select
+import socket
+import struct
+import threading
+import logging
+
+NETLINK_ROUTE = 0
+# Multicast groups
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+# Message types
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+
+# Interface flags
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+IFF_LOWER_UP = 0x10000
+
+# Attributes
+IFLA_IFNAME = 3
+IFLA_WIRELESS = 11
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTATTR = struct.Struct("=HH")
+# struct iw_event header: length, command
+_IW_EVENT = struct.Struct("=HH")
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+class LinkEvent(object):
+    """A change of an interface's link, carrier or IPv4 address.
+
+    Attributes:
+        kind (type: int): RTM_NEWLINK, RTM_DELLINK, RTM_NEWADDR or RTM_DELADDR.
+        index (type: int): interface index.
+        name (type: string): interface name, None if it isn't known.
+        up (type: boolean): administratively up (link messages).
+        carrier (type: boolean): the link has carrier (link messages).
+        address (type: string): the IPv4 address (address messages).
+        wireless (type: tuple): commands of the wireless extension events
+            the message carries, like SIOCGIWSCAN when a scan finished.
+
+    """
+
+    __slots__ = ("kind", "index", "name", "up", "carrier", "address",
+                 "wireless")
+
+    def __init__(self, kind, index, name=None, up=None, carrier=None,
+                 address=None, wireless=()):
+        self.kind = kind
+        self.index = index
+        self.name = name
+        self.up = up
+        self.carrier = carrier
+        self.address = address
+        self.wireless = wireless
+
+    def __repr__(self):
+        return "LinkEvent(%d, %s, up=%s, carrier=%s, address=%s)" % (
+            self.kind, self.name or self.index, self.up, self.carrier,
+            self.address)
+
+
+def _attributes(data, offset, end):
+    while offset + _RTATTR.size <= end:
+        _length, _type = _RTATTR.unpack_from(data, offset)
+        if _length < _RTATTR.size:
+            break
+        yield _type, data[offset + _RTATTR.size:offset + _length]
+        offset += _align(_length)
+
+
+def _wireless_events(data):
+    _commands = []
+    _offset = 0
+    while _offset + _IW_EVENT.size <= len(data):
+        _length, _command = _IW_EVENT.unpack_from(data, _offset)
+        if _length < _IW_EVENT.size:
+            break
+        _commands.append(_command)
+        _offset += _length
+    return tuple(_commands)
+
+
+def parse_messages(data):
+    """Parses the rtnetlink messages of one datagram.
+
+    Args:
+        data (type: bytes): what was read from the socket.
+
+    Returns:
+        type: List. LinkEvent objects, other messages are left out.
+
+    """
+    _events = []
+    _offset = 0
+    while _offset + _NLMSGHDR.size <= len(data):
+        _length, _type, _, _, _ = _NLMSGHDR.unpack_from(data, _offset)
+        if _length < _NLMSGHDR.size:
+            break
+        _body = _offset + _NLMSGHDR.size
+        _end = min(_offset + _length, len(data))
+        if _type in (RTM_NEWLINK, RTM_DELLINK):
+            _, _, _index, _flags, _ = _IFINFOMSG.unpack_from(data, _body)
+            _name = None
+            _wireless = ()
+            for _attr, _value in _attributes(data, _body + _IFINFOMSG.size,
+                                             _end):
+                if _attr == IFLA_IFNAME:
+                    _name = _value.rstrip(b"\0").decode("utf-8", "replace")
+                elif _attr == IFLA_WIRELESS:
+                    _wireless = _wireless_events(_value)
+            _events.append(LinkEvent(
+                _type, _index, _name, bool(_flags & IFF_UP),
+                _type == RTM_NEWLINK and bool(_flags & IFF_LOWER_UP),
+                wireless=_wireless))
+        elif _type in (RTM_NEWADDR, RTM_DELADDR):
+            _family, _, _, _, _index = _IFADDRMSG.unpack_from(data, _body)
+            _address = None
+            for _attr, _value in _attributes(data, _body + _IFADDRMSG.size,
+                                             _end):
+                # IFA_LOCAL is the interface's own address on p2p links
+                if _attr == IFA_LOCAL or (_attr == IFA_ADDRESS and
+                                          _address is None):
+                    if _family == socket.AF_INET and len(_value) == 4:
+                        _address = socket.inet_ntoa(_value)
+            _events.append(LinkEvent(_type, _index, address=_address))
+        _offset += _align(_length)
+    return _events
+
+
+class NetlinkSource(object):
+    """Reads rtnetlink link and IPv4 address notifications from the kernel.
+
+    LinkWatcher takes anything with the same open()/recv()/close() methods,
+    so it can be fed recorded messages instead.
+
+    """
+
+    def __init__(self, groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR):
+        self.groups = groups
+        self._sock = None
+
+    def open(self):
+        self._sock = socket.socket(socket.AF_NETLINK,
+                                   socket.SOCK_RAW | socket.SOCK_CLOEXEC,
+                                   NETLINK_ROUTE)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 18)
+        self._sock.bind((0, self.groups))
+
+    def recv(self, timeout):
+        """Returns the next datagram, None if nothing came within timeout.
+
+        Raises:
+            OSError: ENOBUFS when notifications were lost.
+
+        """
+        _readable, _, _ = select.select([self._sock], [], [], timeout)
+        if not _readable:
+            return None
+        return self._sock.recv(65536)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class LinkWatcher(threading.Thread):
+    """Calls callback(interface) as soon as an interface goes up or down,
+    gains or loses carrier, or gets or loses an IPv4 address.
+
+    Only changes are reported, repeated notifications of the same state
+    (the kernel sends plenty) are dropped. When notifications were lost
+    callback(None) asks for everything to be checked again.
+
+    Args:
+        callback (type: function): called with the interface name, on this
+            thread.
+        source (type: NetlinkSource): where the messages come from.
+            Defaults to the kernel.
+
+    """
+
+    def __init__(self, callback, source=None):
+        threading.Thread.__init__(self, name="BlocksLinkWatcher")
+        self.daemon = True
+        self.callback = callback
+        self.source = source if source is not None else NetlinkSource()
+        self._stop_event = threading.Event()
+        self._names = {}
+        self._links = {}
+        self._addresses = {}
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Opens the source and starts the thread.
+
+        Raises:
+            OSError: the netlink socket can't be opened.
+
+        """
+        self.source.open()
+        threading.Thread.start(self)
+
+    def stop(self):
+        """Stops watching, the thread ends within a second."""
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    _data = self.source.recv(1.0)
+                except OSError as error:
+                    if error.errno != errno.ENOBUFS:
+                        raise
+                    # The kernel dropped notifications, state is unknown
+                    self._links.clear()
+                    self._addresses.clear()
+                    self._notify(None)
+                    continue
+                if _data:
+                    for _event in parse_messages(_data):
+                        self._handle(_event)
+        except OSError as error:
+            self.logger.warning("Stopped watching links: %s", error)
+        finally:
+            self.source.close()
+
+    def _handle(self, event):
+        if event.name is not None:
+            self._names[event.index] = event.name
+        if event.kind == RTM_NEWLINK:
+            _state = (event.up, event.carrier)
+            _changed = self._links.get(event.index) != _state
+            self._links[event.index] = _state
+        elif event.kind == RTM_DELLINK:
+            _changed = True
+            self._links.pop(event.index, None)
+            self._addresses.pop(event.index, None)
+        elif event.kind == RTM_NEWADDR:
+            # Sent again on every DHCP renewal
+            _addresses = self._addresses.setdefault(event.index, set())
+            _changed = event.address not in _addresses
+            _addresses.add(event.address)
+        else:
+            _changed = True
+            self._addresses.get(event.index, set()).discard(event.address)
+        if _changed:
+            self._notify(self._interface_name(event.index))
+        if event.kind == RTM_DELLINK:
+            self._names.pop(event.index, None)
+
+    def _notify(self, interface):
+        try:
+            self.callback(interface)
+        except Exception:
+            self.logger.exception("Error handling a change of %s", interface)
+
+    def _interface_name(self, index):
+        if index not in self._names:
+            try:
+                self._names[index] = socket.if_indextoname(index)
+            except OSError:
+                return None
+        return self._names[index]
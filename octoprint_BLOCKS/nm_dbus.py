@@ -0,0 +1,223 @@
+# coding=utf-8
+import threading
+import logging
+
+try:
+    from jeepney import DBusAddress, HeaderFields, MatchRule, Properties
+    from jeepney import new_method_call
+    from jeepney.bus_messages import message_bus
+    from jeepney.wrappers import unwrap_msg, DBusErrorResponse
+    from jeepney.io.blocking import open_dbus_connection
+except ImportError:
+    open_dbus_connection = None
+
+NM_BUS_NAME = "org.freedesktop.NetworkManager"
+NM_PATH = "/org/freedesktop/NetworkManager"
+NM_IFACE = "org.freedesktop.NetworkManager"
+NM_DEVICE_IFACE = NM_IFACE + ".Device"
+NM_WIRELESS_IFACE = NM_IFACE + ".Device.Wireless"
+NM_AP_IFACE = NM_IFACE + ".AccessPoint"
+NM_ACTIVE_IFACE = NM_IFACE + ".Connection.Active"
+
+# NMDeviceState
+NM_DEVICE_STATE_ACTIVATED = 100
+
+
+class NetworkManagerError(Exception):
+    """Raised when NetworkManager can't be reached over D-Bus."""
+
+
+class NetworkManagerDBus(object):
+    """Reads NetworkManager's device, connection and access point state
+    from its D-Bus properties instead of running nmcli.
+
+    Properties are fetched once per object and kept in a cache that a
+    background thread updates from PropertiesChanged signals, so reading
+    the active connection or the signal strength doesn't talk to
+    NetworkManager at all while nothing changes.
+
+    Needs the optional jeepney package, see available().
+
+    Args:
+        bus (type: string): "SYSTEM", "SESSION" or a D-Bus address.
+            Defaults to the system bus.
+
+    """
+
+    def __init__(self, bus="SYSTEM"):
+        self.bus = bus
+        self._conn = None
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._devices = {}
+        self._listener = None
+        self._listener_conn = None
+        self._stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def available():
+        """Returns True when the D-Bus library is installed."""
+        return open_dbus_connection is not None
+
+    def open(self):
+        """Connects to the bus and starts following PropertiesChanged.
+
+        Raises:
+            NetworkManagerError: no D-Bus library or NetworkManager isn't there.
+
+        """
+        if self._conn is not None:
+            return
+        if not self.available():
+            raise NetworkManagerError("jeepney is not installed")
+        try:
+            self._conn = open_dbus_connection(bus=self.bus)
+            self._listener_conn = open_dbus_connection(bus=self.bus)
+            _rule = MatchRule(type="signal", member="PropertiesChanged",
+                              path_namespace=NM_PATH)
+            unwrap_msg(self._listener_conn.send_and_get_reply(
+                message_bus.AddMatch(_rule)))
+            # Fails here if NetworkManager isn't running
+            self._get_all(NM_PATH, NM_IFACE)
+        except (OSError, DBusErrorResponse) as error:
+            self.close()
+            raise NetworkManagerError(
+                "Can't reach NetworkManager: %s" % error)
+        # One per listener: a listener left over from an earlier
+        # connection must not see this one's flag
+        self._stop_event = threading.Event()
+        self._listener = threading.Thread(
+            target=self._listen,
+            args=(self._listener_conn, _rule, self._stop_event),
+            name="NetworkManagerDBus")
+        self._listener.daemon = True
+        self._listener.start()
+
+    def close(self):
+        """Stops the signal listener and closes the bus connections."""
+        self._stop_event.set()
+        for _conn in (self._conn, self._listener_conn):
+            if _conn is not None:
+                _conn.close()
+        self._conn = self._listener_conn = None
+        with self._lock:
+            self._cache.clear()
+            self._devices.clear()
+
+    # ~~ Queries
+
+    def device_path(self, interface):
+        """Returns the NetworkManager object path of an interface."""
+        with self._lock:
+            if interface not in self._devices:
+                _msg = new_method_call(
+                    DBusAddress(NM_PATH, NM_BUS_NAME, NM_IFACE),
+                    "GetDeviceByIpIface", "s", (interface,))
+                self._devices[interface] = self._call(_msg)[0]
+            return self._devices[interface]
+
+    def device_state(self, interface):
+        """Returns the NMDeviceState of an interface."""
+        return self._property(self.device_path(interface),
+                              NM_DEVICE_IFACE, "State")
+
+    def active_connection(self, interface):
+        """Returns the name of the connection active on an interface,
+            None if the interface isn't connected.
+        """
+        _path = self._property(self.device_path(interface),
+                               NM_DEVICE_IFACE, "ActiveConnection")
+        if not _path or _path == "/":
+            return None
+        return self._property(_path, NM_ACTIVE_IFACE, "Id")
+
+    def active_ssid(self, interface):
+        """Returns the SSID of the access point a wifi interface uses."""
+        _ap = self._active_access_point(interface)
+        if _ap is None:
+            return None
+        return bytes(self._property(_ap, NM_AP_IFACE, "Ssid")).decode(
+            "utf-8", "replace")
+
+    def signal_strength(self, interface):
+        """Returns the strength (0-100) of the access point a wifi
+            interface uses, None if it isn't associated.
+        """
+        _ap = self._active_access_point(interface)
+        if _ap is None:
+            return None
+        return self._property(_ap, NM_AP_IFACE, "Strength")
+
+    def _active_access_point(self, interface):
+        _ap = self._property(self.device_path(interface),
+                             NM_WIRELESS_IFACE, "ActiveAccessPoint")
+        if not _ap or _ap == "/":
+            return None
+        return _ap
+
+    # ~~ Property cache
+
+    def _property(self, path, interface, name):
+        with self._lock:
+            _props = self._cache.get((path, interface))
+            if _props is None:
+                _props = self._get_all(path, interface)
+            return _props.get(name)
+
+    def _get_all(self, path, interface):
+        _msg = Properties(DBusAddress(path, NM_BUS_NAME, interface)).get_all()
+        _props = {_name: _value for _name, (_sig, _value)
+                  in self._call(_msg)[0].items()}
+        with self._lock:
+            self._cache[(path, interface)] = _props
+        return _props
+
+    def _call(self, msg):
+        with self._lock:
+            if self._conn is None:
+                raise NetworkManagerError("Not connected")
+            try:
+                return unwrap_msg(self._conn.send_and_get_reply(msg, timeout=5))
+            except (OSError, TimeoutError, DBusErrorResponse) as error:
+                raise NetworkManagerError(str(error))
+
+    def _listen(self, conn, rule, stop_event):
+        with conn.filter(rule, bufsize=1024) as _queue:
+            while not stop_event.is_set():
+                try:
+                    _msg = conn.recv_until_filtered(_queue, timeout=1.0)
+                except TimeoutError:
+                    continue
+                except (OSError, ValueError):
+                    # Connection closed or NetworkManager went away
+                    break
+                self._on_properties_changed(_msg)
+        if not stop_event.is_set():
+            # Nothing keeps the cache up to date any more, make the next
+            # query fail so the caller reconnects
+            self.logger.debug("Lost the NetworkManager signal connection")
+            self.close()
+
+    def _on_properties_changed(self, msg):
+        _path = msg.header.fields[HeaderFields.path]
+        if len(msg.body) == 3:
+            # org.freedesktop.DBus.Properties.PropertiesChanged
+            _interface, _changed, _invalidated = msg.body
+        else:
+            # Older NetworkManager also emits its own per interface signal
+            _interface = msg.header.fields[HeaderFields.interface]
+            _changed, _invalidated = msg.body[0], []
+        with self._lock:
+            _props = self._cache.get((_path, _interface))
+            if _props is None:
+                # Not read yet, it'll be fetched when needed
+                return
+            if _invalidated:
+                del self._cache[(_path, _interface)]
+                return
+            for _name, (_sig, _value) in _changed.items():
+                _props[_name] = _value
+            if _path == NM_PATH and "Devices" in _changed:
+                # Interfaces came or went, look their paths up again
+                self._devices.clear()
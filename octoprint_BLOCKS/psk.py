@@ -0,0 +1,95 @@
+# coding=utf-8
+import hashlib
+import threading
+from collections import OrderedDict
+
+# IEEE 802.11i-2004 H.4: PSK = PBKDF2(HMAC-SHA1, passphrase, ssid, 4096, 256)
+PSK_ITERATIONS = 4096
+PSK_LENGTH = 32
+
+
+class PskCache(object):
+    """Derives WPA pre-shared keys in-process, the same as wpa_passphrase,
+    and remembers the last few so re-applying a network costs nothing.
+
+    Entries are keyed by the SSID and a SHA-256 of the passphrase, the
+    passphrase itself is never kept. The least recently used entry goes
+    when the cache is full.
+
+    802.11i test vectors (H.4.3), matching wpa_passphrase:
+        "password", "IEEE" ->
+            f42c6fc52df0ebef9ebb4b90b38a5f902e83fe1b135a70e23aed762e9710a12e
+        "ThisIsAPassword", "ThisIsASSID" ->
+            0dc0d6eb90555ed6419756b9a15ec3e3209b63df707dd508d14581f8982721af
+
+    Args:
+        size (type: int): number of keys kept.
+
+    """
+
+    def __init__(self, size=16):
+        self.size = size
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, ssid, passphrase):
+        """Returns the PSK of a network.
+
+        Args:
+            ssid (type: string): network name.
+            passphrase (type: string): 8 to 63 ASCII characters, or the PSK
+                itself as 64 hex digits.
+
+        Returns:
+            type: String. The PSK as 64 lowercase hex digits.
+
+        Raises:
+            ValueError: the passphrase isn't a valid WPA passphrase.
+
+        """
+        if len(passphrase) == 2 * PSK_LENGTH:
+            # Already a PSK
+            try:
+                return bytes.fromhex(passphrase).hex()
+            except ValueError:
+                pass
+        if not 8 <= len(passphrase) <= 63 or not passphrase.isascii():
+            raise ValueError("WPA passphrases are 8 to 63 ASCII characters")
+        _key = (ssid, hashlib.sha256(passphrase.encode("ascii")).digest())
+        with self._lock:
+            _psk = self._keys.get(_key)
+            if _psk is not None:
+                self._keys.move_to_end(_key)
+                self._stats["hits"] += 1
+                return _psk
+            self._stats["misses"] += 1
+        _psk = derive_psk(ssid, passphrase)
+        with self._lock:
+            self._keys[_key] = _psk
+            while len(self._keys) > self.size:
+                self._keys.popitem(last=False)
+        return _psk
+
+    def clear(self):
+        """Forgets every key."""
+        with self._lock:
+            self._keys.clear()
+
+    def stats(self):
+        """Returns a copy of the hit/miss counters."""
+        with self._lock:
+            return dict(self._stats)
+
+
+def derive_psk(ssid, passphrase):
+    """Returns the 256-bit PSK for an SSID and passphrase as hex, what
+    wpa_passphrase prints as psk=.
+    """
+    return hashlib.pbkdf2_hmac("sha1", passphrase.encode("ascii"),
+                               ssid.encode("utf-8"), PSK_ITERATIONS,
+                               PSK_LENGTH).hex()
+
+
+# Shared by every backend
+default_psk_cache = PskCache()
@@ -22,6 +22,7 @@
 
 import struct
 import array
+import heapq
 import math
 import errno
 import fcntl
@@ -29,15 +30,107 @@ import os
 import socket
 import time
 import re
-import sys
+import threading
 
 from . import flags as wififlags
+from . import layouts
+from . import nl80211
 
 KILO = 10 ** 3
 MEGA = 10 ** 6
 GIGA = 10 ** 9
 
 
+class IoctlChannel:
+    """A socket for wireless extension ioctls.
+
+    One channel is shared by every object of this module (default_channel),
+    instead of each of them opening its own socket and leaving it to the
+    garbage collector. The socket is opened on first use and stays open
+    until close(); using the channel again after that reopens it.
+
+    Safe to use from several threads: ioctls on one socket don't interfere
+    with each other, the lock only guards opening and closing.
+
+    >>> with IoctlChannel() as channel:
+    ...     wifi = Wireless('wlan0', channel)
+
+    """
+
+    def __init__(self):
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """ Opens the socket, if it isn't open. """
+        with self._lock:
+            if self._sock is None:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            return self._sock
+
+    def close(self):
+        """ Closes the socket. """
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    @property
+    def closed(self):
+        return self._sock is None
+
+    def ioctl(self, request, args):
+        """ Runs an ioctl on the socket. """
+        sock = self._sock or self.open()
+        return fcntl.ioctl(sock.fileno(), request, args)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Used by everything that isn't given a channel
+default_channel = IoctlChannel()
+
+# Used instead of the ioctls by Wireless and Iwscan, if the kernel has it
+default_nl80211 = nl80211.Nl80211()
+
+
+def _select_nl80211(netlink):
+    """Returns the Nl80211 to use, None for the wireless extensions.
+
+    netlink -- an Nl80211, None for default_nl80211, False for none.
+
+    """
+    if netlink is None:
+        netlink = default_nl80211
+    if netlink and netlink.available():
+        return netlink
+    return None
+
+
+def _quality_from_dbm(signal, quality=None):
+    """Returns an Iwquality for a signal in dBm, computed the way
+    cfg80211 does for its wireless extensions (quality out of 70).
+
+    quality -- an Iwquality to fill in instead of a new one.
+
+    """
+    if quality is None:
+        quality = Iwquality()
+    quality.siglevel = signal
+    quality.quality = min(max(signal, -110), -40) + 110
+    quality.updated = (
+        wififlags.IW_QUAL_LEVEL_UPDATED
+        | wififlags.IW_QUAL_QUAL_UPDATED
+        | wififlags.IW_QUAL_NOISE_INVALID
+        | wififlags.IW_QUAL_DBM
+    )
+    return quality
+
 
 def getNICnames():
     """Extract network device names from /proc/net/dev.
@@ -63,37 +156,17 @@ def getNICnames():
 
 
 def getWNICnames():
-    """Determine which interfaces in /proc/net/dev are wireless
+    """Determine which network interfaces are wireless.
     /proc/net/wireless is no longer usable for this purpose
     Returns empty list if no devices are present.
 
+    The answer is cached, see WirelessClassifier.
+
     >>> getWNICnames()
     ['eth1', 'wifi0']
 
     """
-    device = re.compile("[a-z]{2,}[a-z0-9]*:")
-    ifnames = []
-
-    fp = open("/proc/net/dev")
-    for line in fp:
-        try:
-            # append matching pattern, without the trailing colon
-            ifname = device.search(line).group()[:-1]
-            try:
-                # Check to see if there are wireless extensions
-                wifi = Wireless(ifname)
-                name = wifi.getWirelessName()
-            except OSError:
-                pass
-            else:
-                ifnames.append(ifname)
-        except AttributeError:
-            pass
-    # if we couldn't lookup the devices, try to ask the kernel
-    if not ifnames:
-        ifnames = getConfiguredWNICnames()
-
-    return ifnames
+    return wireless_interfaces.names()
 
 
 def getConfiguredWNICnames():
@@ -103,35 +176,100 @@ def getConfiguredWNICnames():
     []
 
     """
-    # Determine number of bytes in an ifreq structure
-    # This depends on whether we're on 32 or 64 bit
-    # Linux.
-    ifreq_bytes = 40 if sys.maxsize > 2 ** 32 else 32
+    # The number of bytes in an ifreq structure depends on whether
+    # we're on 32 or 64 bit Linux, layouts.IFREQ knows
     iwstruct = Iwstruct()
     ifnames = []
-    buff = array.array("B", b"\0" * 1000)
+    buff = array.array("B", bytes(layouts.IFREQ.size * 32))
     caddr_t, length = buff.buffer_info()
-    datastr = iwstruct.pack("iP", length, caddr_t)
+    datastr = layouts.IFCONF.pack(length, caddr_t)
     result = iwstruct._fcntl(wififlags.SIOCGIFCONF, datastr)
+    # the kernel says how much of the buffer it filled
+    length, caddr_t = layouts.IFCONF.unpack(result)
+    length -= length % layouts.IFREQ.size
     # get the interface names out of the buffer
-    for i in range(0, 1000 - ifreq_bytes, ifreq_bytes):
-        ifname = buff.tobytes()[i : i + ifreq_bytes]
-        ifname = struct.unpack(f"{ifreq_bytes}s", ifname)[0]
+    for (ifname,) in layouts.IFREQ.iter_unpack(memoryview(buff)[:length]):
         ifname = ifname.split(b"\0", 1)[0].decode("utf8")
-        if ifname:
+        if ifname and ifname not in ifnames:
             # verify if ifnames are really wifi devices
             wifi = Wireless(ifname)
             try:
-                result = wifi.getAPaddr()
+                wifi.getAPaddr()
             except OSError:
                 # don't stop on an individual error
-                pass
-            # print("{}: {}".format(ifname, result))
-            if result[0] != 0:
-                ifnames.append(ifname)
+                continue
+            ifnames.append(ifname)
     return ifnames
 
 
+class WirelessClassifier:
+    """Knows which network interfaces are wireless.
+
+    An interface is wireless when sysfs shows a wireless extension
+    (wireless/) or a cfg80211 device (phy80211) under it, which costs a
+    directory listing instead of an ioctl per interface. The answer is
+    kept until an interface comes or goes, which the owner reports with
+    link_changed() (e.g. from rtnetlink), or invalidate(). Without sysfs
+    the kernel is asked with SIOCGIFCONF, uncached.
+
+    """
+
+    MARKERS = ("wireless", "phy80211")
+
+    def __init__(self, sysfs="/sys/class/net"):
+        self.sysfs = sysfs
+        self._lock = threading.Lock()
+        self._all = None
+        self._wireless = None
+
+    def names(self):
+        """ Returns the names of the wireless interfaces, sorted. """
+        with self._lock:
+            if self._wireless is None:
+                try:
+                    interfaces = sorted(os.listdir(self.sysfs))
+                except OSError:
+                    return getConfiguredWNICnames()
+                self._all = frozenset(interfaces)
+                self._wireless = [
+                    ifname for ifname in interfaces if self._classify(ifname)
+                ]
+            return list(self._wireless)
+
+    def is_wireless(self, ifname):
+        return ifname in self.names()
+
+    def link_changed(self, ifname):
+        """Forgets the classification if ifname was added or removed.
+
+        ifname None means changes were missed, the classification is
+        dropped too.
+
+        """
+        with self._lock:
+            if self._all is None:
+                return
+            if ifname is None or (ifname in self._all) != os.path.isdir(
+                os.path.join(self.sysfs, ifname)
+            ):
+                self._all = self._wireless = None
+
+    def invalidate(self):
+        with self._lock:
+            self._all = self._wireless = None
+
+    def _classify(self, ifname):
+        path = os.path.join(self.sysfs, ifname)
+        return any(
+            os.path.exists(os.path.join(path, marker))
+            for marker in self.MARKERS
+        )
+
+
+# Used by getWNICnames
+wireless_interfaces = WirelessClassifier()
+
+
 def makedict(**kwargs):
     return kwargs
 
@@ -144,15 +282,24 @@ def hex2int(hexstring):
 class Wireless:
     """Provides high-level access to wireless interfaces.
 
-    This class uses WirelessInfo for most access.
+    This class uses WirelessInfo for most access. The access point,
+    bit rate, ESSID, frequency, statistics and scans come from nl80211
+    when the kernel has it (netlink), a few netlink messages instead of
+    an ioctl per value.
 
     """
 
-    def __init__(self, ifname):
-        self.sockfd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def __init__(self, ifname, channel=None, netlink=None):
         self.ifname = ifname
-        self.iwstruct = Iwstruct()
-        self.wireless_info = WirelessInfo(self.ifname)
+        self.channel = channel or default_channel
+        self.iwstruct = Iwstruct(self.channel)
+        self.wireless_info = WirelessInfo(self.ifname, self.channel)
+        self.nl80211 = _select_nl80211(netlink)
+        self._telemetry = None
+
+    def _station(self):
+        """ Returns the nl80211 station (the access point) or None. """
+        return self.nl80211.station(socket.if_nametoindex(self.ifname))
 
     def getAPaddr(self):
         """Returns the access point MAC address.
@@ -176,6 +323,14 @@ class Wireless:
         (19, 'No such device')
 
         """
+        if self.nl80211 is not None:
+            try:
+                station = self._station()
+            except OSError:
+                pass
+            else:
+                mac = station["mac"] if station else bytes(wififlags.ETH_ALEN)
+                return "%02X:%02X:%02X:%02X:%02X:%02X" % tuple(mac)
         return self.wireless_info.getAPaddr()
 
     def setAPaddr(self, addr):
@@ -224,6 +379,14 @@ class Wireless:
         '11 Mb/s'
 
         """
+        if self.nl80211 is not None:
+            try:
+                station = self._station()
+            except OSError:
+                pass
+            else:
+                if station and station["tx_bitrate"]:
+                    return self._formatBitrate(station["tx_bitrate"])
         iwparam = self.wireless_info.getBitrate()
         return self._formatBitrate(iwparam.value)
 
@@ -277,7 +440,7 @@ class Wireless:
          True
 
         """
-        iwrange = Iwrange(self.ifname)
+        iwrange = iwranges.get(self.ifname, self.channel)
         frequencies = []
         for freq in iwrange.frequencies:
             frequencies.append(self._formatFrequency(freq))
@@ -292,8 +455,21 @@ class Wireless:
         'romanofski'
 
         """
+        if self.nl80211 is not None:
+            try:
+                essid = self._nl80211Essid()
+            except OSError:
+                pass
+            else:
+                return essid.strip(b"\x00").decode("utf8", "replace")
         return self.wireless_info.getEssid()
 
+    def _nl80211Essid(self):
+        ifindex = socket.if_nametoindex(self.ifname)
+        # not connected when GET_INTERFACE has no SSID
+        ssid = self.nl80211.interface(ifindex)["ssid"]
+        return ssid if ssid is not None else b""
+
     def setEssid(self, essid):
         """Sets the ESSID.
 
@@ -450,7 +626,7 @@ class Wireless:
         [(1, '1234-5678-91'), (2, None), (3, 'ABCD-EFAB-CD'), (4, None)]
 
         """
-        iwrange = Iwrange(self.ifname)
+        iwrange = iwranges.get(self.ifname, self.channel)
         keys = []
         if iwrange.max_encoding_tokens > 0:
             for i in range(1, iwrange.max_encoding_tokens + 1):
@@ -484,6 +660,16 @@ class Wireless:
         '2.417 GHz'
 
         """
+        if self.nl80211 is not None:
+            try:
+                frequency = self.nl80211.interface(
+                    socket.if_nametoindex(self.ifname)
+                )["frequency"]
+            except OSError:
+                pass
+            else:
+                if frequency:
+                    return self._formatFrequency(frequency * MEGA)
         iwfreq = self.wireless_info.getFrequency()
         return self._formatFrequency(iwfreq.getFrequency())
 
@@ -494,7 +680,7 @@ class Wireless:
 
         """
         format = "lhBB"
-        iwstruct = Iwstruct()
+        iwstruct = self.iwstruct
         if freq == "auto":
             iwreq = iwstruct.pack(format, -1, 0, 0, wififlags.IW_FREQ_AUTO)
         else:
@@ -570,7 +756,7 @@ class Wireless:
         #'off'
 
         """
-        iwrange = Iwrange(self.ifname)
+        iwrange = iwranges.get(self.ifname, self.channel)
         iwparam = self.wireless_info.getPower()
         return (
             iwrange.pm_capa,
@@ -590,7 +776,7 @@ class Wireless:
         quality: 38 signal: 13 noise: 0
 
         """
-        iwrange = Iwrange(self.ifname)
+        iwrange = iwranges.get(self.ifname, self.channel)
         if iwrange.errorflag:
             return (iwrange.errorflag, iwrange.error)
         return iwrange.max_qual
@@ -605,7 +791,7 @@ class Wireless:
         quality: 38 signal: 13 noise: 0
 
         """
-        iwrange = Iwrange(self.ifname)
+        iwrange = iwranges.get(self.ifname, self.channel)
         if iwrange.errorflag:
             return (iwrange.errorflag, iwrange.error)
         return iwrange.avg_qual
@@ -694,14 +880,101 @@ class Wireless:
         /proc/net/wireless.
 
         """
-        iwstats = Iwstats(self.ifname)
+        if self.nl80211 is not None:
+            try:
+                station = self._station()
+            except OSError:
+                pass
+            else:
+                if station and station["signal"] is not None:
+                    discard = makedict(
+                        nwid=0, code=0, fragment=0,
+                        retries=station["tx_failed"] or 0,
+                        misc=station["rx_drop_misc"] or 0,
+                    )
+                    return [
+                        (0, 0), _quality_from_dbm(station["signal"]),
+                        discard, station["beacon_loss"] or 0,
+                    ]
+        iwstats = Iwstats(self.ifname, self.channel)
         if iwstats.errorflag > 0:
             return (iwstats.errorflag, iwstats.error)
         return [iwstats.status, iwstats.qual, iwstats.discard, iwstats.missed_beacon]
 
+    def snapshot(self, record=None):
+        """Reads the state of the link at once, into a LinkTelemetry.
+
+        nl80211 tells most of it in two messages. What it doesn't is read
+        with an ioctl per value on the shared channel, through buffers
+        the record allocated once. A value that can't be read is left
+        None, its OSError in record.errors; the others are still filled in.
+
+        record -- the LinkTelemetry to fill in, by default one kept by
+                  this object, so sampling again allocates nothing new.
+
+        >>> wifi = Wireless('wlan0')
+        >>> link = wifi.snapshot()
+        >>> link.bitrate, link.quality.siglevel, link.errors
+        (72200000, -52, {})
+
+        """
+        if record is None:
+            if self._telemetry is None:
+                self._telemetry = LinkTelemetry(self.ifname)
+            record = self._telemetry
+        record.clear()
+        done = ()
+        if self.nl80211 is not None:
+            try:
+                done = self._nl80211Snapshot(record)
+            except OSError:
+                # the ioctls may still work
+                pass
+        for reading in LinkTelemetry.READINGS:
+            if reading not in done:
+                record.read(self.channel, reading)
+        return record
+
+    def _nl80211Snapshot(self, record):
+        """ Fills in what nl80211 knows, returns the readings it did. """
+        ifindex = socket.if_nametoindex(self.ifname)
+        station = self.nl80211.station(ifindex)
+        interface = self.nl80211.interface(ifindex)
+        done = {"apaddr"}
+        mac = station["mac"] if station else bytes(wififlags.ETH_ALEN)
+        record.apaddr = "%02X:%02X:%02X:%02X:%02X:%02X" % tuple(mac)
+        if station and station["tx_bitrate"]:
+            record.bitrate = station["tx_bitrate"]
+            done.add("bitrate")
+        if station and station["signal"] is not None:
+            _quality_from_dbm(station["signal"], record.quality)
+            record.status = (0, 0)
+            record.discard.update(
+                nwid=0, code=0, fragment=0,
+                retries=station["tx_failed"] or 0,
+                misc=station["rx_drop_misc"] or 0,
+            )
+            record.missed_beacon = station["beacon_loss"] or 0
+            done.add("statistics")
+        if interface["ssid"] is not None:
+            record.essid = interface["ssid"].strip(b"\x00").decode(
+                "utf8", "replace"
+            )
+            done.add("essid")
+        if interface["frequency"]:
+            record.frequency = interface["frequency"] * MEGA
+            done.add("frequency")
+        if interface["txpower"] is not None:
+            # in mBm
+            record.txpower = interface["txpower"] // 100
+            done.add("txpower")
+        return done
+
     def scan(self):
         """ Returns Iwscanresult objects, after a successful scan. """
-        return Iwscan(self.ifname)
+        return Iwscan(
+            self.ifname, channel=self.channel, netlink=self.nl80211 or False
+        )
 
     def commit(self):
         """ Commit pending changes. """
@@ -709,6 +982,135 @@ class Wireless:
         return (status, result)
 
 
+class LinkTelemetry:
+    """The state of a link at one moment, filled in by Wireless.snapshot().
+
+    ifname -- the interface
+    time -- time.monotonic() of the snapshot
+    apaddr -- the access point MAC address, all zeros when not associated
+    essid -- the ESSID
+    bitrate -- the bit rate in bit/s
+    frequency -- the frequency in Hz (or the channel, depending on the
+                 driver)
+    txpower -- the transmit power in dBm
+    power -- True when power saving is on
+    quality, status, discard, missed_beacon -- the statistics, as
+                 Wireless.getStatistics() returns them
+    errors -- the OSError of each value that couldn't be read, by name;
+              the value is None (quality is all zeros)
+
+    The record is reused from one snapshot to the next: copy what has
+    to be kept.
+
+    """
+
+    __slots__ = (
+        "ifname", "time", "apaddr", "essid", "bitrate", "frequency",
+        "txpower", "power", "quality", "status", "discard", "missed_beacon",
+        "errors", "_ifreq", "_payload",
+    )
+
+    # the ioctl each reading is done with, statistics fill in four values
+    READINGS = {
+        "apaddr": wififlags.SIOCGIWAP,
+        "essid": wififlags.SIOCGIWESSID,
+        "bitrate": wififlags.SIOCGIWRATE,
+        "frequency": wififlags.SIOCGIWFREQ,
+        "txpower": wififlags.SIOCGIWTXPOW,
+        "power": wififlags.SIOCGIWPOWER,
+        "statistics": wififlags.SIOCGIWSTATS,
+    }
+    STATISTICS = ("quality", "status", "discard", "missed_beacon")
+    # cleared before each ioctl
+    _UNION = array.array("B", bytes(16))
+
+    def __init__(self, ifname):
+        self.ifname = ifname
+        name = ifname.encode("utf8")
+        # struct iwreq: the name, then a 16 byte union
+        self._ifreq = array.array(
+            "B", name + bytes(wififlags.IFNAMSIZE + 16 - len(name))
+        )
+        # the ESSID and the statistics are written behind a pointer
+        self._payload = array.array(
+            "B",
+            bytes(max(wififlags.IW_ESSID_MAX_SIZE + 1, layouts.IW_STATISTICS.size)),
+        )
+        self.quality = Iwquality()
+        self.discard = {}
+        self.errors = {}
+        self.clear()
+
+    def clear(self):
+        """ Forgets the values of the last snapshot. """
+        self.time = time.monotonic()
+        self.apaddr = None
+        self.essid = None
+        self.bitrate = None
+        self.frequency = None
+        self.txpower = None
+        self.power = None
+        self.quality.setValues([0, 0, 0, 0])
+        self.status = None
+        self.discard.clear()
+        self.missed_beacon = None
+        self.errors.clear()
+
+    def read(self, channel, reading):
+        """Reads one of READINGS with its ioctl. An OSError is kept in
+        errors instead of raised.
+
+        """
+        request = self.READINGS[reading]
+        ifreq = self._ifreq
+        offset = wififlags.IFNAMSIZE
+        ifreq[offset:] = self._UNION
+        if reading in ("essid", "statistics"):
+            address, length = self._payload.buffer_info()
+            layouts.IW_POINT.pack_into(ifreq, offset, address, length, 0)
+        try:
+            channel.ioctl(request, ifreq)
+        except OSError as error:
+            if reading == "statistics":
+                for name in self.STATISTICS:
+                    self.errors[name] = error
+            else:
+                self.errors[reading] = error
+            return
+        if reading == "apaddr":
+            self.apaddr = "%02X:%02X:%02X:%02X:%02X:%02X" % (
+                layouts.SOCKADDR_MAC.unpack_from(ifreq, offset)
+            )
+        elif reading == "essid":
+            length = layouts.IW_POINT.unpack_from(ifreq, offset)[1]
+            self.essid = (
+                self._payload[:length].tobytes().strip(b"\x00")
+                .decode("utf8", "replace")
+            )
+        elif reading == "frequency":
+            m, e, index, flags = layouts.IW_FREQ.unpack_from(ifreq, offset)
+            self.frequency = m * 10 ** e
+        elif reading == "statistics":
+            (
+                status, updated_status,
+                self.quality.quality, self.quality.siglevel,
+                self.quality.nlevel, self.quality.updated,
+                nwid, code, frag, retries, misc, self.missed_beacon,
+            ) = layouts.IW_STATISTICS.unpack_from(self._payload)
+            self.status = (status, updated_status)
+            self.discard.update(
+                nwid=nwid, code=code, fragment=frag, retries=retries, misc=misc
+            )
+        else:
+            value, fixed, disabled, flags = layouts.IW_PARAM.unpack_from(
+                ifreq, offset
+            )
+            if reading == "power":
+                self.power = not disabled
+            else:
+                setattr(self, reading, value)
+
+
 class WirelessConfig:
     """Low level access to wireless information on a device.  This class
     contains only those things absolutely needed to configure a card.
@@ -719,10 +1121,10 @@ class WirelessConfig:
 
     """
 
-    def __init__(self, ifname):
-        self.sockfd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def __init__(self, ifname, channel=None):
         self.ifname = ifname
-        self.iwstruct = Iwstruct()
+        self.channel = channel or default_channel
+        self.iwstruct = Iwstruct(self.channel)
         # self.nwid = Iwparam
         self.freq_flags = 0
 
@@ -820,7 +1222,7 @@ class WirelessConfig:
 
         """
         status, result = self.iwstruct.iw_get_ext(self.ifname, wififlags.SIOCGIWMODE)
-        return self.iwstruct.unpack("I", result[:4])[0]
+        return layouts.IW_MODE.unpack_from(result)[0]
 
 
 class WirelessInfo(WirelessConfig):
@@ -833,10 +1235,10 @@ class WirelessInfo(WirelessConfig):
 
     """
 
-    def __init__(self, ifname):
-        self.sockfd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def __init__(self, ifname, channel=None):
         self.ifname = ifname
-        self.iwstruct = Iwstruct()
+        self.channel = channel or default_channel
+        self.iwstruct = Iwstruct(self.channel)
 
         self.nickname = ""
         # Stats
@@ -849,7 +1251,7 @@ class WirelessInfo(WirelessConfig):
         self.has_auth_cipher_pairwise = 0
         self.auth_cipher_group = 0
         self.has_auth_cipher_group = 0
-        WirelessConfig.__init__(self, ifname)
+        WirelessConfig.__init__(self, ifname, channel)
 
     def getSensitivity(self):
         """Returns sensitivity information.
@@ -869,7 +1271,7 @@ class WirelessInfo(WirelessConfig):
         'off'
 
         """
-        return Iwparam(self.ifname, wififlags.SIOCGIWSENS)
+        return Iwparam(self.ifname, wififlags.SIOCGIWSENS, self.channel)
 
     def getAPaddr(self):
         """Returns the access point MAC address.
@@ -898,7 +1300,7 @@ class WirelessInfo(WirelessConfig):
             self.ifname, wififlags.SIOCGIWAP, data=datastr
         )
         # Extracts MAC address from packed data and returns it as a str.
-        mac_addr = struct.unpack("xxBBBBBB", result[:8])
+        mac_addr = layouts.SOCKADDR_MAC.unpack_from(result)
         return "%02X:%02X:%02X:%02X:%02X:%02X" % mac_addr
 
     def getBitrate(self):
@@ -910,7 +1312,7 @@ class WirelessInfo(WirelessConfig):
         '11 Mb/s'
 
         """
-        return Iwparam(self.ifname, wififlags.SIOCGIWRATE)
+        return Iwparam(self.ifname, wififlags.SIOCGIWRATE, self.channel)
 
     def getBitrates(self):
         """Returns the device's number and list of available bit rates.
@@ -918,7 +1320,7 @@ class WirelessInfo(WirelessConfig):
         The bit rates in the list are long integer type.
 
         """
-        iwrange = Iwrange(self.ifname)
+        iwrange = iwranges.get(self.ifname, self.channel)
         return (iwrange.num_bitrates, iwrange.bitrates)
 
     def getRTS(self):
@@ -930,7 +1332,7 @@ class WirelessInfo(WirelessConfig):
         'off'
 
         """
-        return Iwparam(self.ifname, wififlags.SIOCGIWRTS)
+        return Iwparam(self.ifname, wififlags.SIOCGIWRTS, self.channel)
 
     def getFragmentation(self):
         """Returns the fragmentation threshold.
@@ -941,7 +1343,7 @@ class WirelessInfo(WirelessConfig):
         'off'
 
         """
-        return Iwparam(self.ifname, wififlags.SIOCGIWFRAG)
+        return Iwparam(self.ifname, wififlags.SIOCGIWFRAG, self.channel)
 
     def getPower(self):
         """Returns the power management settings.
@@ -952,7 +1354,7 @@ class WirelessInfo(WirelessConfig):
         #'off'
 
         """
-        return Iwparam(self.ifname, wififlags.SIOCGIWPOWER)
+        return Iwparam(self.ifname, wififlags.SIOCGIWPOWER, self.channel)
 
     def getTXPower(self):
         """Returns the transmit power in dBm.
@@ -963,7 +1365,7 @@ class WirelessInfo(WirelessConfig):
         '17 dBm'
 
         """
-        return Iwparam(self.ifname, wififlags.SIOCGIWTXPOW)
+        return Iwparam(self.ifname, wififlags.SIOCGIWTXPOW, self.channel)
 
     def getRetry(self):
         """Returns the retry/lifetime limit.
@@ -978,24 +1380,23 @@ class WirelessInfo(WirelessConfig):
         16
 
         """
-        return Iwparam(self.ifname, wififlags.SIOCGIWRETRY)
+        return Iwparam(self.ifname, wififlags.SIOCGIWRETRY, self.channel)
 
 
 class Iwstruct:
-    """ The basic class to handle iwstruct data. """
+    """The basic class to handle iwstruct data.
 
-    def __init__(self):
-        self.idx = 0
-        self.sockfd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    Holds no parse state, the offset is passed in, so one instance can be
+    used by several threads at once.
 
-    def parse_data(self, fmt, data):
-        """ Unpacks raw C data. """
-        size = struct.calcsize(fmt)
-        idx = self.idx
+    """
+
+    def __init__(self, channel=None):
+        self.channel = channel or default_channel
 
-        datastr = data[idx : idx + size]
-        self.idx = idx + size
-        value = struct.unpack(fmt, datastr)
+    def parse_data(self, fmt, data, offset=0):
+        """ Unpacks raw C data found at offset. """
+        value = layouts.compiled(fmt).unpack_from(data, offset)
 
         # take care of a tuple like (int, )
         if len(value) == 1:
@@ -1005,7 +1406,7 @@ class Iwstruct:
 
     def pack(self, fmt, *args):
         """ Calls struct.pack and returns the result. """
-        return struct.pack(fmt, *args)
+        return layouts.compiled(fmt).pack(*args)
 
     def pack_wrq(self, buffsize):
         """ Packs wireless request data for sending it to the kernel. """
@@ -1016,7 +1417,7 @@ class Iwstruct:
         # Don't change the order how the structure is packed!!!
         buff = array.array("B", b"\0" * buffsize)
         caddr_t, length = buff.buffer_info()
-        datastr = struct.pack("Pi", caddr_t, length)
+        datastr = layouts.WRQ_BUFFER.pack(caddr_t, length)
         return buff, datastr
 
     def pack_test(self, string, buffsize):
@@ -1024,15 +1425,15 @@ class Iwstruct:
         buffsize = buffsize - len(string)
         buff = array.array("B", string.encode("utf-8") + b"\0" * buffsize)
         caddr_t, length = buff.buffer_info()
-        s = struct.pack("PHH", caddr_t, length, 1)
+        s = layouts.IW_POINT.pack(caddr_t, length, 1)
         return buff, s
 
     def unpack(self, fmt, packed_data):
         """ Unpacks data with given format. """
-        return struct.unpack(fmt, packed_data)
+        return layouts.compiled(fmt).unpack(packed_data)
 
     def _fcntl(self, request, args):
-        return fcntl.ioctl(self.sockfd.fileno(), request, args)
+        return self.channel.ioctl(request, args)
 
     def iw_get_ext(self, ifname, request, data=None):
         """ Read information from ifname. """
@@ -1062,11 +1463,12 @@ class Iwstruct:
 class Iwparam:
     """ Class to hold iwparam data. """
 
-    def __init__(self, ifname, ioctl):
+    def __init__(self, ifname, ioctl, channel=None):
         # (i) value, (b) fixed, (b) disabled, (H) flags
-        self.fmt = "ibbH"
+        self.fmt = layouts.IW_PARAM.format
         self.ifname = ifname
         self.ioctl = ioctl
+        self.channel = channel
         self.value = 0
         self.fixed = 0
         self.disabled = 0
@@ -1078,16 +1480,18 @@ class Iwparam:
         and updates internal attributes.
 
         """
-        iwstruct = Iwstruct()
+        iwstruct = Iwstruct(self.channel)
         status, result = iwstruct.iw_get_ext(self.ifname, self.ioctl)
         self._parse(result)
 
     def _parse(self, data):
         """ Unpacks iwparam data. """
-        iwstruct = Iwstruct()
-        self.value, self.fixed, self.disabled, self.flags = iwstruct.parse_data(
-            self.fmt, data
-        )
+        (
+            self.value,
+            self.fixed,
+            self.disabled,
+            self.flags,
+        ) = layouts.IW_PARAM.unpack_from(data)
 
 
 class Iwfreq:
@@ -1095,7 +1499,7 @@ class Iwfreq:
 
     def __init__(self, data=None):
         # (i) mantissa, (h) exponent, (b) list index, (b) flags
-        self.fmt = "ihbb"
+        self.fmt = layouts.IW_FREQ.format
         self.m = 0
         self.e = 0
         self.index = 0
@@ -1106,10 +1510,11 @@ class Iwfreq:
             else:
                 self.parse(data)
 
-    def parse(self, data):
+    def parse(self, data, offset=0):
         """ Unpacks iw_freq. """
-        size = struct.calcsize(self.fmt)
-        self.m, self.e, self.index, self.flags = struct.unpack(self.fmt, data[:size])
+        self.m, self.e, self.index, self.flags = layouts.IW_FREQ.unpack_from(
+            data, offset
+        )
 
     def getFrequency(self):
         """ Returns frequency or channel, depending on the driver. """
@@ -1118,6 +1523,16 @@ class Iwfreq:
         else:
             return self.m * 10 ** self.e
 
+    def getChannel(self, iwrange):
+        """Returns the channel number, looked up in the device's range
+        (an Iwrange). None if the range doesn't list the frequency.
+
+        """
+        if self.e == 0 and self.m < KILO:
+            # the driver gave the channel already
+            return self.m
+        return iwrange.channels.get(self.getFrequency())
+
     def setFrequency(self, value):
         """ Sets mantissa and exponent from given frequency (or channel). """
         if value % GIGA == 0:
@@ -1134,9 +1549,10 @@ class Iwfreq:
 class Iwstats:
     """ Class to hold iwstat data. """
 
-    def __init__(self, ifname):
+    def __init__(self, ifname, channel=None):
         # (2B) status, 4B iw_quality, 6i iw_discarded
-        self.fmt = "2BBbbB6i"
+        self.fmt = layouts.IW_STATISTICS.format
+        self.channel = channel
         self.status = 0
         self.qual = Iwquality()
         self.discard = {}
@@ -1151,7 +1567,7 @@ class Iwstats:
         and updates internal attributes.
 
         """
-        iwstruct = Iwstruct()
+        iwstruct = Iwstruct(self.channel)
         buff, s = iwstruct.pack_wrq(32)
         i, result = iwstruct.iw_get_ext(self.ifname, wififlags.SIOCGIWSTATS, data=s)
         if i > 0:
@@ -1161,9 +1577,7 @@ class Iwstats:
 
     def _parse(self, data):
         """ Unpacks iwstruct data. """
-        iwstruct = Iwstruct()
-        iwqual = Iwquality()
-        iwstats_data = iwstruct.parse_data(self.fmt, data)
+        iwstats_data = layouts.IW_STATISTICS.unpack_from(data)
 
         self.status = iwstats_data[0:2]
         (
@@ -1187,12 +1601,13 @@ class Iwquality:
         self.siglevel = 0
         self.nlevel = 0
         self.updated = 0
-        self.fmt = "BbbB"
+        self.fmt = layouts.IW_QUALITY.format
 
-    def parse(self, data):
+    def parse(self, data, offset=0):
         """ Unpacks iwquality data. """
-        iwstruct = Iwstruct()
-        qual, siglevel, nlevel, iwflags = iwstruct.parse_data(self.fmt, data)
+        qual, siglevel, nlevel, iwflags = layouts.IW_QUALITY.unpack_from(
+            data, offset
+        )
 
         # compute signal and noise level
         self.siglevel = siglevel
@@ -1239,37 +1654,28 @@ class Iwpoint:
         if data is None:
             raise ValueError("data must be passed to Iwpoint")
         # P pointer to data, H length, H flags
-        self.fmt = "PHH"
+        self.fmt = layouts.IW_POINT.format
         self.flags = flags
         self.buff = array.array("B", data)
         self.caddr_t, self.length = self.buff.buffer_info()
-        self.packed_data = struct.pack(self.fmt, self.caddr_t, self.length, self.flags)
+        self.packed_data = layouts.IW_POINT.pack(self.caddr_t, self.length, self.flags)
 
     def update(self, packed_data):
         """ Updates the object attributes. """
         self.packed_data = packed_data
-        self.caddr_t, self.length, self.flags = struct.unpack(
-            self.fmt, self.packed_data
+        self.caddr_t, self.length, self.flags = layouts.IW_POINT.unpack(
+            self.packed_data
         )
 
 
 class Iwrange:
     """ Holds iwrange struct. """
 
-    def __init__(self, ifname):
-        self.fmt = (
-            "IIIHB6Ii4B4BB"
-            + wififlags.IW_MAX_BITRATES * "i"
-            + "2i2i2i2i3H"
-            + wififlags.IW_MAX_ENCODING_SIZES * "H"
-            + "2BBHB"
-            + wififlags.IW_MAX_TXPOWER * "i"
-            + "2B3H2i2iHB"
-            + wififlags.IW_MAX_FREQUENCIES * "ihBB"
-            + "IiiHiI"
-        )
+    def __init__(self, ifname, channel=None):
+        self.fmt = layouts.IW_RANGE.format
 
         self.ifname = ifname
+        self.channel = channel
         self.errorflag = 0
         self.error = ""
 
@@ -1323,6 +1729,10 @@ class Iwrange:
         # frequency
         self.num_channels = self.num_frequency = 0
         self.frequencies = []
+        # frequency -> channel number
+        self.channels = {}
+        # multiplies a quality into percent, 0 if the driver has no maximum
+        self.quality_scale = 0
 
         # capabilities and power management
         self.enc_capa = 0
@@ -1337,7 +1747,7 @@ class Iwrange:
         and updates internal attributes.
 
         """
-        iwstruct = Iwstruct()
+        iwstruct = Iwstruct(self.channel)
         buff, s = iwstruct.pack_wrq(640)
         status, result = iwstruct.iw_get_ext(
             self.ifname, wififlags.SIOCGIWRANGE, data=s
@@ -1346,8 +1756,10 @@ class Iwrange:
         self._parse(data)
 
     def _parse(self, data):
-        iwstruct = Iwstruct()
-        result = iwstruct.parse_data(self.fmt, data)
+        result = layouts.IW_RANGE.unpack_from(data)
+        self.bitrates = []
+        self.frequencies = []
+        self.channels = {}
 
         # XXX there is maybe a much more elegant way to do this
         self.throughput, self.min_nwid, self.max_nwid = result[0:3]
@@ -1380,161 +1792,575 @@ class Iwrange:
         self.num_frequency = result[95]
 
         freq = result[96:224]
-        i = self.num_frequency
-        for x in range(0, len(freq), 4):
+        # only the first num_frequency entries are filled in
+        for x in range(0, min(4 * self.num_frequency, len(freq)), 4):
             iwfreq = Iwfreq(freq[x : x + 4])
             fq = iwfreq.getFrequency()
-            if fq is not None:
-                self.frequencies.append(fq)
-            i -= 1
-            if i <= 0:
-                break
+            self.frequencies.append(fq)
+            self.channels[fq] = iwfreq.index
         self.enc_capa = result[224]
         self.min_pms = result[225]
         self.max_pms = result[226]
         self.pms_flags = result[227]
         self.modul_capa = result[228]
         self.bitrate_capa = result[229]
+        if self.max_qual.quality:
+            self.quality_scale = 100.0 / self.max_qual.quality
+        else:
+            self.quality_scale = 0
+
+    def getQualityPercent(self, quality):
+        """Returns the link quality of an Iwquality in percent of the
+        driver's maximum, None if the driver has no maximum.
+
+        """
+        if not self.quality_scale:
+            return None
+        return min(100, int(quality.quality * self.quality_scale))
+
+
+class RangeCache:
+    """Keeps one Iwrange per interface.
+
+    The range data of a driver doesn't change while the interface exists,
+    so it is only asked for once instead of a SIOCGIWRANGE ioctl for every
+    scan and query. Entries are dropped by link_changed() when their
+    interface is gone or was created again, or by invalidate().
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ranges = {}
+
+    def get(self, ifname, channel=None):
+        """ Returns the Iwrange of an interface. """
+        with self._lock:
+            entry = self._ranges.get(ifname)
+        if entry is not None:
+            return entry[1]
+        iwrange = Iwrange(ifname, channel)
+        with self._lock:
+            self._ranges[ifname] = (self._index(ifname), iwrange)
+        return iwrange
+
+    def link_changed(self, ifname):
+        """Drops the entry of ifname if the interface disappeared.
+
+        ifname None means changes were missed, every entry is dropped.
+
+        """
+        with self._lock:
+            if ifname is None:
+                self._ranges.clear()
+            elif ifname in self._ranges:
+                index = self._index(ifname)
+                if index is None or index != self._ranges[ifname][0]:
+                    del self._ranges[ifname]
+
+    def invalidate(self, ifname=None):
+        """ Drops the entry of ifname, or all of them. """
+        with self._lock:
+            if ifname is None:
+                self._ranges.clear()
+            else:
+                self._ranges.pop(ifname, None)
+
+    @staticmethod
+    def _index(ifname):
+        try:
+            return socket.if_nametoindex(ifname)
+        except OSError:
+            return None
+
+
+# Used by everything asking for a device's range
+iwranges = RangeCache()
+
+
+class ScanBuffer:
+    """The buffer an interface's scan results are read into.
+
+    Reused from one scan to the next, so the kernel's event stream isn't
+    written into a freshly allocated and zero filled array every time.
+    The buffer is sized after the last scan that fit (plus headroom) and
+    only reallocated when a scan doesn't fit any more or the buffer has
+    become far larger than the scans.
+
+    Use it as a context manager, it is locked while a scan is read.
+
+    """
+
+    # Extra room kept over the last scan, for a few more cells next time
+    HEADROOM = 1.5
+    # iw_point.length is 16 bit
+    MAX_SIZE = 0xFFFF
+
+    def __init__(self, ifname, pool):
+        self.ifname = ifname
+        self.pool = pool
+        self.size = 0
+        self.buff = None
+        self.last_length = 0
+        self._lock = threading.Lock()
+        # struct iwreq: interface name, then the iw_point
+        self._ifreq = array.array(
+            "B", ifname.encode("utf-8").ljust(wififlags.IFNAMSIZE, b"\0")
+            + b"\0" * 16
+        )
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+    def fetch(self, channel):
+        """Reads the results of the most recent scan.
+
+        Returns the length of the data in the buffer. The buffer is grown
+        and the read repeated while the results don't fit, any other error
+        of the SIOCGIWSCAN ioctl (EAGAIN: the scan isn't done) is raised.
+
+        """
+        wanted = min(
+            max(wififlags.IW_SCAN_MAX_DATA,
+                int(self.last_length * self.HEADROOM)),
+            self.MAX_SIZE,
+        )
+        if self.size < wanted or self.size > 4 * wanted:
+            self._allocate(wanted)
+        while True:
+            caddr_t, length = self.buff.buffer_info()
+            layouts.IW_POINT.pack_into(
+                self._ifreq, wififlags.IFNAMSIZE, caddr_t, length, 0
+            )
+            try:
+                channel.ioctl(wififlags.SIOCGIWSCAN, self._ifreq)
+            except OSError as io_error:
+                if io_error.errno in (errno.E2BIG, errno.EAGAIN):
+                    self.pool.count("retries")
+                if io_error.errno != errno.E2BIG or self.size >= self.MAX_SIZE:
+                    raise
+                # the driver may have told us how big to make the buffer
+                pointer, needed, iwflags = layouts.IW_POINT.unpack_from(
+                    self._ifreq, wififlags.IFNAMSIZE
+                )
+                # with headroom, so the next scan of that size fits as is
+                self._allocate(min(max(int(needed * self.HEADROOM),
+                                       self.size * 2), self.MAX_SIZE))
+            else:
+                break
+        pointer, self.last_length, iwflags = layouts.IW_POINT.unpack_from(
+            self._ifreq, wififlags.IFNAMSIZE
+        )
+        return self.last_length
+
+    def data(self, length):
+        """ Returns a copy of the first length bytes. """
+        return memoryview(self.buff)[:length].tobytes()
+
+    def _allocate(self, size):
+        self.buff = array.array("B", bytes(size))
+        self.size = size
+        self.pool.count("reallocations")
+
+
+class ScanBufferPool:
+    """ Hands out one ScanBuffer per interface and counts their work. """
+
+    def __init__(self):
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._stats = {"scans": 0, "reallocations": 0, "retries": 0}
+
+    def get(self, ifname):
+        """ Returns the buffer of an interface. """
+        with self._lock:
+            buffer = self._buffers.get(ifname)
+            if buffer is None:
+                buffer = self._buffers[ifname] = ScanBuffer(ifname, self)
+            return buffer
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Returns a copy of the counters: scans read, buffer
+        (re)allocations and ioctl retries (E2BIG and EAGAIN).
+
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        """ Frees every buffer. """
+        with self._lock:
+            self._buffers.clear()
+
+
+# Used by every Iwscan
+scan_buffers = ScanBufferPool()
 
 
 class Iwscan:
     """ Class to handle AP scanning. """
 
-    def __init__(self, ifname, fullscan=True):
+    # Seconds getScan() waits for a driver to finish scanning
+    SCAN_TIMEOUT = 10.0
+
+    def __init__(self, ifname, fullscan=True, channel=None, netlink=None):
         """Completes a scan for available access points,
          and returns them in Iwscanresult format.
 
         fullscan: If False, data is read from a cache of the last scan
                   If True, a scan is conducted, and then the data is read
+        netlink: The Nl80211 to scan with, None picks it automatically,
+                 False uses the wireless extensions
 
         """
         self.ifname = ifname
-        self.range = Iwrange(ifname)
+        self.channel = channel
+        self.nl80211 = _select_nl80211(netlink)
+        self._events = None
+        try:
+            self.range = iwranges.get(ifname, channel)
+        except OSError:
+            # nl80211 drivers don't need to have wireless extensions
+            if self.nl80211 is None:
+                raise
+            self.range = None
         self.stream = None
-        self.aplist = None
-        self.index = -1
+        # BSSs of the last nl80211 scan, instead of a stream
+        self._bss = None
+        self._aplist = None
 
         if fullscan:
-            # Triggers the scan
-            iwstruct = Iwstruct()
-            datastr = iwstruct.pack("Pii", 0, 0, 0)
-            status, result = iwstruct.iw_set_ext(
-                self.ifname, wififlags.SIOCSIWSCAN, datastr
-            )
+            self.trigger()
             self.getScan()
 
     def __iter__(self):
-        return self
+        """Iterates over aplist, as many times as wanted. Empty until a
+        scan is read.
+
+        """
+        return iter(self.aplist or ())
 
     def __len__(self):
-        return len(self.aplist)
+        return len(self.aplist or ())
 
-    def __next__(self):
-        self.index = self.index + 1
-        if self.index > len(self.aplist) - 1:
-            raise StopIteration
-        return self.aplist[self.index]
+    @property
+    def aplist(self):
+        """The Iwscanresult objects of the last scan, parsed on first use.
+        None until a scan is read.
 
-    def getScan(self):
-        """Retrieves results, stored from the most recent scan."""
-        iwstruct = Iwstruct()
-        bufflen = wififlags.IW_SCAN_MAX_DATA
+        """
+        if self._aplist is None and (
+            self.stream is not None or self._bss is not None
+        ):
+            self._aplist = list(self.results())
+        return self._aplist
 
-        # Make repeated requests for scan with various recovery schemes
-        while True:
-            buff, datastr = iwstruct.pack_wrq(bufflen)
+    def results(self):
+        """Yields the Iwscanresult objects of the last scan one at a time,
+        parsing the stream as it goes, without keeping them.
+
+        Stopping early skips parsing the rest.
+
+        """
+        if self._aplist is not None:
+            yield from self._aplist
+        elif self._bss is not None:
+            for bss in self._bss:
+                yield Iwscanresult.fromBss(bss, self.range)
+        elif self.stream is not None:
+            yield from self._iterParse(self.stream)
+
+    def strongest(self, k, min_signal=None):
+        """Returns the k results of the last scan with the strongest
+        signal, strongest first.
+
+        Only k results are kept while the stream is parsed. Results
+        without a signal level in dBm come last; with min_signal (dBm)
+        they are left out, like those weaker than it.
+
+        """
+        heap = []
+        for seq, result in enumerate(self.results()):
+            signal = result.getSignal()
+            if signal is None:
+                if min_signal is not None:
+                    continue
+                signal = -math.inf
+            elif min_signal is not None and signal < min_signal:
+                continue
+            # first seen wins a tie, the result itself is never compared
+            entry = (signal, -seq, result)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif k > 0:
+                heapq.heappushpop(heap, entry)
+        return [result for signal, seq, result in sorted(heap, reverse=True)]
+
+    def trigger(self):
+        """ Starts a scan, without waiting for it. """
+        if self.nl80211 is not None:
+            ifindex = socket.if_nametoindex(self.ifname)
+            # subscribe first, the notification can't be missed
+            events = self.nl80211.scan_events()
             try:
-                status, result = iwstruct.iw_get_ext(
-                    self.ifname, wififlags.SIOCGIWSCAN, data=datastr
-                )
+                self.nl80211.trigger_scan(ifindex)
+            except OSError as error:
+                events.close()
+                if error.errno not in (errno.ENODEV, errno.EOPNOTSUPP):
+                    raise
+                # not a cfg80211 driver, ask the wireless extensions
+                self.nl80211 = None
+            else:
+                self._events = events
+                return
+        iwstruct = Iwstruct(self.channel)
+        datastr = layouts.SCAN_REQUEST.pack(0, 0, 0)
+        status, result = iwstruct.iw_set_ext(
+            self.ifname, wififlags.SIOCSIWSCAN, datastr
+        )
+
+    def poll(self):
+        """Reads the results if the scan is done, without waiting.
+
+        Returns True when the results can be read (aplist, results()),
+        False while the driver is still scanning (EAGAIN).
+
+        """
+        if self.nl80211 is not None:
+            return self._pollNl80211()
+        channel = self.channel or default_channel
+        with scan_buffers.get(self.ifname) as buffer:
+            try:
+                reslen = buffer.fetch(channel)
             except OSError as io_error:
-                if io_error.errno == errno.E2BIG:
-                    # Keep resizing the buffer until it's
-                    #   large enough to hold the scan
-                    pbuff, newlen = iwstruct.unpack("Pi", datastr)
-                    if bufflen < newlen:
-                        # the driver told us how big to make the buffer
-                        bufflen = newlen
-                    else:
-                        # try doubling the buffer size
-                        bufflen = bufflen * 2
-                elif io_error.errno == errno.EAGAIN:
+                if io_error.errno == errno.EAGAIN:
                     # Permission was NOT denied,
                     #   therefore we must WAIT to get results
-                    time.sleep(0.1)
-                else:
-                    raise
-            except BaseException:
+                    return False
                 raise
-            else:
-                break
+            data = buffer.data(reslen)
+        scan_buffers.count("scans")
 
-        # unpack the buffer pointer and length
-        pbuff, reslen = iwstruct.unpack("Pi", datastr)
         if reslen > 0:
-            # Initialize the stream, and turn it into an enumerator
-            self.aplist = self._parse(buff.tobytes())
+            # Keep the stream, results are parsed from it when needed
+            self.stream = data
+            self._bss = None
+            self._aplist = None
+        elif self.stream is None and self._bss is None:
+            self.stream = b""
+        return True
+
+    def _pollNl80211(self):
+        ifindex = socket.if_nametoindex(self.ifname)
+        if self._events is not None:
+            if self._events.wait(ifindex, 0) is None:
+                return False
+            # done or aborted, the results found so far are kept either way
+            self._events.close()
+            self._events = None
+        self._bss = self.nl80211.scan_results(ifindex)
+        self.stream = None
+        self._aplist = None
+        return True
+
+    def getScan(self, timeout=None):
+        """Retrieves results, stored from the most recent scan.
+
+        Waits up to timeout seconds (SCAN_TIMEOUT by default) for a scan
+        in progress, then raises OSError(ETIMEDOUT).
+
+        """
+        if timeout is None:
+            timeout = self.SCAN_TIMEOUT
+        deadline = time.monotonic() + timeout
+        while not self.poll():
+            if time.monotonic() >= deadline:
+                raise OSError(
+                    errno.ETIMEDOUT, "scan on %s did not finish" % self.ifname
+                )
+            time.sleep(0.1)
 
     def _parse(self, data):
-        """Parse the event stream, and return a list of Iwscanresult
-        objects.
+        """ Parse the event stream, and return a list of Iwscanresult objects. """
+        self.stream = data
+        return list(self._iterParse(data))
+
+    def _iterParse(self, data):
+        """Yields the Iwscanresult objects of an event stream.
+
+        Only the event headers are read here, to find where each access
+        point's events start and end. The results keep that span of the
+        stream and decode their fields from it when they are first used.
 
         """
-        iwstruct = Iwstruct()
-        scanresult = None
-        aplist = []
+        end = len(data)
+        header = layouts.IW_EVENT_HEADER
+        header_len = wififlags.IW_EV_LCP_PK_LEN
+        handlers = Iwscanresult._handlers
+        offset = 0
+        start = None
 
         # Run through the stream until it is too short to contain a command
-        while len(data) >= wififlags.IW_EV_LCP_PK_LEN:
+        while offset + header_len <= end:
             # Unpack the header
-            length, cmd = iwstruct.unpack("HH", data[: wififlags.IW_EV_LCP_PK_LEN])
+            length, cmd = header.unpack_from(data, offset)
             # If the event length is too short to contain valid data,
             # then break, because we're probably at the end of the cell's data
-            if length < wififlags.IW_EV_LCP_PK_LEN:
+            if length < header_len:
                 break
-            # Put the events into their respective result data
+            # Each access point's events start with its address
             if cmd == wififlags.SIOCGIWAP:
-                if scanresult:
-                    aplist.append(scanresult)
-                scanresult = Iwscanresult(
-                    data[wififlags.IW_EV_LCP_PK_LEN : length], self.range
-                )
-            elif scanresult is None:
+                if start is not None:
+                    yield Iwscanresult(self.range, data, (start, offset))
+                start = offset
+            elif start is None:
                 raise RuntimeError("Attempting to add an event without AP data.")
-            else:
-                scanresult.addEvent(cmd, data[wififlags.IW_EV_LCP_PK_LEN : length])
+            elif cmd not in handlers:
+                Iwscanresult.unknownEvent(cmd)
             # We're finished with the previous event
-            data = data[length:]
+            offset += length
 
-        # Don't forget the final result
-        if scanresult:
+        # Don't forget the final result, unless the stream ends inside
+        # its address
+        if start is not None and (
+            start + header_len + layouts.SOCKADDR_MAC.size <= end
+        ):
+            scanresult = Iwscanresult(self.range, data, (start, min(offset, end)))
             if scanresult.bssid != "00:00:00:00:00:00":
-                aplist.append(scanresult)
+                yield scanresult
             else:
                 raise RuntimeError("Attempting to add an AP without a bssid")
-        return aplist
 
 
 class Iwscanresult:
     """An object to contain all the events associated with a single
     scanned AP.
 
+    A result only holds the span of its events in the scan stream. The
+    address, ESSID, quality, mode, frequency, encoding and protocol are
+    decoded together on first access; rates, custom events and the
+    information elements (wpa) each only when asked for.
+
     """
 
-    def __init__(self, data, iwrange):
-        """ Initialize the scan result with the access point data. """
+    __slots__ = (
+        "range", "span", "_stream",
+        "bssid", "essid", "mode", "rate", "quality", "frequency", "encode",
+        "custom", "protocol", "wpa",
+    )
+
+    def __init__(self, iwrange, stream=None, span=None):
+        """Initialize the scan result.
+
+        stream: the scan's event stream, None for a result filled in by hand
+        span: (start, end) of the events in the stream, the first is the
+              access point address
+
+        """
         self.range = iwrange
-        self.bssid = "%02X:%02X:%02X:%02X:%02X:%02X" % (
-            struct.unpack("BBBBBB", data[2:8])
+        self._stream = stream
+        self.span = span
+
+    def __getattr__(self, name):
+        # Only called for fields not decoded yet
+        if name == "bssid":
+            self.bssid = "%02X:%02X:%02X:%02X:%02X:%02X" % (
+                layouts.SOCKADDR_MAC.unpack_from(
+                    self._stream, self.span[0] + wififlags.IW_EV_LCP_PK_LEN
+                )
+            )
+            return self.bssid
+        group = self._groups.get(name)
+        if group is None:
+            raise AttributeError(name)
+        self._decode(*group)
+        return object.__getattribute__(self, name)
+
+    def _decode(self, names, commands):
+        """ Decodes the events of the given commands into the named fields. """
+        kept = set()
+        for name in names:
+            try:
+                object.__getattribute__(self, name)
+            except AttributeError:
+                factory = self._defaults.get(name)
+                setattr(self, name, factory() if factory else None)
+            else:
+                kept.add(name)
+        if self._stream is None:
+            return
+        if kept:
+            # fields set by hand are left alone, their events skipped
+            commands = frozenset(
+                cmd for cmd in commands if self._fields[cmd] not in kept
+            )
+            if not commands:
+                return
+        data = memoryview(self._stream)
+        header = layouts.IW_EVENT_HEADER
+        header_len = wififlags.IW_EV_LCP_PK_LEN
+        handlers = self._handlers
+        offset, end = self.span
+        while offset + header_len <= end:
+            length, cmd = header.unpack_from(data, offset)
+            # an event cut off by the end of the stream is left out
+            if length < header_len or offset + length > end:
+                break
+            if cmd in commands:
+                handlers[cmd](self, data[offset + header_len : offset + length])
+            offset += length
+
+    @classmethod
+    def fromBss(cls, bss, iwrange):
+        """ Builds a scan result from a BSS of Nl80211.scan_results. """
+        result = cls(iwrange)
+        result.bssid = "%02X:%02X:%02X:%02X:%02X:%02X" % (
+            layouts.MAC.unpack_from(bss["bssid"])
         )
-        self.essid = None
-        self.mode = None
-        self.rate = []
-        self.quality = Iwquality()
-        self.frequency = None
-        self.encode = None
-        self.custom = []
-        self.protocol = None
+        rates = []
+        for eid, payload in nl80211.elements(bss["ies"]):
+            if eid == nl80211.WLAN_EID_SSID and result.essid is None:
+                result.essid = bytes(payload)
+            elif eid in (
+                nl80211.WLAN_EID_SUPP_RATES, nl80211.WLAN_EID_EXT_SUPP_RATES
+            ):
+                # in 500 kbit/s, the top bit marks basic rates
+                rates.extend((rate & 0x7F) * 500000 for rate in payload)
+        if rates:
+            result.rate.append(rates)
+        capability = bss["capability"]
+        if capability & nl80211.WLAN_CAPABILITY_IBSS:
+            result.mode = wififlags.modes[1]
+        elif capability & nl80211.WLAN_CAPABILITY_ESS:
+            result.mode = wififlags.modes[3]
+        if bss["frequency"]:
+            result.frequency = Iwfreq((bss["frequency"], 6, 0, 0))
+        if bss["signal"] is not None:
+            if bss["signal_dbm"]:
+                result.quality = _quality_from_dbm(bss["signal"])
+            else:
+                result.quality.quality = bss["signal"]
+                result.quality.updated = (
+                    wififlags.IW_QUAL_QUAL_UPDATED
+                    | wififlags.IW_QUAL_LEVEL_INVALID
+                    | wififlags.IW_QUAL_NOISE_INVALID
+                )
+        if capability & nl80211.WLAN_CAPABILITY_PRIVACY:
+            flags = wififlags.IW_ENCODE_ENABLED | wififlags.IW_ENCODE_NOKEY
+        else:
+            flags = wififlags.IW_ENCODE_DISABLED
+        result.encode = Iwpoint(b"", flags)
+        # the event payload starts with the iw_point length and flags
+        result._addGenie(b"\0" * 4 + bss["ies"])
+        return result
 
     def addEvent(self, cmd, data):
         """Attempts to add the data from an event to a scanresult.
@@ -1543,78 +2369,157 @@ class Iwscanresult:
         If the data is valid but unused, False is returned
 
         """
-        if (cmd in range(wififlags.SIOCIWFIRST, wififlags.SIOCIWLAST + 1)) or (
-            cmd in range(wififlags.IWEVFIRST, wififlags.IWEVLAST + 1)
+        handler = self._handlers.get(cmd)
+        if handler is not None:
+            handler(self, data)
+        else:
+            self.unknownEvent(cmd)
+
+    @staticmethod
+    def unknownEvent(cmd):
+        """ Raises ValueError for an event command results can't hold. """
+        if (wififlags.SIOCIWFIRST <= cmd <= wififlags.SIOCIWLAST) or (
+            wififlags.IWEVFIRST <= cmd <= wififlags.IWEVLAST
         ):
-            if cmd == wififlags.SIOCGIWNWID:
-                pass
-            elif cmd == wififlags.SIOCGIWFREQ:
-                self.frequency = Iwfreq(data)
-            elif cmd == wififlags.SIOCGIWMODE:
-                raw_mode = struct.unpack("I", data[:4])[0]
-                self.mode = wififlags.modes[raw_mode]
-            elif cmd == wififlags.SIOCGIWNAME:
-                self.protocol = data[: len(data) - 2]
-            elif cmd == wififlags.SIOCGIWESSID:
-                self.essid = data[4:]
-            elif cmd == wififlags.SIOCGIWENCODE:
-                data = struct.unpack("B" * len(data), data)
-                self.encode = Iwpoint([])
-                self.encode.update(
-                    struct.pack(
-                        "PHH",
-                        (int(data[0]) << 16) + int(data[1]),
-                        data[2] << 8,
-                        data[3] << 8,
-                    )
-                )
-                if self.encode.caddr_t is None:
-                    self.encode.flags = self.encode.flags | wififlags.IW_ENCODE_NOKEY
-            elif cmd == wififlags.SIOCGIWRATE:
-                freqsize = struct.calcsize("ihbb")
-                rates = []
-                while len(data) >= freqsize:
-                    m, e, dummy, pad = struct.unpack("ihbb", data[:freqsize])
-                    if e == 0:
-                        rates.append(m)
-                    else:
-                        rates.append(m * 10 ** e)
-                    data = data[freqsize:]
-                self.rate.append(rates)
-            elif cmd == wififlags.SIOCGIWMODUL:
-                pass
-            elif cmd == wififlags.IWEVQUAL:
-                self.quality.parse(data)
-            elif cmd == wififlags.IWEVGENIE:
-                wpa1_oui = b"\x00\x50\xf2"
-                offset = 4  # skip the request code
-                while offset < len(data) - 2:
-                    ielen = data[offset + 1]
-                    if data[offset] == 0x30 and ielen > 4:
-                        self.wpa = 2
-                        break
-                    elif (
-                        data[offset] == 0xDD
-                        and ielen > 8
-                        and data[offset + 2 : offset + 5] == wpa1_oui
-                    ):
-                        self.wpa = 1
-                        break
-                    offset = offset + ielen + 2
-            elif cmd == wififlags.IWEVCUSTOM:
-                self.custom.append(data[1:])
-            else:
-                raise ValueError(
-                    "Unknown IW event command received. This "
-                    + "command cannot be used to add information "
-                    + "to the WiFi cell's profile."
-                )
+            raise ValueError(
+                "Unknown IW event command received. This "
+                + "command cannot be used to add information "
+                + "to the WiFi cell's profile."
+            )
         else:
             raise ValueError(
                 "Invalid IW event command received.  \
                               This command is not allowed."
             )
 
+    def getChannel(self):
+        """ Returns the channel number, None if it isn't known. """
+        if self.frequency is None or self.range is None:
+            return None
+        return self.frequency.getChannel(self.range)
+
+    def getSignal(self):
+        """ Returns the signal level in dBm, None if it isn't known. """
+        quality = self.quality
+        if quality.updated & wififlags.IW_QUAL_LEVEL_INVALID or not (
+            quality.updated & wififlags.IW_QUAL_DBM
+        ):
+            return None
+        return quality.siglevel
+
+    def getQualityPercent(self):
+        """ Returns the link quality in percent, None if it isn't known. """
+        if self.range is None:
+            return None
+        return self.range.getQualityPercent(self.quality)
+
+    def _ignore(self, data):
+        pass
+
+    def _addFrequency(self, data):
+        self.frequency = Iwfreq(data)
+
+    def _addMode(self, data):
+        raw_mode = layouts.IW_MODE.unpack_from(data)[0]
+        self.mode = wififlags.modes[raw_mode]
+
+    def _addProtocol(self, data):
+        self.protocol = bytes(data[: len(data) - 2])
+
+    def _addEssid(self, data):
+        self.essid = bytes(data[4:])
+
+    def _addEncode(self, data):
+        self.encode = Iwpoint([])
+        self.encode.update(
+            layouts.IW_POINT.pack(
+                (int(data[0]) << 16) + int(data[1]),
+                data[2] << 8,
+                data[3] << 8,
+            )
+        )
+        if self.encode.caddr_t is None:
+            self.encode.flags = self.encode.flags | wififlags.IW_ENCODE_NOKEY
+
+    def _addRate(self, data):
+        freqsize = layouts.IW_FREQ.size
+        rates = []
+        for offset in range(0, len(data) - freqsize + 1, freqsize):
+            m, e, dummy, pad = layouts.IW_FREQ.unpack_from(data, offset)
+            if e == 0:
+                rates.append(m)
+            else:
+                rates.append(m * 10 ** e)
+        self.rate.append(rates)
+
+    def _addQuality(self, data):
+        self.quality.parse(data)
+
+    def _addGenie(self, data):
+        wpa1_oui = b"\x00\x50\xf2"
+        offset = 4  # skip the request code
+        while offset < len(data) - 2:
+            ielen = data[offset + 1]
+            if data[offset] == 0x30 and ielen > 4:
+                self.wpa = 2
+                break
+            elif (
+                data[offset] == 0xDD
+                and ielen > 8
+                and data[offset + 2 : offset + 5] == wpa1_oui
+            ):
+                self.wpa = 1
+                break
+            offset = offset + ielen + 2
+
+    def _addCustom(self, data):
+        # an iw_point event, the text follows its length and flags
+        self.custom.append(bytes(data[4:]))
+
+    # event command -> handler, looked up once per event
+    _handlers = {
+        wififlags.SIOCGIWNWID: _ignore,
+        wififlags.SIOCGIWFREQ: _addFrequency,
+        wififlags.SIOCGIWMODE: _addMode,
+        wififlags.SIOCGIWNAME: _addProtocol,
+        wififlags.SIOCGIWESSID: _addEssid,
+        wififlags.SIOCGIWENCODE: _addEncode,
+        wififlags.SIOCGIWRATE: _addRate,
+        wififlags.SIOCGIWMODUL: _ignore,
+        wififlags.IWEVQUAL: _addQuality,
+        wififlags.IWEVGENIE: _addGenie,
+        wififlags.IWEVCUSTOM: _addCustom,
+    }
+
+    # event command -> the field its handler fills in
+    _fields = {
+        wififlags.SIOCGIWFREQ: "frequency",
+        wififlags.SIOCGIWMODE: "mode",
+        wififlags.SIOCGIWNAME: "protocol",
+        wififlags.SIOCGIWESSID: "essid",
+        wififlags.SIOCGIWENCODE: "encode",
+        wififlags.SIOCGIWRATE: "rate",
+        wififlags.IWEVQUAL: "quality",
+        wififlags.IWEVGENIE: "wpa",
+        wififlags.IWEVCUSTOM: "custom",
+    }
+
+    # field -> (the fields decoded with it, the event commands they come from)
+    _basic = (
+        ("essid", "mode", "quality", "frequency", "encode", "protocol"),
+        frozenset((
+            wififlags.SIOCGIWFREQ, wififlags.SIOCGIWMODE,
+            wififlags.SIOCGIWNAME, wififlags.SIOCGIWESSID,
+            wififlags.SIOCGIWENCODE, wififlags.IWEVQUAL,
+        )),
+    )
+    _groups = dict.fromkeys(_basic[0], _basic)
+    _groups["rate"] = (("rate",), frozenset((wififlags.SIOCGIWRATE,)))
+    _groups["custom"] = (("custom",), frozenset((wififlags.IWEVCUSTOM,)))
+    _groups["wpa"] = (("wpa",), frozenset((wififlags.IWEVGENIE,)))
+    # fields that don't start out as None
+    _defaults = {"quality": Iwquality, "rate": list, "custom": list}
+
     def display(self):
         print("ESSID:", self.essid)
         print("Access point:", self.bssid)
@@ -1625,8 +2530,11 @@ class Iwscanresult:
         print("Signal ", self.quality.getSignallevel())
         print(" Noise ", self.quality.getNoiselevel())
         print("Encryption:", map(lambda x: hex(ord(x)), self.encode))
-        # XXX
-        # print "Frequency:", self.frequency.getFrequency(), "(Channel", self.frequency.getChannel(self.range), ")"
+        if self.frequency is not None:
+            print(
+                "Frequency:", self.frequency.getFrequency(),
+                "(Channel", self.getChannel(), ")"
+            )
         for custom in self.custom:
             print("Custom:", custom)
         print("")
@@ -0,0 +1,73 @@
+# Python WiFi -- a library to access wireless card properties via Python
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public License
+#    as published by the Free Software Foundation; either version 2.1 of
+#    the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    Lesser General Public License for more details.
+"""Precompiled layouts of the wireless extension structures.
+
+Every format is compiled once, at import, and read with unpack_from at an
+offset, so parsing doesn't slice the kernel's buffers or re-parse format
+strings.
+
+"""
+
+import struct
+from functools import lru_cache
+
+from . import flags as wififlags
+
+# struct iw_param: (i) value, (b) fixed, (b) disabled, (H) flags
+IW_PARAM = struct.Struct("ibbH")
+# struct iw_freq: (i) mantissa, (h) exponent, (b) list index, (b) flags
+IW_FREQ = struct.Struct("ihbb")
+# struct iw_quality: (B) quality, (b) signal level, (b) noise level, (B) updated
+IW_QUALITY = struct.Struct("BbbB")
+# struct iw_statistics: (2B) status, 4B iw_quality, 6i iw_discarded
+IW_STATISTICS = struct.Struct("2BBbbB6i")
+# struct iw_point: (P) pointer to data, (H) length, (H) flags
+IW_POINT = struct.Struct("PHH")
+# struct iw_range
+IW_RANGE = struct.Struct(
+    "IIIHB6Ii4B4BB"
+    + wififlags.IW_MAX_BITRATES * "i"
+    + "2i2i2i2i3H"
+    + wififlags.IW_MAX_ENCODING_SIZES * "H"
+    + "2BBHB"
+    + wififlags.IW_MAX_TXPOWER * "i"
+    + "2B3H2i2iHB"
+    + wififlags.IW_MAX_FREQUENCIES * "ihBB"
+    + "IiiHiI"
+)
+
+# Buffer pointer and length handed to the kernel with a request
+WRQ_BUFFER = struct.Struct("Pi")
+# SIOCSIWSCAN request without options
+SCAN_REQUEST = struct.Struct("Pii")
+# Operation mode (SIOCGIWMODE)
+IW_MODE = struct.Struct("I")
+# struct sockaddr holding a MAC address (SIOCGIWAP), family skipped
+SOCKADDR_MAC = struct.Struct("xx6B")
+# The MAC address alone
+MAC = struct.Struct("6B")
+# struct ifconf: (i) length of the buffer, (P) pointer to it
+IFCONF = struct.Struct("iP")
+# struct ifreq as SIOCGIFCONF lists them: the name, then a union that
+# is 24 bytes on 64 bit and 16 bytes on 32 bit Linux
+IFREQ = struct.Struct(
+    "%ds%dx" % (wififlags.IFNAMSIZE, 24 if struct.calcsize("P") == 8 else 16)
+)
+
+# struct iw_event header: (H) length, (H) command
+IW_EVENT_HEADER = struct.Struct("HH")
+
+
+@lru_cache(maxsize=64)
+def compiled(fmt):
+    """ Returns the struct.Struct of a format, compiling it only once. """
+    return struct.Struct(fmt)
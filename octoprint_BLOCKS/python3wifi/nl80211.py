@@ -0,0 +1,483 @@
+# Python WiFi -- a library to access wireless card properties via Python
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public License
+#    as published by the Free Software Foundation; either version 2.1 of
+#    the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    Lesser General Public License for more details.
+"""nl80211, the generic netlink interface of cfg80211 drivers.
+
+Wireless extensions cost one ioctl per attribute and are only emulated
+by cfg80211. nl80211 answers with whole messages instead: one
+GET_INTERFACE for the interface, one GET_STATION dump for the link and
+one GET_SCAN dump for every BSS. Wireless and Iwscan use it when the
+kernel has it and fall back to the ioctls otherwise.
+
+"""
+
+import errno
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+NETLINK_GENERIC = 16
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLA_TYPE_MASK = 0x3FFF
+
+# generic netlink controller
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+# enum nl80211_commands
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_GET_STATION = 17
+NL80211_CMD_GET_SCAN = 32
+NL80211_CMD_TRIGGER_SCAN = 33
+NL80211_CMD_NEW_SCAN_RESULTS = 34
+NL80211_CMD_SCAN_ABORTED = 35
+
+# enum nl80211_attrs
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_STA_INFO = 21
+NL80211_ATTR_WIPHY_FREQ = 38
+NL80211_ATTR_BSS = 47
+NL80211_ATTR_SSID = 52
+NL80211_ATTR_WIPHY_TX_POWER_LEVEL = 98
+
+# enum nl80211_sta_info
+NL80211_STA_INFO_INACTIVE_TIME = 1
+NL80211_STA_INFO_SIGNAL = 7
+NL80211_STA_INFO_TX_BITRATE = 8
+NL80211_STA_INFO_TX_RETRIES = 11
+NL80211_STA_INFO_TX_FAILED = 12
+NL80211_STA_INFO_SIGNAL_AVG = 13
+NL80211_STA_INFO_RX_BITRATE = 14
+NL80211_STA_INFO_CONNECTED_TIME = 16
+NL80211_STA_INFO_BEACON_LOSS = 18
+NL80211_STA_INFO_RX_DROP_MISC = 28
+
+# enum nl80211_rate_info, in 100 kbit/s
+NL80211_RATE_INFO_BITRATE = 1
+NL80211_RATE_INFO_BITRATE32 = 5
+
+# enum nl80211_bss
+NL80211_BSS_BSSID = 1
+NL80211_BSS_FREQUENCY = 2
+NL80211_BSS_CAPABILITY = 5
+NL80211_BSS_INFORMATION_ELEMENTS = 6
+NL80211_BSS_SIGNAL_MBM = 7
+NL80211_BSS_SIGNAL_UNSPEC = 8
+NL80211_BSS_STATUS = 9
+NL80211_BSS_SEEN_MS_AGO = 10
+
+# enum nl80211_bss_status
+NL80211_BSS_STATUS_ASSOCIATED = 1
+NL80211_BSS_STATUS_IBSS_JOINED = 2
+
+# 802.11 information elements
+WLAN_EID_SSID = 0
+WLAN_EID_SUPP_RATES = 1
+WLAN_EID_EXT_SUPP_RATES = 50
+
+# 802.11 capability bits
+WLAN_CAPABILITY_ESS = 0x1
+WLAN_CAPABILITY_IBSS = 0x2
+WLAN_CAPABILITY_PRIVACY = 0x10
+
+NLMSGHDR = struct.Struct("=IHHII")
+GENLMSGHDR = struct.Struct("=BBxx")
+NLATTR = struct.Struct("=HH")
+U8 = struct.Struct("=B")
+S8 = struct.Struct("=b")
+U16 = struct.Struct("=H")
+U32 = struct.Struct("=I")
+U64 = struct.Struct("=Q")
+S32 = struct.Struct("=i")
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def attributes(data, offset=0, end=None):
+    """ Returns the netlink attributes in data as a dict, type -> payload. """
+    if end is None:
+        end = len(data)
+    attrs = {}
+    while offset + NLATTR.size <= end:
+        length, kind = NLATTR.unpack_from(data, offset)
+        if length < NLATTR.size:
+            break
+        attrs[kind & NLA_TYPE_MASK] = bytes(
+            data[offset + NLATTR.size:offset + length])
+        offset += _align(length)
+    return attrs
+
+
+def nested(data):
+    """ Returns the payloads of a list of nested attributes, in order. """
+    items = []
+    offset = 0
+    while offset + NLATTR.size <= len(data):
+        length, kind = NLATTR.unpack_from(data, offset)
+        if length < NLATTR.size:
+            break
+        items.append(data[offset + NLATTR.size:offset + length])
+        offset += _align(length)
+    return items
+
+
+def attribute(kind, payload):
+    """ Packs one netlink attribute, padded. """
+    length = NLATTR.size + len(payload)
+    return (NLATTR.pack(length, kind) + payload +
+            b"\0" * (_align(length) - length))
+
+
+def messages(data):
+    """Splits a datagram into its netlink messages.
+
+    Returns (type, flags, seq, payload) tuples.
+
+    """
+    result = []
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, kind, flags, seq, pid = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        result.append((kind, flags, seq,
+                       data[offset + NLMSGHDR.size:offset + length]))
+        offset += _align(length)
+    return result
+
+
+def elements(data):
+    """ Yields (id, payload) of the 802.11 information elements in data. """
+    offset = 0
+    while offset + 2 <= len(data):
+        eid, length = data[offset], data[offset + 1]
+        yield eid, data[offset + 2:offset + 2 + length]
+        offset += 2 + length
+
+
+def _rate(data):
+    """ Returns the bit rate of a nested nl80211_rate_info in bit/s. """
+    info = attributes(data)
+    if NL80211_RATE_INFO_BITRATE32 in info:
+        return U32.unpack(info[NL80211_RATE_INFO_BITRATE32])[0] * 100000
+    if NL80211_RATE_INFO_BITRATE in info:
+        return U16.unpack(info[NL80211_RATE_INFO_BITRATE])[0] * 100000
+    return None
+
+
+def _unpack(layout, attrs, kind):
+    if kind not in attrs:
+        return None
+    return layout.unpack_from(attrs[kind])[0]
+
+
+class GenlSocket:
+    """ A generic netlink socket, the transport Nl80211 uses by default. """
+
+    def __init__(self):
+        self._sock = None
+
+    def open(self):
+        self._sock = socket.socket(socket.AF_NETLINK,
+                                   socket.SOCK_RAW | socket.SOCK_CLOEXEC,
+                                   NETLINK_GENERIC)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 18)
+        self._sock.bind((0, 0))
+
+    def join(self, group):
+        """ Subscribes to a multicast group. """
+        self._sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
+
+    def send(self, data):
+        self._sock.send(data)
+
+    def recv(self, timeout):
+        """ Returns the next datagram, None if none came within timeout. """
+        readable, _, _ = select.select([self._sock], [], [], timeout)
+        if not readable:
+            return None
+        return self._sock.recv(65536)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class ScanEvents:
+    """Scan-complete notifications, from the nl80211 "scan" group.
+
+    Subscribe before triggering the scan, so the notification can't be
+    missed.
+
+    """
+
+    def __init__(self, transport, family_id, group):
+        self.family_id = family_id
+        self._transport = transport
+        self._transport.open()
+        self._transport.join(group)
+
+    def wait(self, ifindex, timeout):
+        """Waits for the scan on ifindex to end.
+
+        Returns NL80211_CMD_NEW_SCAN_RESULTS or NL80211_CMD_SCAN_ABORTED,
+        None if neither came within timeout (0 doesn't wait).
+
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            data = self._transport.recv(max(0.0, deadline - time.monotonic()))
+            if data is None:
+                return None
+            for kind, flags, seq, payload in messages(data):
+                if kind != self.family_id:
+                    continue
+                cmd, version = GENLMSGHDR.unpack_from(payload)
+                if cmd not in (NL80211_CMD_NEW_SCAN_RESULTS,
+                               NL80211_CMD_SCAN_ABORTED):
+                    continue
+                attrs = attributes(payload, GENLMSGHDR.size)
+                if _unpack(U32, attrs, NL80211_ATTR_IFINDEX) == ifindex:
+                    return cmd
+
+    def close(self):
+        self._transport.close()
+
+
+class Nl80211:
+    """Queries cfg80211 drivers over nl80211.
+
+    Every request is one message out and one reply or dump back. The
+    replies are returned as dicts of plain values.
+
+    transport -- returns a new, unopened transport; anything with
+        open()/send()/recv(timeout)/join(group)/close() like GenlSocket,
+        e.g. a recording played back.
+
+    """
+
+    # Seconds the kernel is given to answer
+    TIMEOUT = 2.0
+
+    def __init__(self, transport=GenlSocket):
+        self._new_transport = transport
+        self._transport = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._available = None
+        self.family_id = None
+        self.groups = {}
+
+    def available(self):
+        """ Returns True when the kernel has nl80211, asking only once. """
+        if self._available is None:
+            try:
+                self._resolve()
+            except OSError:
+                self._available = False
+            else:
+                self._available = True
+        return self._available
+
+    def interface(self, ifindex):
+        """Returns what GET_INTERFACE says about an interface: ifname,
+        iftype, wiphy, mac, ssid (bytes, None when not connected),
+        frequency (MHz, None when not on a channel) and txpower (mBm, None
+        when the driver doesn't say).
+
+        """
+        reply = self._request(NL80211_CMD_GET_INTERFACE,
+                              attribute(NL80211_ATTR_IFINDEX,
+                                        U32.pack(ifindex)))
+        if not reply:
+            raise OSError(errno.ENODEV, os.strerror(errno.ENODEV))
+        attrs = reply[0]
+        ifname = attrs.get(NL80211_ATTR_IFNAME, b"").rstrip(b"\0")
+        return {"ifindex": ifindex,
+                "ifname": ifname.decode("utf8", "replace"),
+                "iftype": _unpack(U32, attrs, NL80211_ATTR_IFTYPE),
+                "wiphy": _unpack(U32, attrs, NL80211_ATTR_WIPHY),
+                "mac": attrs.get(NL80211_ATTR_MAC),
+                "ssid": attrs.get(NL80211_ATTR_SSID),
+                "frequency": _unpack(U32, attrs, NL80211_ATTR_WIPHY_FREQ),
+                "txpower": _unpack(S32, attrs,
+                                   NL80211_ATTR_WIPHY_TX_POWER_LEVEL)}
+
+    def station(self, ifindex):
+        """Returns the station the interface is associated with (its
+        access point), None if it isn't. Signals are in dBm, bit rates
+        in bit/s.
+
+        """
+        for attrs in self._request(NL80211_CMD_GET_STATION,
+                                   attribute(NL80211_ATTR_IFINDEX,
+                                             U32.pack(ifindex)),
+                                   dump=True):
+            info = attributes(attrs.get(NL80211_ATTR_STA_INFO, b""))
+            tx_bitrate = info.get(NL80211_STA_INFO_TX_BITRATE)
+            rx_bitrate = info.get(NL80211_STA_INFO_RX_BITRATE)
+            return {
+                "mac": attrs.get(NL80211_ATTR_MAC),
+                "signal": _unpack(S8, info, NL80211_STA_INFO_SIGNAL),
+                "signal_avg": _unpack(S8, info, NL80211_STA_INFO_SIGNAL_AVG),
+                "tx_bitrate": _rate(tx_bitrate) if tx_bitrate else None,
+                "rx_bitrate": _rate(rx_bitrate) if rx_bitrate else None,
+                "tx_retries": _unpack(U32, info, NL80211_STA_INFO_TX_RETRIES),
+                "tx_failed": _unpack(U32, info, NL80211_STA_INFO_TX_FAILED),
+                "rx_drop_misc": _unpack(U64, info,
+                                        NL80211_STA_INFO_RX_DROP_MISC),
+                "beacon_loss": _unpack(U32, info,
+                                       NL80211_STA_INFO_BEACON_LOSS),
+                "connected_time": _unpack(U32, info,
+                                          NL80211_STA_INFO_CONNECTED_TIME),
+                "inactive_time": _unpack(U32, info,
+                                         NL80211_STA_INFO_INACTIVE_TIME)}
+        return None
+
+    def scan_results(self, ifindex):
+        """Returns every BSS of the last scan, from one GET_SCAN dump:
+        bssid, frequency (MHz), capability, signal (dBm, or 0-100 when
+        signal_dbm is False), status (associated etc., None), seen_ms_ago
+        and ies, the information elements.
+
+        """
+        results = []
+        for attrs in self._request(NL80211_CMD_GET_SCAN,
+                                   attribute(NL80211_ATTR_IFINDEX,
+                                             U32.pack(ifindex)),
+                                   dump=True):
+            bss = attributes(attrs.get(NL80211_ATTR_BSS, b""))
+            if NL80211_BSS_BSSID not in bss:
+                continue
+            if NL80211_BSS_SIGNAL_MBM in bss:
+                signal = _unpack(S32, bss, NL80211_BSS_SIGNAL_MBM) // 100
+                signal_dbm = True
+            else:
+                signal = _unpack(U8, bss, NL80211_BSS_SIGNAL_UNSPEC)
+                signal_dbm = False
+            results.append({
+                "bssid": bss[NL80211_BSS_BSSID],
+                "frequency": _unpack(U32, bss, NL80211_BSS_FREQUENCY),
+                "capability": _unpack(U16, bss, NL80211_BSS_CAPABILITY) or 0,
+                "signal": signal,
+                "signal_dbm": signal_dbm,
+                "status": _unpack(U32, bss, NL80211_BSS_STATUS),
+                "seen_ms_ago": _unpack(U32, bss, NL80211_BSS_SEEN_MS_AGO),
+                "ies": bss.get(NL80211_BSS_INFORMATION_ELEMENTS, b"")})
+        return results
+
+    def trigger_scan(self, ifindex):
+        """ Starts a scan on every channel, without waiting for it. """
+        self._request(NL80211_CMD_TRIGGER_SCAN,
+                      attribute(NL80211_ATTR_IFINDEX, U32.pack(ifindex)),
+                      ack=True)
+
+    def scan_events(self):
+        """ Returns a subscription to the scan-complete notifications. """
+        self._resolve()
+        if "scan" not in self.groups:
+            raise OSError(errno.ENOENT, "nl80211 has no scan group")
+        return ScanEvents(self._new_transport(), self.family_id,
+                          self.groups["scan"])
+
+    def close(self):
+        with self._lock:
+            if self._transport is not None:
+                self._transport.close()
+                self._transport = None
+
+    def _resolve(self):
+        if self.family_id is not None:
+            return
+        reply = self._transact(GENL_ID_CTRL, CTRL_CMD_GETFAMILY,
+                               attribute(CTRL_ATTR_FAMILY_NAME,
+                                         b"nl80211\0"))
+        if not reply:
+            raise OSError(errno.ENOENT, "no nl80211 family")
+        attrs = reply[0]
+        groups = {}
+        for group in nested(attrs.get(CTRL_ATTR_MCAST_GROUPS, b"")):
+            group = attributes(group)
+            name = group.get(CTRL_ATTR_MCAST_GRP_NAME, b"").rstrip(b"\0")
+            groups[name.decode("ascii", "replace")] = _unpack(
+                U32, group, CTRL_ATTR_MCAST_GRP_ID)
+        self.groups = groups
+        self.family_id = _unpack(U16, attrs, CTRL_ATTR_FAMILY_ID)
+
+    def _request(self, cmd, payload, dump=False, ack=False):
+        self._resolve()
+        return self._transact(self.family_id, cmd, payload, dump, ack)
+
+    def _transact(self, family, cmd, payload, dump=False, ack=False):
+        """Sends one request and collects the replies' attributes.
+
+        Raises OSError with the kernel's errno when it refuses.
+
+        """
+        flags = NLM_F_REQUEST
+        if dump:
+            flags |= NLM_F_DUMP
+        if ack:
+            flags |= NLM_F_ACK
+        body = GENLMSGHDR.pack(cmd, 1) + payload
+        with self._lock:
+            if self._transport is None:
+                transport = self._new_transport()
+                transport.open()
+                self._transport = transport
+            self._seq += 1
+            seq = self._seq
+            self._transport.send(NLMSGHDR.pack(NLMSGHDR.size + len(body),
+                                               family, flags, seq, 0) + body)
+            replies = []
+            deadline = time.monotonic() + self.TIMEOUT
+            while True:
+                data = self._transport.recv(max(0.0,
+                                                deadline - time.monotonic()))
+                if data is None:
+                    raise OSError(errno.ETIMEDOUT, "nl80211 didn't answer")
+                for kind, mflags, mseq, message in messages(data):
+                    if mseq != seq:
+                        continue
+                    if kind == NLMSG_ERROR:
+                        error = -S32.unpack_from(message)[0]
+                        if error:
+                            raise OSError(error, os.strerror(error))
+                        return replies
+                    if kind == NLMSG_DONE:
+                        return replies
+                    replies.append(attributes(message, GENLMSGHDR.size))
+                    if not mflags & NLM_F_MULTI and not ack:
+                        return replies
@@ -0,0 +1,129 @@
+# Python WiFi -- a library to access wireless card properties via Python
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public License
+#    as published by the Free Software Foundation; either version 2.1 of
+#    the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    Lesser General Public License for more details.
+"""Link statistics of every wireless interface from /proc/net/wireless.
+
+The kernel prints the same numbers SIOCGIWSTATS returns, for all
+interfaces at once. The file is kept open and read with one pread from
+the start, so a read costs one system call whatever the number of
+interfaces.
+
+"""
+
+import os
+import re
+import threading
+
+from . import flags as wififlags
+
+PROC_NET_WIRELESS = "/proc/net/wireless"
+
+# " wlan0: 0000   54.  -56.  -256        0      0      0      0     77        0"
+# interface, status, link quality, level, noise (each followed by "." when
+# updated), discarded nwid, crypt, frag, retry, misc, missed beacons
+LINE = re.compile(
+    rb"^\s*([^\s:]+):\s+([0-9a-fA-F]+)"
+    rb"\s+(-?\d+)(\.?)\s+(-?\d+)(\.?)\s+(-?\d+)(\.?)"
+    rb"\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)",
+    re.M,
+)
+
+
+class WirelessStats:
+    """ The statistics of one interface, as in struct iw_statistics. """
+
+    __slots__ = (
+        "ifname", "status", "quality", "level", "noise", "updated",
+        "discard", "missed_beacon",
+    )
+
+    def __init__(self, match):
+        (
+            ifname, status, quality, quality_updated, level, level_updated,
+            noise, noise_updated, nwid, code, frag, retries, misc, beacon,
+        ) = match.groups()
+        self.ifname = ifname.decode("utf8", "replace")
+        self.status = int(status, 16)
+        self.quality = int(quality)
+        self.level = int(level)
+        self.noise = int(noise)
+        self.updated = (
+            (wififlags.IW_QUAL_QUAL_UPDATED if quality_updated else 0)
+            | (wififlags.IW_QUAL_LEVEL_UPDATED if level_updated else 0)
+            | (wififlags.IW_QUAL_NOISE_UPDATED if noise_updated else 0)
+        )
+        self.discard = {
+            "nwid": int(nwid), "code": int(code), "fragment": int(frag),
+            "retries": int(retries), "misc": int(misc),
+        }
+        self.missed_beacon = int(beacon)
+
+    def __repr__(self):
+        return "WirelessStats(%s, quality=%d, level=%d, noise=%d)" % (
+            self.ifname, self.quality, self.level, self.noise
+        )
+
+
+class ProcWireless:
+    """Reads /proc/net/wireless on a file descriptor kept open.
+
+    Thread safe. Interfaces the kernel has no statistics for (not
+    associated, no wireless extensions) aren't listed.
+
+    path -- the file to read, a fixture in tests.
+
+    """
+
+    def __init__(self, path=PROC_NET_WIRELESS):
+        self.path = path
+        self._fd = None
+        self._size = 4096
+        self._lock = threading.Lock()
+
+    def read(self):
+        """Returns the statistics of every listed interface, by name.
+
+        Raises OSError when the file can't be read (no wireless
+        extensions in the kernel).
+
+        """
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+            while True:
+                try:
+                    data = os.pread(self._fd, self._size, 0)
+                except OSError:
+                    # opened again on the next read
+                    os.close(self._fd)
+                    self._fd = None
+                    raise
+                if len(data) < self._size:
+                    break
+                self._size *= 2
+        return {
+            stats.ifname: stats
+            for stats in map(WirelessStats, LINE.finditer(data))
+        }
+
+    def get(self, ifname):
+        """ Returns the WirelessStats of one interface, None if not listed. """
+        return self.read().get(ifname)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+# Shared by everyone reading link statistics
+proc_wireless = ProcWireless()
@@ -0,0 +1,244 @@
+# coding=utf-8
+import os
+import select
+import struct
+import threading
+import time
+import ctypes
+import ctypes.util
+import logging
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+               IN_DELETE)
+# struct inotify_event without the name: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _inotify_init1 = _libc.inotify_init1
+    _inotify_add_watch = _libc.inotify_add_watch
+    _inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p,
+                                   ctypes.c_uint32)
+except (OSError, AttributeError):
+    _inotify_init1 = None
+
+
+class SavedNetwork(object):
+    """A network the system is configured to connect to.
+
+    Attributes:
+        ssid (type: string): network name, the registry key.
+        id (type: string): what the backend knows it by, the wpa_supplicant
+            network id or the NetworkManager connection name.
+        priority (type: int): higher is preferred when several are around.
+        last_connected (type: float): time.time() of the last connection
+            seen, None if it wasn't seen.
+        disabled (type: boolean): never connected to automatically.
+
+    """
+
+    __slots__ = ("ssid", "id", "priority", "last_connected", "disabled")
+
+    def __init__(self, ssid, id, priority=0, last_connected=None,
+                 disabled=False):
+        self.ssid = ssid
+        self.id = id
+        self.priority = priority
+        self.last_connected = last_connected
+        self.disabled = disabled
+
+    def __repr__(self):
+        return "SavedNetwork(%r, id=%r, priority=%d%s)" % (
+            self.ssid, self.id, self.priority,
+            ", disabled" if self.disabled else "")
+
+
+class ConfigWatcher(threading.Thread):
+    """Calls callback() whenever a configuration file, or any file in a
+    configuration directory, is written, replaced or removed.
+
+    Uses inotify, see available(). The parent directory of a file is
+    watched so files replaced by a rename (like wpa_supplicant's
+    SAVE_CONFIG does) are still followed.
+
+    Args:
+        path (type: string): the file or directory to follow.
+        callback (type: function): called with no arguments, on this thread.
+
+    """
+
+    def __init__(self, path, callback):
+        threading.Thread.__init__(self, name="BlocksConfigWatcher")
+        self.daemon = True
+        self.path = path
+        self.callback = callback
+        if os.path.isdir(path):
+            self._directory, self._name = path, None
+        else:
+            self._directory, self._name = os.path.split(path)
+        self._stop_event = threading.Event()
+        self._fd = None
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def available():
+        """Returns True when inotify can be used."""
+        return _inotify_init1 is not None
+
+    def start(self):
+        """Sets up the watch and starts the thread.
+
+        Raises:
+            OSError: inotify isn't available or the directory can't be watched.
+
+        """
+        if not self.available():
+            raise OSError("inotify is not available")
+        self._fd = _inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if _inotify_add_watch(self._fd, os.fsencode(self._directory),
+                              _WATCH_MASK) < 0:
+            _errno = ctypes.get_errno()
+            os.close(self._fd)
+            self._fd = None
+            raise OSError(_errno, os.strerror(_errno), self._directory)
+        threading.Thread.start(self)
+
+    def stop(self):
+        """Stops watching, the thread ends within a second."""
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                _readable, _, _ = select.select([self._fd], [], [], 1.0)
+                if _readable and self._changed(os.read(self._fd, 4096)):
+                    self.callback()
+        except OSError as error:
+            self.logger.warning("Stopped watching %s: %s", self.path, error)
+        finally:
+            os.close(self._fd)
+
+    def _changed(self, data):
+        """Returns True when one of the events is about the watched file."""
+        _offset = 0
+        while _offset + _EVENT_HEADER.size <= len(data):
+            _, _mask, _, _length = _EVENT_HEADER.unpack_from(data, _offset)
+            _offset += _EVENT_HEADER.size
+            _name = data[_offset:_offset + _length].rstrip(b"\0")
+            _offset += _length
+            if self._name is None or os.fsdecode(_name) == self._name:
+                return True
+        return False
+
+
+class NetworkRegistry(object):
+    """In-memory index of the saved networks, keyed by SSID.
+
+    The backend is asked for them once. After that the index is kept up to
+    date by our own changes (put()) and dropped when something else
+    changes the configuration file, which a ConfigWatcher reports. Without
+    inotify the file's modification time is compared on every access.
+
+    Args:
+        backend (type: NetworkBackend): where the saved networks come from.
+
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.config_path = backend.config_path
+        self._lock = threading.Lock()
+        self._networks = None
+        self._stamp = None
+        self._watcher = None
+        self.logger = logging.getLogger(__name__)
+
+    def watch(self):
+        """Starts invalidating the index when the configuration changes.
+
+        Returns:
+            type: boolean. False if the file can't be watched, the
+                modification time is checked instead.
+
+        """
+        if self.config_path is None or self._watcher is not None:
+            return self._watcher is not None
+        _watcher = ConfigWatcher(self.config_path, self._on_config_changed)
+        try:
+            _watcher.start()
+        except OSError as error:
+            self.logger.info("Can't watch %s: %s", self.config_path, error)
+            return False
+        self._watcher = _watcher
+        return True
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def get(self, ssid):
+        """Returns the SavedNetwork of an SSID, None if it isn't saved."""
+        with self._lock:
+            return self._index().get(ssid)
+
+    def networks(self):
+        """Returns the saved networks, highest priority first."""
+        with self._lock:
+            return sorted(self._index().values(),
+                          key=lambda network: network.priority, reverse=True)
+
+    def put(self, network):
+        """Adds or replaces an entry after we changed the configuration
+            ourselves, without reloading everything.
+        """
+        with self._lock:
+            if self._networks is not None:
+                self._networks[network.ssid] = network
+                # Our own write, the watcher mustn't throw the index away
+                self._stamp = self._config_stamp()
+
+    def mark_connected(self, ssid):
+        """Records that the network is connected now."""
+        with self._lock:
+            if self._networks is not None and ssid in self._networks:
+                self._networks[ssid].last_connected = time.time()
+
+    def invalidate(self):
+        """Drops the index, the next access loads it again."""
+        with self._lock:
+            self._networks = None
+
+    def _index(self):
+        if self._networks is not None and self._watcher is None and \
+                self._config_stamp() != self._stamp:
+            self._networks = None
+        if self._networks is None:
+            self._stamp = self._config_stamp()
+            self._networks = {_network.ssid: _network
+                              for _network in self.backend.saved_networks()}
+        return self._networks
+
+    def _on_config_changed(self):
+        with self._lock:
+            if self._networks is not None and \
+                    self._config_stamp() != self._stamp:
+                self.logger.debug("%s changed, reloading the saved networks",
+                                  self.config_path)
+                self._networks = None
+
+    def _config_stamp(self):
+        if self.config_path is None:
+            return None
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
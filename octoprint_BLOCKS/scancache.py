@@ -0,0 +1,171 @@
+# coding=utf-8
+import time
+import threading
+import logging
+
+
+def _fingerprint(results):
+    if results is None:
+        return None
+    return [(_record.ssid, _record.bssid, _record.signal, _record.frequency,
+             _record.count) for _record in results]
+
+
+class ScanCache(object):
+    """Serves BSS scan results to everyone from one place so the radio
+    only goes off-channel when the results are actually old.
+
+    Results younger than `ttl` are returned as they are. Older ones, up to
+    `max_staleness`, are still returned but a new scan is requested in the
+    background. Past `max_staleness`, or when forced, the caller waits for
+    the scan.
+
+    A requested scan is pending until it has finished: a monitor pushes
+    its results in with update(), or the backend's results change from
+    what they were when it was requested. Until then the old results are
+    served with their old age. Results that haven't changed once the scan
+    had its `scan_time` are what the site looks like, they are stored as
+    fresh then.
+
+    Args:
+        backend (type: NetworkBackend): where the scans come from.
+        ttl (type: float): seconds results are considered fresh.
+        max_staleness (type: float): seconds after which stale results are
+            no longer served.
+        scan_time (type: float): seconds a scan is given to finish.
+        poll_interval (type: float): seconds between checks of the backend's
+            results while waiting for a scan.
+
+    """
+
+    def __init__(self, backend, ttl=25.0, max_staleness=120.0, scan_time=5.0,
+                 poll_interval=0.5, clock=time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self.scan_time = scan_time
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Signalled when a pending scan's results are stored
+        self._finished = threading.Condition(self._lock)
+        self._results = None
+        self._stamp = None
+        # When the scan we're waiting for was requested, and what the
+        # backend had before it
+        self._pending = None
+        self._before = None
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "forced": 0,
+                       "scans": 0, "unchanged": 0}
+        self.logger = logging.getLogger(__name__)
+
+    def get(self, force=False):
+        """Returns the scan results, scanning only when they're stale.
+
+        Args:
+            force (type: boolean): rescan even if the results are fresh.
+
+        Returns:
+            type: List. The scan results.
+
+        """
+        with self._lock:
+            if self._pending is not None and not force and \
+                    self._clock() - self._pending >= self.scan_time:
+                # A background scan was requested earlier, it's done
+                self._poll(final=True)
+            _age = self.age()
+            if force:
+                self._stats["forced"] += 1
+            elif _age is not None and _age <= self.ttl:
+                self._stats["hits"] += 1
+                return self._results
+            elif _age is not None and _age <= self.max_staleness:
+                self._stats["stale_hits"] += 1
+                self._request()
+                return self._results
+            else:
+                self._stats["misses"] += 1
+            if self._request():
+                self._wait()
+            if self._results is None:
+                # No scan could be started, serve what the backend has
+                # without taking it for fresh results
+                return self.backend.scan_results()
+            return self._results
+
+    def update(self, results):
+        """Stores results that came in without get() asking for them,
+        e.g. from a scan results event.
+        """
+        with self._lock:
+            self._store(results)
+
+    def invalidate(self):
+        """Drops the results, the next get() scans."""
+        with self._lock:
+            self._results = self._stamp = None
+            self._pending = self._before = None
+
+    def age(self):
+        """Returns the age of the results in seconds, None if there are none."""
+        if self._stamp is None:
+            return None
+        return self._clock() - self._stamp
+
+    def stats(self):
+        """Returns a copy of the hit/miss counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _request(self):
+        """Starts a scan unless one is pending already.
+
+        Returns:
+            type: boolean. True if there is a scan to wait for.
+
+        """
+        if self._pending is not None:
+            return True
+        _before = self.backend.scan_results()
+        if not self.backend.request_scan():
+            return False
+        self._stats["scans"] += 1
+        if self.backend.instant_scan:
+            self._store(self.backend.scan_results())
+            return False
+        self._pending = self._clock()
+        self._before = _fingerprint(_before)
+        return True
+
+    def _wait(self):
+        """Waits until the pending scan is stored or scan_time is up."""
+        _deadline = self._pending + self.scan_time
+        while self._pending is not None:
+            _left = _deadline - self._clock()
+            if _left <= 0:
+                self._poll(final=True)
+                return
+            # update() wakes us up as soon as a monitor has the results
+            if not self._finished.wait(min(_left, self.poll_interval)):
+                self._poll()
+
+    def _poll(self, final=False):
+        """Stores the backend's results if the pending scan changed them,
+        or whatever they are when final (the scan had its scan_time).
+        """
+        _results = self.backend.scan_results()
+        if _fingerprint(_results) == self._before:
+            if not final:
+                return False
+            self.logger.debug("Scan on %s changed nothing in %.1f s",
+                              self.backend.interface, self.scan_time)
+            self._stats["unchanged"] += 1
+        self._store(_results)
+        return True
+
+    def _store(self, results):
+        self._results = results
+        self._stamp = self._clock()
+        self._pending = self._before = None
+        self._finished.notify_all()
@@ -0,0 +1,191 @@
+# coding=utf-8
+import re
+from operator import attrgetter
+
+# ScanRecord.bands bits
+BAND_2GHZ = 1
+BAND_5GHZ = 2
+BAND_6GHZ = 4
+
+# nmcli -t separates fields with ":" and escapes the ones inside values
+_NMCLI_FIELD_SEP = re.compile(r"(?<!\\):")
+
+# wpa_supplicant's printf_encode() escapes, on the SSID's bytes
+_PRINTF_ESCAPE = re.compile(br"\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)", re.DOTALL)
+_PRINTF_CHARS = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"e": b"\x1b"}
+
+
+def _printf_unescape(match):
+    _escape = match.group(1)
+    if _escape[:1] == b"x":
+        return bytes((int(_escape[1:], 16),))
+    if _escape[:1].isdigit():
+        return bytes((int(_escape, 8) & 0xff,))
+    return _PRINTF_CHARS.get(_escape, _escape)
+
+
+def frequency_band(frequency):
+    """Returns the ScanRecord band bit of a frequency in MHz."""
+    if frequency < 2500:
+        return BAND_2GHZ
+    if frequency < 5925:
+        return BAND_5GHZ
+    return BAND_6GHZ
+
+
+def unescape_ssid(ssid):
+    """Decodes an SSID as wpa_supplicant prints it in SCAN_RESULTS and
+    LIST_NETWORKS: every byte outside printable ASCII as \\xNN, quotes and
+    backslashes as \\" and \\\\. The bytes are read as UTF-8, what isn't
+    becomes U+FFFD.
+    """
+    if "\\" not in ssid:
+        return ssid
+    return _PRINTF_ESCAPE.sub(_printf_unescape, ssid.encode("utf-8")).decode(
+        "utf-8", "replace")
+
+
+def flags_security(flags):
+    """Reduces wpa_supplicant BSS flags, e.g. "[WPA2-PSK-CCMP][ESS]", to
+    "WPA3", "WPA2", "WPA", "WEP" or "open".
+    """
+    if "SAE" in flags:
+        return "WPA3"
+    if "WPA2" in flags or "RSN" in flags:
+        return "WPA2"
+    if "WPA" in flags:
+        return "WPA"
+    if "WEP" in flags:
+        return "WEP"
+    return "open"
+
+
+class ScanRecord(object):
+    """One network (SSID) seen in a scan, all its BSSes merged together.
+
+    bssid, signal, frequency and security are the strongest BSS's, bands
+    has a BAND_* bit for every band the network was seen on and count is
+    the number of BSSes merged in.
+
+    """
+
+    __slots__ = ("ssid", "bssid", "signal", "frequency", "bands",
+                 "security", "count")
+
+    def __init__(self, ssid, bssid, signal, frequency, security):
+        self.ssid = ssid
+        self.bssid = bssid
+        self.signal = signal
+        self.frequency = frequency
+        self.bands = frequency_band(frequency)
+        self.security = security
+        self.count = 1
+
+    def merge(self, bssid, signal, frequency, security):
+        """Adds another BSS of the same network."""
+        self.bands |= frequency_band(frequency)
+        self.count += 1
+        if signal > self.signal:
+            self.bssid = bssid
+            self.signal = signal
+            self.frequency = frequency
+            self.security = security
+
+    def to_wire(self):
+        """Returns the compact form sent to the browser:
+            [ssid, signal, bands, security].
+        """
+        return [self.ssid, self.signal, self.bands, self.security]
+
+    def __repr__(self):
+        return "ScanRecord(%r, %s dBm, %d MHz, %s, %d BSS)" % (
+            self.ssid, self.signal, self.frequency, self.security, self.count)
+
+
+def _merged(records):
+    return sorted(records.values(), key=attrgetter("signal"), reverse=True)
+
+
+def parse_scan_results(text):
+    """Parses wpa_supplicant SCAN_RESULTS in a single pass.
+
+    Lines look like "bssid<TAB>frequency<TAB>signal<TAB>flags<TAB>ssid",
+    the ssid escaped (see unescape_ssid). BSSes are merged by SSID, hidden
+    networks (no SSID) are left out.
+
+    Args:
+        text (type: string): the SCAN_RESULTS reply.
+
+    Returns:
+        type: List. ScanRecord objects, strongest signal first.
+
+    """
+    _records = {}
+    for _line in text.split("\n"):
+        _fields = _line.split("\t", 4)
+        # The header has no tabs, hidden networks have no ssid
+        if len(_fields) != 5 or not _fields[4]:
+            continue
+        _bssid, _frequency, _signal, _flags, _ssid = _fields
+        _ssid = unescape_ssid(_ssid)
+        try:
+            _frequency = int(_frequency)
+            _signal = int(_signal)
+        except ValueError:
+            continue
+        _record = _records.get(_ssid)
+        if _record is None:
+            _records[_ssid] = ScanRecord(_ssid, _bssid, _signal, _frequency,
+                                         flags_security(_flags))
+        else:
+            _record.merge(_bssid, _signal, _frequency, flags_security(_flags))
+    return _merged(_records)
+
+
+def parse_nmcli_scan(text):
+    """Parses `nmcli -t -f BSSID,FREQ,SIGNAL,SECURITY,SSID device wifi list`
+    the same way parse_scan_results parses wpa_supplicant's output.
+
+    NetworkManager reports the signal as a 0-100 strength, which only
+    approximates dBm: it's turned back into dBm assuming 0 is -100 dBm and
+    100 is -40 dBm, NetworkManager's scale for drivers reporting dBm. Other
+    drivers' strengths, and anything past either end, don't map back.
+
+    Returns:
+        type: List. ScanRecord objects, strongest signal first.
+
+    """
+    _records = {}
+    for _line in text.split("\n"):
+        _fields = _NMCLI_FIELD_SEP.split(_line, 4)
+        if len(_fields) != 5 or not _fields[4]:
+            continue
+        _bssid, _frequency, _quality, _security, _ssid = (
+            _field.replace("\\:", ":") for _field in _fields)
+        try:
+            _frequency = int(_frequency.split(" ", 1)[0])
+            _signal = int(_quality) * 3 // 5 - 100
+        except ValueError:
+            continue
+        if "WPA3" in _security:
+            _security = "WPA3"
+        elif "WPA2" in _security:
+            _security = "WPA2"
+        elif "WPA" in _security:
+            _security = "WPA"
+        elif "WEP" in _security:
+            _security = "WEP"
+        else:
+            _security = "open"
+        _record = _records.get(_ssid)
+        if _record is None:
+            _records[_ssid] = ScanRecord(_ssid, _bssid, _signal, _frequency,
+                                         _security)
+        else:
+            _record.merge(_bssid, _signal, _frequency, _security)
+    return _merged(_records)
+
+
+def to_wire(records):
+    """Returns the records in the compact form sent to the browser."""
+    return [_record.to_wire() for _record in records]
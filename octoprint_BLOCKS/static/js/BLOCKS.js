@@ -119,8 +119,9 @@ $(function () {
                 if (data.type == "info") {
                     return;
                 }
-                if ((data.type = "WifiSetUp")) {
+                if (data.type == "WifiSetUp") {
                     self.get_network_list(data.message);
+                    return;
                 }
                 if (plugin != "BLOCKS" && data.type != "machine_info") {
                     return;
@@ -909,16 +910,19 @@ $(function () {
         self.network_list = ko.observableArray([]);
         self.get_network_list = function (data) {
             try {
-                if (data == null) return;
-                self.network_list.removeAll();
-                var aux = "";
-                for (var i = 0; i < data.length; i++) {
-                    if (aux === data[i]) continue;
-                    else {
-                        aux = data[i];
-                        self.network_list.push(data[i]);
-                    }
-                }
+                if (!Array.isArray(data)) return;
+                // [[ssid, signal, bands, security], ...] already merged by
+                // ssid and sorted by signal on the server
+                self.network_list(
+                    data.map(function (network) {
+                        return {
+                            ssid: network[0],
+                            signal: network[1],
+                            bands: network[2],
+                            security: network[3],
+                        };
+                    })
+                );
             } catch (e) {
                 ko.onError("Network list Getter error" + e);
             }
@@ -1,28 +1,100 @@
 # coding=utf-8
-import os
-import io
-import re
-import socket
-import shlex
+import time
+import threading
 import subprocess
 import logging
-from .python3wifi.iwlibs import Wireless, getWNICnames, getNICnames, Iwscan
+from concurrent.futures import ThreadPoolExecutor, wait
+from .python3wifi.iwlibs import getWNICnames
+from .backends import detect_backend, run_command
+from .scancache import ScanCache
+from .registry import NetworkRegistry, SavedNetwork
 
 # logging.basicConfig(filename="/home/pi/logs/wifisep.log", level=logging.DEBUG,
 #                     format='%(asctime)s %(levelname)s %(name)s %(message)s',)
 
 
+class InterfaceStatus(object):
+    """What a wireless interface is connected to.
+
+    Attributes:
+        interface (type: string): the wireless interface.
+        ssid (type: string): the network it's connected to, None if it isn't.
+        stats (type: dict): its link statistics, see NetworkBackend.stats().
+            None when it isn't connected.
+        error (type: Exception): why it couldn't be asked, None if it could.
+
+    """
+
+    def __init__(self, interface, ssid=None, stats=None, error=None):
+        self.interface = interface
+        self.ssid = ssid
+        self.stats = stats
+        self.error = error
+
+    @property
+    def connected(self):
+        return bool(self.ssid)
+
+    @property
+    def quality(self):
+        """The link quality (0-100), -1 when it isn't known."""
+        if not self.stats or self.stats.get("Quality") is None:
+            return -1
+        return self.stats["Quality"]
+
+    def __repr__(self):
+        return "InterfaceStatus(%s, ssid=%r, stats=%r, error=%r)" % (
+            self.interface, self.ssid, self.stats, self.error)
+
+
 class Wifisetup(object):
+    """Manages the wireless interfaces through the network backend.
+
+    Every wireless interface gets a backend and a scan cache of its own;
+    scans and statistics of all of them are asked for at once, on a small
+    thread pool, and come back per interface. One connected interface
+    drives the printer's M550 indicator, picked by `indicator_policy`:
+
+    - "primary": the backend's own interface when it's connected, else
+      the strongest connected one (an onboard radio with a USB dongle for
+      the webcam keeps reporting the onboard one),
+    - "strongest": the connected one with the best link quality,
+    - an interface name: only that interface.
 
-    def __init__(self):
+    Args:
+        backend (type: NetworkBackend): the backend of the primary
+            interface. Detected if None.
+
+    """
+
+    INDICATOR_POLICY = "primary"
+    # Interfaces asked at once
+    MAX_WORKERS = 4
+    # Seconds the interfaces may take to answer, all of them together
+    TIMEOUT = 30.0
+
+    def __init__(self, backend=None):
         self._psk = None
         self._ssid = None
         self._interfaces = []
-        self._wifi = None
-        self._os_name = self.run_command(
-            'cat /etc/os-release | grep "NAME=" ').decode(encoding="UTF-8")
-        # print("OS_NAME" + self._os_name)
         self.logger = logging.getLogger(__name__)
+        # Picked once, everything below just calls into it
+        self.backend = backend if backend is not None else detect_backend()
+        # Timer, API and monitor all read the scans from here
+        self.scan_cache = ScanCache(self.backend)
+        # What is already configured, so the same SSID isn't added twice
+        self.saved_networks = NetworkRegistry(self.backend)
+        self.indicator_policy = self.INDICATOR_POLICY
+        # interface -> its backend and scan cache, the primary's are above
+        self._backends = {self.backend.interface: self.backend}
+        self._scan_caches = {self.backend.interface: self.scan_cache}
+        # interface -> InterfaceStatus, from the last find_connection()
+        self._connections = {}
+        self._lock = threading.Lock()
+        # (function, interface) -> its last call, one at a time
+        self._calls = {}
+        self._pool = ThreadPoolExecutor(max_workers=self.MAX_WORKERS,
+                                        thread_name_prefix="BlocksWifi")
 
     def set_wifi_info(self, _ssid=None, _psk=None):
         """Setter for the ssid and password variables.
@@ -42,8 +114,6 @@ class Wifisetup(object):
 
     def select_wifi(self, _id=None):
         """Select a wifi network with a given id.
-            Run the select_network command from wpa_cli
-            on the wlan0 interface (wifi)
 
         Args:
             _id (type): id of the network to select. Defaults to None.
@@ -54,95 +124,85 @@ class Wifisetup(object):
         """
         if _id is None:
             return None
-        if "Raspbian" in self._os_name:
-            _output = self.run_command(
-                "wpa_cli -i wlan0 select_network %s" % _id)
-            _output = self.run_command("nmcli con ")
-            return _output.decode("UTF-8")
+        return self.backend.select_network(_id)
 
     def set_wifi_ssid_psk(self):
         """Adds a new network to the system and saves the new configuration.
-            This is done by running some shell commands.
+            A network that is already saved is updated instead.
+
+        Returns:
+            type: ApplyResult, truthy if it was successful at adding the
+                network, with the failure reason otherwise.
+
+        """
+        _existing = self.saved_networks.get(self._ssid)
+        _result = self.backend.add_network(self._ssid, self._psk,
+                                           existing=_existing)
+        if _result:
+            self.saved_networks.put(SavedNetwork(
+                self._ssid, _result.network_id,
+                _existing.priority if _existing is not None else 0,
+                time.time()))
+        return _result
+
+    def list_existing_networks(self):
+        """Get a list with all the already configured networks on the device.
 
         Returns:
-            type: boolean, True if it waas successful at adding the network False
-                otherwise.
+            type: List. SavedNetwork objects, highest priority first.
 
         """
-        if "Raspbian" in self._os_name:
-            _output = self.run_command("wpa_cli -i wlan0 add_network")
-            _network_id = _output.decode(encoding="UTF-8")
-            self.run_command(
-                'wpa_cli -i wlan0 set_network %s ssid "%s" ' % (_network_id, self._ssid))
-            self.run_command(
-                'wpa_cli -i wlan0 set_network %s psk "%s" ' % (_network_id, self._psk))
-            self.run_command(
-                "wpa_cli -i wlan0 enable_network %s" % (_network_id))
-            _pass = self.set_pass_encryp(
-                _id=_network_id, _ssid=self._ssid, _password=self._psk)
-            _returnSave = self.run_command("wpa_cli -i wlan0 save config")
-
-            return True if "OK" in _returnSave.decode(encoding="UTF-8") else False
-        elif "Debian" in self._os_name:
-            _output = self.run_command(
-                'nmcli dev wifi connect %s password "%s" ' % (self._ssid, self._psk)).decode(encoding="UTF-8")
-            if "\'wlan0\'successfully activated " in _output:
-                self.run_command("echo %s " % _output)
-                _output = self.run_command(
-                    "nmcli con up %s" % self._ssid
-                ).decode(encoding="UTF-8")
-
-            return True if "Connection successfully activated" in _output else False
-
-    def set_pass_encryp(self, _id=None, _ssid=None, _password=None):
-        """Runs shell command to get the encryption for a network password.
-            Using the wpa_passphrase command.
+        return self.saved_networks.networks()
+
+    def list_available_networks(self, force=False):
+        """Returns a list with all the networks from a BSS scan.
+            A new scan only happens when the cached one is stale.
+
         Args:
-            _id (type): if of the network. Defaults to None.
-            _ssid (type): ssid for the network. Defaults to None.
-            _password (type): password of the network(not encrypted). Defaults to None.
+            force (type: boolean): scan even if the cached results are fresh.
 
         Returns:
-            type: String, the encrypted password
+            type: List. ScanRecord objects, strongest signal first.
 
         """
-        if "Raspbian" not in self._os_name:
-            return ""
+        return self.scan_cache.get(force=force)
 
-        _regex = re.compile(r"psk=(...+)\n}$")
-        _output = self.run_command("wpa_passphrase %s %s" % (_ssid, _password))
-        _output_decoded = _output.decode(encoding="UTF-8").rstrip()
-        _encrypted_pass = re.findall(_regex, _output_decoded)
-        self.run_command("wpa_cli -i wlan0 set_network %s psk %s " %
-                         (_id, _encrypted_pass[0]))
-        return _encrypted_pass
+    def request_scan(self):
+        """Asks for a new BSS scan without waiting for it.
+            When the scan is done a CTRL-EVENT-SCAN-RESULTS event is sent
+            to any monitor started with start_monitor.
 
-    def list_existing_networks(self):
-        """Get a list with all the already configured networks on the device.
-            # ! (NOT WORKING)
         Returns:
-            type: List. A list with all configured networks.
+            type: boolean. True if the scan was accepted.
 
         """
-        _output = self.run_command("wpa_cli -i wlan0 list_networks")
-        return _output.decode(encoding="UTF-8").split("\n")
+        return self.backend.request_scan()
 
-    def list_available_networks(self):
-        """Requests a BSS scan and resturns a list with all the SSID from that scan.
+    def list_scanned_networks(self):
+        """Returns a list with all the networks from the last finished scan
+            and refreshes the scan cache with it.
 
         Returns:
-            type: List. A list with all the SSID found.
+            type: List. ScanRecord objects, strongest signal first.
 
         """
-        _network_scan_regex = re.compile(r"]\t(...+)\n")
-        _network = []
-        self.run_command("wpa_cli -i wlan0 scan")
-        _output = self.run_command("wpa_cli -i wlan0 scan_results")
-        # I have here the entire scan that was made for the networks
-        _output_decoded = _output.decode(encoding="UTF-8").rstrip()
-        _network = re.findall(_network_scan_regex, _output_decoded)
+        _network = self.backend.scan_results()
+        self.scan_cache.update(_network)
         return _network
 
+    def start_monitor(self, callback):
+        """Starts listening for scan and connection events.
+
+        Args:
+            callback (type: function): called with (event, text) for every
+                scan results, connected and disconnected event.
+
+        Returns:
+            type: The running monitor, None if the backend can't push events.
+
+        """
+        return self.backend.monitor(callback)
+
     def _wifi_strength_calc(self, signalLevel):
         """Calculate the wifi signal strenght.
             value = 4 ---> there is no connection
@@ -170,50 +230,210 @@ class Wifisetup(object):
         return _level
 
     def interfaces(self):
-        # if "Raspbian" in self._os_name:
-        #     self._interfaces = []
-        #     self._interfaces.append(getWNICnames())
-        #     print(self._interfaces)
-        # elif "Debian" in self._os_name:
-        self._interfaces = []
-        self._interfaces.extend(getWNICnames())
+        """Returns the wireless interfaces, the primary one first.
+            Interfaces given a backend with add_backend are included.
 
+        Returns:
+            type: List. Interface names.
+
+        """
+        with self._lock:
+            _others = set(getWNICnames()) | set(self._backends)
+        _others.discard(self.backend.interface)
+        self._interfaces = [self.backend.interface] + sorted(_others)
         return self._interfaces
 
-    def find_connection(self):
-        """Tries to find a connection to a given interface.
-            If there is a connection available returns the respective
-            interface and _ssid.
-            It also saves the handler for that connection in self._wifi
+    def add_backend(self, backend):
+        """Manages another interface with the given backend instead of
+            one like the primary's.
+
+        Args:
+            backend (type: NetworkBackend): the backend of its interface.
+
+        """
+        with self._lock:
+            self._backends[backend.interface] = backend
+            self._scan_caches.pop(backend.interface, None)
+
+    def backend_for(self, interface):
+        """Returns the backend managing an interface, made on first use.
+
+        Args:
+            interface (type: string): the wireless interface.
+
+        Returns:
+            type: NetworkBackend.
+
+        """
+        with self._lock:
+            _backend = self._backends.get(interface)
+            if _backend is None:
+                _backend = self.backend.for_interface(interface)
+                self._backends[interface] = _backend
+            return _backend
+
+    def _scan_cache_for(self, interface):
+        _backend = self.backend_for(interface)
+        with self._lock:
+            _cache = self._scan_caches.get(interface)
+            if _cache is None:
+                # Same freshness as the primary's
+                _cache = ScanCache(_backend, ttl=self.scan_cache.ttl,
+                                   max_staleness=self.scan_cache.max_staleness,
+                                   scan_time=self.scan_cache.scan_time,
+                                   poll_interval=self.scan_cache.poll_interval)
+                self._scan_caches[interface] = _cache
+            return _cache
+
+    def _each_interface(self, function, *args, timeout=None):
+        """Calls function(interface, *args) for every wireless interface
+            at once, and waits for them until a single deadline.
+
+            A call that misses it can't be stopped and keeps its worker, so
+            the interface isn't asked again until that call is over: a hung
+            interface holds one worker, not one more on every tick.
+
+        Args:
+            timeout (type: float): seconds to wait for all of them.
+                Defaults to TIMEOUT.
+
+        Returns:
+            type: dict. interface -> (result, None), or (None, exception)
+                when it raised, missed the deadline or is still running.
+
+        """
+        _timeout = self.TIMEOUT if timeout is None else timeout
+        _interfaces = self.interfaces()
+        _futures = {}
+        with self._lock:
+            for _interface in _interfaces:
+                _key = (function, _interface)
+                _future = self._calls.get(_key)
+                if _future is None or _future.done():
+                    _future = self._pool.submit(function, _interface, *args)
+                    self._calls[_key] = _future
+                    _futures[_interface] = _future
+        _done, _ = wait(_futures.values(), timeout=_timeout)
+        _results = {}
+        for _interface in _interfaces:
+            _future = _futures.get(_interface)
+            if _future is None:
+                _error = TimeoutError(
+                    "%s is still answering the last call" % _interface)
+            elif _future not in _done:
+                # Never run if it hasn't started yet
+                _future.cancel()
+                _error = TimeoutError(
+                    "%s didn't answer in %.1f s" % (_interface, _timeout))
+            else:
+                _error = _future.exception()
+            if _error is not None:
+                self.logger.warning("%s failed: %r", _interface, _error)
+                _results[_interface] = (None, _error)
+            else:
+                _results[_interface] = (_future.result(), None)
+        return _results
+
+    def scan_interfaces(self, force=False):
+        """Returns the networks every wireless interface sees, scanning
+            them at once. Each interface has its own scan cache.
+
+        Args:
+            force (type: boolean): scan even if the cached results are fresh.
+
+        Returns:
+            type: dict. interface -> List of ScanRecord objects, strongest
+                signal first. Empty for an interface that couldn't scan.
+
+        """
+        _results = self._each_interface(self._interface_scan, force)
+        return {_interface: _networks or []
+                for _interface, (_networks, _error) in _results.items()}
+
+    def _interface_scan(self, interface, force=False):
+        return self._scan_cache_for(interface).get(force)
+
+    def connections(self, timeout=None):
+        """Asks every wireless interface what it's connected to, at once.
+
+        Args:
+            timeout (type: float): seconds to wait for the answers.
+                Defaults to TIMEOUT.
+
+        Returns:
+            type: dict. interface -> InterfaceStatus, primary first.
+
+        """
+        _results = self._each_interface(self._interface_status,
+                                        timeout=timeout)
+        _connections = {}
+        for _interface, (_status, _error) in _results.items():
+            _connections[_interface] = _status or InterfaceStatus(
+                _interface, error=_error)
+        self._connections = _connections
+        return _connections
+
+    def _interface_status(self, interface):
+        _backend = self.backend_for(interface)
+        _status = InterfaceStatus(interface, _backend.status(interface))
+        if _status.connected:
+            _status.stats = _backend.stats(interface)
+        return _status
+
+    def indicator_interface(self, connections):
+        """Picks the connection that drives the M550 indicator, following
+            indicator_policy.
+
+        Args:
+            connections (type: dict): interface -> InterfaceStatus.
 
         Returns:
-            type: touple with (<interface_name>,<ssid>)
+            type: InterfaceStatus, None if no interface fits.
+
+        """
+        _policy = self.indicator_policy or self.INDICATOR_POLICY
+        _connected = [_status for _status in connections.values()
+                      if _status.connected]
+        if _policy not in ("primary", "strongest"):
+            _status = connections.get(_policy)
+            return _status if _status is not None and _status.connected \
+                else None
+        if _policy == "primary":
+            _primary = connections.get(self.backend.interface)
+            if _primary is not None and _primary.connected:
+                return _primary
+        if not _connected:
+            return None
+        # max keeps the first of equals, the primary comes first
+        return max(_connected, key=lambda _status: _status.quality)
+
+    def find_connection(self, timeout=None):
+        """Tries to find a connection on the wireless interfaces.
+            If there is one returns the interface driving the indicator
+            (see indicator_policy) and its _ssid.
 
-        Raises:
-            ExceptionName: Exception. Failed to test the interface.
+        Args:
+            timeout (type: float): seconds to wait for the interfaces.
+                Defaults to TIMEOUT.
+
+        Returns:
+            type: touple with (<interface_name>,<ssid>), None if no
+                interface is connected.
 
         """
-        self.interfaces()
-
-        for _interface in self._interfaces:
-            if _interface is not None:
-                try:
-                    self._wifi = Wireless(_interface)
-                    if "Raspbian" in self._os_name:
-                        _ssid = self._wifi.getEssid()
-                    elif "Debian" in self._os_name:
-                        _ssid = self.run_command(
-                            "nmcli -t -f NAME connection show --active").decode(encoding="UTF-8").strip()
-
-                    if _ssid:
-                        # Means there is a _ssid available
-                        # We can assume there is internet
-                        return (_interface, _ssid)
-                except Exception as e:
-                    pass
+        _connections = self.connections(timeout)
+        for _status in _connections.values():
+            if _status.connected:
+                # Means there is a _ssid available
+                # We can assume there is internet
+                self.saved_networks.mark_connected(_status.ssid)
+        _status = self.indicator_interface(_connections)
+        if _status is not None:
+            return (_status.interface, _status.ssid)
 
     def get_connection_stats(self, _stats=None):
         """Get the network statistics for the current active network connection.
+            Those read by the last find_connection are reused.
 
         Args:
             _stats (type: dict): A dictionary. Defaults to None.
@@ -225,89 +445,51 @@ class Wifisetup(object):
         if _stats["Interface"] is None:
             return None
 
-        if "Raspbian" in self._os_name:
-            _, quality, _, _ = self._wifi.getStatistics()
-            _stats["Quality"] = quality.quality
-            _stats["Signal"] = quality.siglevel
-            _stats["WifiLevel"] = self._wifi_strength_calc(
-                signalLevel=_stats["Quality"])
-        elif "Debian" in self._os_name:
-            _wifiStrength = self.run_command(
-                "nmcli -f IN-USE,SIGNAL,SSID device wifi | awk \'/^\*/{if (NR!=1) {print $2}}\'").decode(encoding="UTF-8").strip()
-            _stats["WifiLevel"] = self._wifi_strength_calc(
-                signalLevel=int(_wifiStrength))
+        _status = self._connections.get(_stats["Interface"])
+        if _status is not None and _status.stats is not None:
+            _stats.update(_status.stats)
+        else:
+            _stats.update(self.backend_for(_stats["Interface"]).stats(
+                _stats["Interface"]))
+        _stats["WifiLevel"] = self._wifi_strength_calc(
+            signalLevel=_stats["Quality"])
 
         return _stats
 
-    HOSTS_FILE_PATH = "/etc/hosts"
-    HOSTNAME_FILE_PATH = "/etc/hostname"
-    HOST_LINE_PREFIX = '127.0.1.1 '
+    def shutdown(self):
+        """Stops the workers asking the interfaces."""
+        self._pool.shutdown(wait=False)
 
     def hostnameChange(self, newHostname):
         """
-        Changes the hostname in the /etc/hosts file and on the hostnamectl
+        Changes the hostname in the /etc/hosts file and on the hostnamectl.
+        Takes effect right away, the machine isn't rebooted.
 
         Arguments:
             String - The new hostname to be set to
+
+        Returns:
+            type: boolean, True if the hostname was changed.
         """
         if newHostname is None or not isinstance(newHostname, str):
-            return
+            return False
 
-        # @ Change the hostname with hostnamectl first
-        try:
-            _response = self.run_command(
-                f"sudo hostnamectl set-hostname {newHostname.strip()}")
-            self.logger.info(
-                f"Hostname Change command, Response : {_response}")
-        except IOError as error:
-            self.logger.error(
-                f"Failed to update /etc/hostname, error: {error}")
-
-        # @ Change the hostname in the /etc/hosts file
-        _newFile = []
-        try:
-            with io.open(self.HOSTS_FILE_PATH, "r+", encoding="utf-8") as _fileHandle:
-                _lines = _fileHandle.readlines()
-                _newFile = [line.replace(line[10:], newHostname+"\n")
-                            if self.HOST_LINE_PREFIX in line else line for line in _lines]
-                _fileHandle.seek(0)
-                _fileHandle.write(
-                    ''.join(_newFile)
-                )
-        except IOError as error:
-            self.logger.error(
-                f"Failed to update /etc/hosts file, error: {error}")
-
-        self.run_command("sudo reboot")
-
-        return
+        return self.backend.set_hostname(newHostname)
 
     def getMachineHostname(self):
         try:
-            return socket.gethostname()
+            return self.backend.hostname()
         except subprocess.SubprocessError as error:
             self.logger.error(f"Failed to run commad {error}")
 
     def run_command(self, command):
-        """Runs a shell command.
+        """Runs a command, without a shell.
 
         Args:
-            command (type: string): The command to be executed .
+            command (type: list): The program and its arguments.
 
         Returns:
             type: The complete output that resulted from the command.
 
         """
-        try:
-            # * Old way, it didn't let me use grep commands or use | on the command
-            # cmd = shlex.split(command,posix=False)
-            # exec = cmd[0]
-            # exec_options = cmd[1:]
-            # output = subprocess.run(
-            #     ([exec] + exec_options), capture_output=True)
-            p = subprocess.Popen(
-                command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            output, e = p.communicate()
-            return output
-        except subprocess.SubprocessError:
-            self.logger.error('Error running commas : %s', command)
+        return run_command(command)
@@ -0,0 +1,228 @@
+# coding=utf-8
+import errno
+import time
+import socket
+import asyncio
+import threading
+import logging
+from concurrent.futures import Future
+
+from .netlink import NetlinkSource, RTMGRP_LINK, parse_messages
+from .python3wifi import flags as wififlags
+from .python3wifi.iwlibs import Iwscan
+
+
+class _PendingScan(object):
+
+    __slots__ = ("ifname", "index", "scan", "future", "deadline", "due")
+
+    def __init__(self, ifname, index, scan, future, deadline, due):
+        self.ifname = ifname
+        self.index = index
+        self.scan = scan
+        self.future = future
+        self.deadline = deadline
+        self.due = due
+
+
+class AsyncScanner(object):
+    """Runs wireless extension scans without a thread blocked on each one.
+
+    scan() triggers the scan and returns a Future right away. One thread
+    serves every scan in progress: it reads the results as soon as the
+    kernel's scan-complete event (SIOCGIWSCAN over rtnetlink) arrives for
+    the interface, and polls every `poll_interval` seconds in case the
+    event never comes. A scan that isn't done by its deadline fails with
+    TimeoutError, a cancelled Future is dropped. The thread only runs
+    while there are scans.
+
+    >>> scanner = AsyncScanner()
+    >>> for result in scanner.scan("wlan0").result():
+    ...     print(result.essid)
+
+    Args:
+        channel (type: IoctlChannel): the ioctl transport, anything with
+            an ioctl(request, args) method. Defaults to the shared channel.
+        source (type: NetlinkSource): where the scan-complete events come
+            from. Defaults to the kernel; False polls only.
+        poll_interval (type: float): seconds between fallback polls.
+
+    """
+
+    # Seconds a scan may take
+    DEADLINE = 10.0
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, channel=None, source=None,
+                 poll_interval=POLL_INTERVAL):
+        self.channel = channel
+        if source is None:
+            source = NetlinkSource(groups=RTMGRP_LINK)
+        self.source = source or None
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+        self._listening = False
+        self.logger = logging.getLogger(__name__)
+
+    def scan(self, ifname, deadline=None):
+        """Starts a scan.
+
+        A scan already running on the interface is joined instead of
+        triggering another one.
+
+        Args:
+            ifname (type: string): the wireless interface.
+            deadline (type: float): seconds the scan may take, DEADLINE by
+                default.
+
+        Returns:
+            type: concurrent.futures.Future. Resolves to the list of
+                Iwscanresult objects, or fails with the OSError of the
+                ioctl, TimeoutError past the deadline.
+
+        """
+        _future = Future()
+        _now = time.monotonic()
+        _deadline = _now + (self.DEADLINE if deadline is None else deadline)
+        with self._lock:
+            _running = [_pending for _pending in self._pending
+                        if _pending.ifname == ifname]
+            try:
+                if _running:
+                    _scan = _running[0].scan
+                else:
+                    # Listen before triggering, the event can't be missed
+                    self._start()
+                    _scan = Iwscan(ifname, fullscan=False,
+                                   channel=self.channel)
+                    _scan.trigger()
+            except OSError as error:
+                _future.set_exception(error)
+                return _future
+            self._pending.append(_PendingScan(
+                ifname, self._index(ifname), _scan, _future, _deadline,
+                min(_now + self.poll_interval, _deadline)))
+        return _future
+
+    async def scan_async(self, ifname, deadline=None):
+        """Awaitable scan(), cancelling the task cancels the scan."""
+        return await asyncio.wrap_future(self.scan(ifname, deadline))
+
+    def stop(self):
+        """Cancels every scan in progress, the thread ends with them."""
+        with self._lock:
+            for _pending in self._pending:
+                _pending.future.cancel()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        if self.source is not None:
+            try:
+                self.source.open()
+                self._listening = True
+            except OSError as error:
+                self.logger.info("No scan events, polling: %s", error)
+        self._thread = threading.Thread(target=self._run,
+                                        name="BlocksAsyncScanner")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._pending = [_pending for _pending in self._pending
+                                 if not _pending.future.cancelled()]
+                if not self._pending:
+                    if self._listening:
+                        self.source.close()
+                        self._listening = False
+                    self._thread = None
+                    return
+                _timeout = max(0.0, min(_pending.due for _pending in
+                                        self._pending) - time.monotonic())
+            self._service(self._wait(_timeout))
+
+    def _wait(self, timeout):
+        """Waits for scan-complete events.
+
+        Returns:
+            type: Set. Indexes and names of the interfaces whose scan
+                finished, None if events were lost and every scan has to
+                be checked.
+
+        """
+        if not self._listening:
+            time.sleep(timeout)
+            return set()
+        try:
+            _data = self.source.recv(timeout)
+        except OSError as error:
+            if error.errno == errno.ENOBUFS:
+                return None
+            self.logger.warning("Stopped listening for scan events: %s",
+                                error)
+            self.source.close()
+            self._listening = False
+            return set()
+        _done = set()
+        if _data:
+            for _event in parse_messages(_data):
+                if wififlags.SIOCGIWSCAN in _event.wireless:
+                    _done.update((_event.index, _event.name))
+        return _done
+
+    def _service(self, done):
+        _now = time.monotonic()
+        with self._lock:
+            _pending = list(self._pending)
+        _finished = set()
+        for _scan in _pending:
+            if _scan.future.done():
+                continue
+            if _scan.scan in _finished:
+                continue
+            if done is not None and _now < _scan.due and \
+                    _scan.index not in done and _scan.ifname not in done:
+                continue
+            try:
+                _ready = _scan.scan.poll()
+                # Parsed now, a malformed stream fails this scan only
+                _results = _scan.scan.aplist if _ready else None
+            except (OSError, ValueError, RuntimeError) as error:
+                self._resolve(_scan, error=error)
+                continue
+            if _ready:
+                _finished.add(_scan.scan)
+                self._resolve(_scan, result=_results)
+            elif _now >= _scan.deadline:
+                self._resolve(_scan, error=OSError(
+                    errno.ETIMEDOUT,
+                    "scan on %s did not finish" % _scan.ifname))
+            else:
+                _scan.due = min(_now + self.poll_interval, _scan.deadline)
+        # Everyone waiting on a scan that just finished gets its results
+        for _scan in _pending:
+            if _scan.scan in _finished and not _scan.future.done():
+                self._resolve(_scan, result=_scan.scan.aplist)
+        with self._lock:
+            self._pending = [_scan for _scan in self._pending
+                             if not _scan.future.done()]
+
+    def _resolve(self, scan, result=None, error=None):
+        # Once running the future can't be cancelled under our feet
+        if not scan.future.set_running_or_notify_cancel():
+            return
+        if error is not None:
+            scan.future.set_exception(error)
+        else:
+            scan.future.set_result(result)
+
+    @staticmethod
+    def _index(ifname):
+        try:
+            return socket.if_nametoindex(ifname)
+        except OSError:
+            return None
@@ -0,0 +1,254 @@
+# coding=utf-8
+import os
+import errno
+import select
+import socket
+import tempfile
+import threading
+import itertools
+import logging
+
+WPA_CTRL_DIR = "/var/run/wpa_supplicant"
+
+# Size of the biggest reply wpa_supplicant sends (SCAN_RESULTS on a busy site)
+WPA_CTRL_BUFSIZE = 65536
+
+_counter = itertools.count()
+
+
+class WpaCtrlError(Exception):
+    """Raised when wpa_supplicant can't be reached or doesn't answer."""
+
+
+class WpaCtrl(object):
+    """Persistent client for the wpa_supplicant control interface.
+
+    Talks to the Unix datagram socket wpa_supplicant creates for each
+    interface (/var/run/wpa_supplicant/<ifname>), the same one wpa_cli
+    uses, but keeps it open between requests instead of forking a new
+    wpa_cli for every command.
+
+    Requests are serialised, every reply is matched to the request that
+    was sent before it and the socket is reopened transparently when
+    wpa_supplicant is restarted.
+
+    Args:
+        interface (type: string): the interface to control. Defaults to wlan0.
+        ctrl_dir (type: string): wpa_supplicant's ctrl_interface directory.
+        timeout (type: float): seconds to wait for a reply.
+
+    """
+
+    def __init__(self, interface="wlan0", ctrl_dir=WPA_CTRL_DIR, timeout=10.0):
+        self.interface = interface
+        self.ctrl_path = os.path.join(ctrl_dir, interface)
+        self.timeout = timeout
+        self._sock = None
+        self._local_path = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def open(self):
+        """Opens the control socket if it isn't already open.
+
+        Raises:
+            WpaCtrlError: wpa_supplicant isn't listening on ctrl_path.
+
+        """
+        if self._sock is not None:
+            return
+        _local_path = os.path.join(
+            tempfile.gettempdir(),
+            "wpa_ctrl_%d-%d" % (os.getpid(), next(_counter)))
+        _sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            _sock.bind(_local_path)
+            _sock.connect(self.ctrl_path)
+        except OSError as error:
+            _sock.close()
+            self._unlink(_local_path)
+            raise WpaCtrlError(
+                "Can't connect to %s: %s" % (self.ctrl_path, error))
+        self._sock = _sock
+        self._local_path = _local_path
+
+    def close(self):
+        """Closes the control socket and removes the local socket file."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._local_path is not None:
+            self._unlink(self._local_path)
+            self._local_path = None
+
+    def request(self, command):
+        """Sends a command and returns its reply.
+
+        If the socket went stale (wpa_supplicant restarted) it is reopened
+        and the command is sent one more time.
+
+        Args:
+            command (type: string): a wpa_supplicant control command, e.g. SCAN.
+
+        Returns:
+            type: String. The reply without the trailing newline.
+
+        Raises:
+            WpaCtrlError: wpa_supplicant is down or didn't answer in time.
+
+        """
+        with self._lock:
+            try:
+                return self._request(command)
+            except (ConnectionRefusedError, FileNotFoundError, BrokenPipeError):
+                self.logger.debug(
+                    "wpa_supplicant control socket went away, reconnecting")
+            except OSError as error:
+                if error.errno not in (errno.ENOTCONN, errno.ECONNRESET):
+                    raise WpaCtrlError(
+                        "%s failed: %s" % (command.split(" ", 1)[0], error))
+            self.close()
+            try:
+                return self._request(command)
+            except OSError as error:
+                self.close()
+                raise WpaCtrlError(
+                    "%s failed: %s" % (command.split(" ", 1)[0], error))
+
+    def _request(self, command):
+        self.open()
+        self._drain()
+        self._sock.send(command.encode("utf-8"))
+        while True:
+            _ready, _, _ = select.select([self._sock], [], [], self.timeout)
+            if not _ready:
+                # Start over on a fresh socket next time so a late reply
+                # can't be taken for the answer to another request
+                self.close()
+                raise WpaCtrlError("Timed out waiting for %s reply" %
+                                   command.split(" ", 1)[0])
+            _reply = self._sock.recv(WPA_CTRL_BUFSIZE)
+            # Unsolicited "<level>EVENT" messages aren't our reply
+            if _reply.startswith(b"<"):
+                continue
+            return _reply.decode("utf-8", "replace").rstrip("\n")
+
+    def _drain(self):
+        """Drops replies to earlier requests that timed out."""
+        while True:
+            _ready, _, _ = select.select([self._sock], [], [], 0)
+            if not _ready:
+                return
+            self._sock.recv(WPA_CTRL_BUFSIZE)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class WpaMonitor(threading.Thread):
+    """Listens for wpa_supplicant events on an ATTACHed control socket.
+
+    Runs in its own daemon thread and calls callback(event, text) for
+    every event in `events`, e.g. ("CTRL-EVENT-SCAN-RESULTS", ""). When
+    wpa_supplicant isn't running, or restarts, it keeps re-attaching
+    every `retry_interval` seconds.
+
+    Args:
+        callback (type: function): called with the event name and the rest
+            of the event line.
+        interface (type: string): the interface to monitor. Defaults to wlan0.
+        events (type: iterable): event names to report, all of them if None.
+
+    """
+
+    SCAN_RESULTS = "CTRL-EVENT-SCAN-RESULTS"
+    CONNECTED = "CTRL-EVENT-CONNECTED"
+    DISCONNECTED = "CTRL-EVENT-DISCONNECTED"
+
+    def __init__(self, callback, interface="wlan0", ctrl_dir=WPA_CTRL_DIR,
+                 events=(SCAN_RESULTS, CONNECTED, DISCONNECTED),
+                 retry_interval=5.0, ping_interval=30.0):
+        threading.Thread.__init__(self, name="WpaMonitor-%s" % interface)
+        self.daemon = True
+        self.callback = callback
+        self.events = frozenset(events) if events is not None else None
+        self.retry_interval = retry_interval
+        self.ping_interval = ping_interval
+        self._ctrl = WpaCtrl(interface, ctrl_dir=ctrl_dir, timeout=2.0)
+        self._stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def stop(self):
+        """Detaches from wpa_supplicant and ends the thread."""
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._attach()
+                self._listen()
+            except (WpaCtrlError, OSError) as error:
+                self.logger.debug("wpa_supplicant monitor: %s", error)
+            if self._stop_event.is_set():
+                # Still attached, _detach says goodbye on this socket
+                break
+            self._ctrl.close()
+            self._stop_event.wait(self.retry_interval)
+        self._detach()
+
+    def _attach(self):
+        if self._ctrl.request("ATTACH") != "OK":
+            raise WpaCtrlError("ATTACH refused")
+        self.logger.debug("Attached to %s", self._ctrl.ctrl_path)
+
+    def _detach(self):
+        if self._ctrl.connected:
+            try:
+                self._ctrl.request("DETACH")
+            except WpaCtrlError:
+                pass
+        self._ctrl.close()
+
+    def _listen(self):
+        _sock = self._ctrl._sock
+        _idle = 0.0
+        while not self._stop_event.is_set():
+            # Wake up every second to notice stop()
+            _ready, _, _ = select.select([_sock], [], [], 1.0)
+            if not _ready:
+                _idle += 1.0
+                if _idle >= self.ping_interval:
+                    # Sending fails with ECONNREFUSED once the
+                    # wpa_supplicant we attached to is gone
+                    _sock.send(b"PING")
+                    _idle = 0.0
+                continue
+            _idle = 0.0
+            _message = _sock.recv(WPA_CTRL_BUFSIZE).decode("utf-8", "replace")
+            if _message.startswith("<"):
+                self._dispatch(_message)
+
+    def _dispatch(self, message):
+        # "<3>CTRL-EVENT-CONNECTED - Connection to ..." -> event, text
+        _event, _, _text = message.partition(">")[2].partition(" ")
+        if self.events is not None and _event not in self.events:
+            return
+        try:
+            self.callback(_event, _text.strip())
+        except Exception:
+            self.logger.exception("Error handling %s", _event)
@@ -0,0 +1,25 @@
+# coding=utf-8
+"""Benchmarks, run one with e.g. `python -m tests.benchmarks.scanresults`
+from the repository root. pytest doesn't collect them.
+"""
+import timeit
+
+
+def per_call(function, repeat=5):
+    """Returns the best of `repeat` runs of function, in seconds per call."""
+    _timer = timeit.Timer(function)
+    _number, _ = _timer.autorange()
+    return min(_timer.repeat(repeat, _number)) / _number
+
+
+def report(title, rows, header):
+    """Prints rows (tuples) under a title and a header, right-aligned."""
+    print(title)
+    _widths = [max(len(str(_value)) for _value in _column)
+               for _column in zip(header, *rows)]
+    print("  ".join(_column.rjust(_width)
+                    for _column, _width in zip(header, _widths)))
+    for _row in rows:
+        print("  ".join(str(_value).rjust(_width)
+                        for _value, _width in zip(_row, _widths)))
+    print()
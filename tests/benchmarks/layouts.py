@@ -0,0 +1,106 @@
+# coding=utf-8
+"""Per-call cost of the precompiled wireless extension layouts.
+
+"before" repeats what the code did without them: the iw_range format
+string built by concatenation for every Iwrange, struct.calcsize and
+struct.unpack with ad-hoc format strings on slices of the buffer. "after"
+is the current code on the same bytes.
+"""
+import struct
+
+from octoprint_BLOCKS.python3wifi import flags, layouts
+from octoprint_BLOCKS.python3wifi.iwlibs import Iwquality, Iwrange, Iwstats
+
+from ..scan_stream import stream
+from ..wireless_range import DriverChannel, range_data, stats_data
+from . import per_call, report
+
+
+def range_format():
+    return ("IIIHB6Ii4B4BB"
+            + flags.IW_MAX_BITRATES * "i"
+            + "2i2i2i2i3H"
+            + flags.IW_MAX_ENCODING_SIZES * "H"
+            + "2BBHB"
+            + flags.IW_MAX_TXPOWER * "i"
+            + "2B3H2i2iHB"
+            + flags.IW_MAX_FREQUENCIES * "ihBB"
+            + "IiiHiI")
+
+
+def range_before(data):
+    return struct.unpack_from(range_format(), data)
+
+
+def stats_before(data):
+    return struct.unpack_from("2BBbbB6i", data)
+
+
+def events_before(data):
+    """Event headers, frequency and quality of a stream, sliced."""
+    _values = []
+    while len(data) >= flags.IW_EV_LCP_PK_LEN:
+        _length, _cmd = struct.unpack("HH", data[:flags.IW_EV_LCP_PK_LEN])
+        if _length < flags.IW_EV_LCP_PK_LEN:
+            break
+        _body = data[flags.IW_EV_LCP_PK_LEN:_length]
+        if _cmd == flags.SIOCGIWFREQ:
+            _size = struct.calcsize("ihbb")
+            _values.append(struct.unpack("ihbb", _body[:_size]))
+        elif _cmd == flags.IWEVQUAL:
+            _values.append(struct.unpack("BbbB", _body[:4]))
+        data = data[_length:]
+    return _values
+
+
+def events_after(data):
+    _values = []
+    _header = layouts.IW_EVENT_HEADER
+    _offset = 0
+    _end = len(data)
+    while _offset + flags.IW_EV_LCP_PK_LEN <= _end:
+        _length, _cmd = _header.unpack_from(data, _offset)
+        if _length < flags.IW_EV_LCP_PK_LEN:
+            break
+        _body = _offset + flags.IW_EV_LCP_PK_LEN
+        if _cmd == flags.SIOCGIWFREQ:
+            _values.append(layouts.IW_FREQ.unpack_from(data, _body))
+        elif _cmd == flags.IWEVQUAL:
+            _values.append(layouts.IW_QUALITY.unpack_from(data, _body))
+        _offset += _length
+    return _values
+
+
+def main():
+    _range = range_data()
+    _stats = stats_data()
+    _channel = DriverChannel({flags.SIOCGIWRANGE: _range,
+                              flags.SIOCGIWSTATS: _stats})
+    _events = stream(60)
+    assert events_before(_events) == events_after(_events)
+    _quality = Iwquality()
+    _rows = [
+        ("iw_range unpack", per_call(lambda: range_before(_range)),
+         per_call(lambda: layouts.IW_RANGE.unpack_from(_range))),
+        ("iw_statistics unpack", per_call(lambda: stats_before(_stats)),
+         per_call(lambda: layouts.IW_STATISTICS.unpack_from(_stats))),
+        ("iw_quality parse",
+         per_call(lambda: struct.unpack("BbbB", _stats[2:6])),
+         per_call(lambda: _quality.parse(_stats, 2))),
+        ("60 BSS event walk", per_call(lambda: events_before(_events)),
+         per_call(lambda: events_after(_events))),
+    ]
+    report("Struct layouts, us per call",
+           [(_name, "%.2f" % (_before * 1e6), "%.2f" % (_after * 1e6))
+            for _name, _before, _after in _rows],
+           ("layout", "before us", "after us"))
+    report("Whole objects, us per call (after only)", [
+        ("Iwrange", "%.2f" % (per_call(
+            lambda: Iwrange("wlan0", _channel)) * 1e6)),
+        ("Iwstats", "%.2f" % (per_call(
+            lambda: Iwstats("wlan0", _channel)) * 1e6)),
+    ], ("object", "us"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# coding=utf-8
+"""Memory a scan's results take, in bytes per access point, measured with
+tracemalloc on synthetic SIOCGIWSCAN streams.
+
+"parsed" holds the results without touching them, "essid+signal" has
+decoded what the plugin reads, "all fields" has decoded everything, which
+is what every result cost when all of it was decoded up front (more
+then, those results also had a __dict__). The stream itself isn't
+counted.
+"""
+import gc
+import tracemalloc
+
+from octoprint_BLOCKS.python3wifi import flags
+from octoprint_BLOCKS.python3wifi.iwlibs import Iwscan, Iwscanresult
+
+from ..scan_stream import stream
+from ..wireless_range import DriverChannel, range_data
+from . import report
+
+CELLS = (100, 1000, 5000)
+
+
+def read_basic(results):
+    for _result in results:
+        _result.essid
+        _result.getSignal()
+
+
+def read_all(results):
+    for _result in results:
+        for _name in Iwscanresult.__slots__:
+            getattr(_result, _name)
+
+
+def bytes_per_ap(scan, data, read=None):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _results = list(scan._iterParse(data))
+        if read is not None:
+            read(_results)
+        _size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return _size // len(_results)
+
+
+def main():
+    _scan = Iwscan("wlan0", fullscan=False, netlink=False,
+                   channel=DriverChannel({flags.SIOCGIWRANGE: range_data()}))
+    _rows = []
+    for _cells in CELLS:
+        _data = stream(_cells)
+        _rows.append((_cells, bytes_per_ap(_scan, _data),
+                      bytes_per_ap(_scan, _data, read_basic),
+                      bytes_per_ap(_scan, _data, read_all)))
+    report("Scan results, bytes per access point", _rows,
+           ("cells", "parsed", "essid+signal", "all fields"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# coding=utf-8
+"""Scan stream parsing over synthetic SIOCGIWSCAN buffers of 10 to 5000
+cells.
+
+"sliced" is the walk the parser used to do, copying the rest of the
+stream after every event (data = data[length:]), with no results built.
+"parse" finds every result's span, "essid+signal" also decodes what the
+plugin reads, and "strongest" is Iwscan.strongest(10).
+"""
+import sys
+
+from octoprint_BLOCKS.python3wifi import flags
+from octoprint_BLOCKS.python3wifi.iwlibs import Iwscan, layouts
+
+from ..scan_stream import stream
+from ..wireless_range import DriverChannel, range_data
+from . import per_call, report
+
+CELLS = (10, 100, 1000, 5000)
+
+
+def sliced(data):
+    _events = 0
+    while len(data) >= flags.IW_EV_LCP_PK_LEN:
+        _length, _ = layouts.IW_EVENT_HEADER.unpack(
+            data[:flags.IW_EV_LCP_PK_LEN])
+        if _length < flags.IW_EV_LCP_PK_LEN:
+            break
+        data[flags.IW_EV_LCP_PK_LEN:_length]
+        _events += 1
+        data = data[_length:]
+    return _events
+
+
+def scanner(data):
+    _scan = Iwscan("wlan0", fullscan=False, netlink=False,
+                   channel=DriverChannel({flags.SIOCGIWRANGE: range_data()}))
+    _scan.stream = data
+    return _scan
+
+
+def read(scan):
+    for _result in scan.results():
+        _result.essid
+        _result.getSignal()
+
+
+def main(cells=CELLS):
+    _rows = []
+    for _cells in cells:
+        _data = stream(_cells)
+        _scan = scanner(_data)
+        # The quadratic walk takes seconds on the largest buffers
+        _repeat = 1 if _cells >= 1000 else 5
+        _rows.append((_cells, len(_data) // 1024) + tuple(
+            "%.2f" % (_seconds * 1e3) for _seconds in (
+                per_call(lambda: sliced(_data), _repeat),
+                per_call(lambda: list(_scan._iterParse(_data))),
+                per_call(lambda: read(_scan)),
+                per_call(lambda: _scan.strongest(10)))))
+    report("Scan streams, ms per parse", _rows,
+           ("cells", "KiB", "sliced", "parse", "essid+signal", "strongest"))
+
+
+if __name__ == "__main__":
+    main(tuple(int(_cells) for _cells in sys.argv[1:]) or CELLS)
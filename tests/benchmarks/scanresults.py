@@ -0,0 +1,67 @@
+# coding=utf-8
+"""SCAN_RESULTS parsing on synthetic wpa_supplicant dumps.
+
+Compares parse_scan_results + to_wire with the regex the plugin used
+before, which kept one bare SSID per BSS, by time per parse and by the
+size of the JSON message sent to the browser.
+"""
+import json
+import random
+import re
+
+from octoprint_BLOCKS.scanresults import parse_scan_results, to_wire
+
+from . import per_call, report
+
+HEADER = "bssid / frequency / signal level / flags / ssid\n"
+FLAGS = ("[WPA2-PSK-CCMP][ESS]", "[WPA2-PSK-CCMP][WPS][ESS]",
+         "[WPA2-SAE-CCMP][ESS]", "[ESS]", "[WEP][ESS]")
+FREQUENCIES = (2412, 2437, 2462, 5180, 5240, 5500, 5745)
+
+_OLD_REGEX = re.compile(r"]\t(...+)\n")
+
+
+def dump(bsses, networks=None, seed=1):
+    """Returns a SCAN_RESULTS reply of `bsses` lines over `networks`
+    SSIDs (a third of bsses by default, so most are seen several times),
+    some hidden and some escaped the way wpa_supplicant prints them.
+    """
+    _random = random.Random(seed)
+    _networks = networks or max(1, bsses // 3)
+    _lines = [HEADER.rstrip("\n")]
+    for _index in range(bsses):
+        _network = _random.randrange(_networks)
+        if _network % 17 == 16:
+            _ssid = ""
+        elif _network % 11 == 10:
+            _ssid = "Caf\\xc3\\xa9 %d" % _network
+        else:
+            _ssid = "Network %d" % _network
+        _lines.append("%02x:11:22:33:%02x:%02x\t%d\t%d\t%s\t%s" % (
+            _index & 0xff, _index >> 8 & 0xff, _network & 0xff,
+            _random.choice(FREQUENCIES), _random.randint(-92, -30),
+            _random.choice(FLAGS), _ssid))
+    return "\n".join(_lines)
+
+
+def old_parse(text):
+    return _OLD_REGEX.findall(text + "\n")
+
+
+def main():
+    _rows = []
+    for _bsses in (20, 60, 200, 1000):
+        _text = dump(_bsses)
+        _old = per_call(lambda: old_parse(_text))
+        _new = per_call(lambda: to_wire(parse_scan_results(_text)))
+        _rows.append((
+            _bsses, "%.1f" % (_old * 1e6), "%.1f" % (_new * 1e6),
+            len(json.dumps(old_parse(_text))),
+            len(json.dumps(to_wire(parse_scan_results(_text))))))
+    report("SCAN_RESULTS dumps, us per parse and JSON bytes per message",
+           _rows, ("BSSes", "regex us", "records us", "regex B",
+                   "records B"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# coding=utf-8
+import os
+import select
+import socket
+import threading
+
+
+class FakeWpaSupplicant(object):
+    """A wpa_supplicant control socket answering from a script.
+
+    Binds <ctrl_dir>/<interface> like wpa_supplicant does and answers every
+    command from `replies`, by the whole command or else by its first word:
+    a string is sent as one datagram, a list as several (events first, for
+    instance), None not at all. Commands listed
+    in `delays` are answered that many seconds later. ATTACHed clients get
+    the events sent with send_event().
+
+    """
+
+    REPLIES = {"PING": "PONG\n", "ATTACH": "OK\n", "DETACH": "OK\n",
+               "SCAN": "OK\n"}
+
+    def __init__(self, ctrl_dir, interface="wlan0", replies=None):
+        self.path = os.path.join(ctrl_dir, interface)
+        self.replies = dict(self.REPLIES)
+        self.replies.update(replies or {})
+        self.delays = {}
+        self.received = []
+        self.clients = set()
+        self.attached = set()
+        self._sock = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._serve,
+                                        args=(self._sock,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Goes away like a killed wpa_supplicant, socket file and all."""
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self._sock.close()
+        self.attached.clear()
+        os.unlink(self.path)
+
+    def send_event(self, text, level=2):
+        for _address in list(self.attached):
+            self._send(self._sock, "<%d>%s" % (level, text), _address)
+
+    def _serve(self, sock):
+        while not self._stopped.is_set():
+            _ready, _, _ = select.select([sock], [], [], 0.05)
+            if not _ready:
+                continue
+            _data, _address = sock.recvfrom(65536)
+            _command = _data.decode("utf-8")
+            self.received.append(_command)
+            self.clients.add(_address)
+            if _command == "ATTACH":
+                self.attached.add(_address)
+            elif _command == "DETACH":
+                self.attached.discard(_address)
+            _reply = self.replies.get(
+                _command, self.replies.get(_command.split(" ", 1)[0],
+                                           "UNKNOWN COMMAND\n"))
+            if _reply is None:
+                continue
+            if _command in self.delays:
+                _timer = threading.Timer(self.delays[_command], self._send,
+                                         args=(sock, _reply, _address))
+                _timer.daemon = True
+                _timer.start()
+            else:
+                self._send(sock, _reply, _address)
+
+    @staticmethod
+    def _send(sock, reply, address):
+        for _datagram in [reply] if isinstance(reply, str) else reply:
+            try:
+                sock.sendto(_datagram.encode("utf-8"), address)
+            except OSError:
+                # the client went away
+                pass
@@ -0,0 +1,75 @@
+# coding=utf-8
+"""Builds rtnetlink messages the way the kernel sends them, and a source
+that hands them to LinkWatcher or AsyncScanner instead of the kernel.
+"""
+import queue
+import socket
+import struct
+import threading
+
+from octoprint_BLOCKS.netlink import (
+    IFA_ADDRESS, IFA_LOCAL, IFF_LOWER_UP, IFF_RUNNING, IFF_UP, IFLA_IFNAME,
+    IFLA_WIRELESS)
+
+
+def _attribute(kind, value):
+    _length = 4 + len(value)
+    return struct.pack("=HH", _length, kind) + value + \
+        b"\0" * (-_length % 4)
+
+
+def message(kind, body):
+    return struct.pack("=IHHII", 16 + len(body), kind, 0, 0, 0) + body
+
+
+def link(kind, index, name=None, flags=0, wireless=()):
+    _attributes = b""
+    if name is not None:
+        _attributes += _attribute(IFLA_IFNAME, name.encode() + b"\0")
+    if wireless:
+        _attributes += _attribute(IFLA_WIRELESS, b"".join(
+            struct.pack("=HH", 4, _command) for _command in wireless))
+    return message(kind, struct.pack("=BxHiII", socket.AF_UNSPEC, 1, index,
+                                      flags, 0) + _attributes)
+
+
+def address(kind, index, local, peer=None):
+    _attributes = b""
+    if peer is not None:
+        _attributes += _attribute(IFA_ADDRESS, socket.inet_aton(peer))
+    _attributes += _attribute(IFA_LOCAL, socket.inet_aton(local))
+    return message(kind, struct.pack("=BBBBI", socket.AF_INET, 24, 0, 0,
+                                      index) + _attributes)
+
+
+UP = IFF_UP | IFF_RUNNING | IFF_LOWER_UP
+
+
+class ScriptedSource(object):
+    """Feeds LinkWatcher or AsyncScanner datagrams, or OSErrors to raise,
+    pushed by the test instead of the kernel's.
+    """
+
+    def __init__(self):
+        self.opened = False
+        self.closed = threading.Event()
+        self._queue = queue.Queue()
+
+    def push(self, *items):
+        for _item in items:
+            self._queue.put(_item)
+
+    def open(self):
+        self.opened = True
+
+    def recv(self, timeout):
+        try:
+            _item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if isinstance(_item, Exception):
+            raise _item
+        return _item
+
+    def close(self):
+        self.closed.set()
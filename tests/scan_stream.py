@@ -0,0 +1,45 @@
+# coding=utf-8
+"""Builds the wireless extension event streams SIOCGIWSCAN returns, in
+the packed layout 64-bit kernels hand to user space: events follow each
+other without padding.
+"""
+import struct
+
+from octoprint_BLOCKS.python3wifi import flags
+
+
+def event(command, payload):
+    return struct.pack("=HH", 4 + len(payload), command) + payload
+
+
+def point(command, data, point_flags=0):
+    # iw_point events carry length and flags, the pointer is left out
+    return event(command, struct.pack("=HH", len(data), point_flags) + data)
+
+
+def cell(index, essid=None, signal=-60, frequency=2412, updated=0x4f):
+    """One BSS: address, ESSID, mode, frequency, encryption, rates,
+    quality (in dBm unless `updated` says otherwise), a custom string and
+    a WPA2 IE.
+    """
+    if essid is None:
+        essid = "net%d" % index
+    _mac = bytes([2, 0, 0, index >> 16 & 255, index >> 8 & 255, index & 255])
+    return b"".join([
+        event(flags.SIOCGIWAP, struct.pack("=H6s8x", 1, _mac)),
+        point(flags.SIOCGIWESSID, essid.encode("utf-8"), 1),
+        event(flags.SIOCGIWMODE, struct.pack("=I", 3)),
+        event(flags.SIOCGIWFREQ, struct.pack("=ihBB", frequency, 6, 0, 0)),
+        point(flags.SIOCGIWENCODE, b"", 0x800),
+        event(flags.SIOCGIWRATE, b"".join(
+            struct.pack("=ihBB", _rate * 500000, 0, 0, 0)
+            for _rate in (2, 4, 11, 22, 12, 18, 24, 36))),
+        event(flags.IWEVQUAL,
+              struct.pack("=BbbB", 50, signal, -95, updated)),
+        point(flags.IWEVCUSTOM, b"tsf=0000003b2a1c5e2d"),
+        point(flags.IWEVGENIE, b"\x30\x14\x01\x00" + b"\0" * 18),
+    ])
+
+
+def stream(count):
+    return b"".join(cell(_index) for _index in range(count))
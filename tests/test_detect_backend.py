@@ -0,0 +1,78 @@
+# coding=utf-8
+import pytest
+
+from octoprint_BLOCKS.backends import (
+    NetworkManagerBackend, SimulatedBackend, WpaSupplicantBackend,
+    detect_backend, read_os_release)
+
+RASPBIAN = 'PRETTY_NAME="Raspbian GNU/Linux 11 (bullseye)"\nID=raspbian\n' \
+    'ID_LIKE=debian\n'
+DEBIAN = 'PRETTY_NAME="Debian GNU/Linux 12 (bookworm)"\nID=debian\n'
+UBUNTU = '# comment\nID=ubuntu\nID_LIKE="ubuntu debian"\n'
+FEDORA = 'ID=fedora\n'
+
+
+@pytest.fixture
+def system(tmp_path):
+    """Returns a function laying out os-release, wpa_supplicant sockets
+    and the NetworkManager run directory, and the detect_backend
+    arguments pointing at them.
+    """
+    def _system(release=None, wpa=(), nm=False):
+        _release = tmp_path / "os-release"
+        if release is not None:
+            _release.write_text(release)
+        _ctrl = tmp_path / "wpa_supplicant"
+        _ctrl.mkdir(exist_ok=True)
+        for _interface in wpa:
+            (_ctrl / _interface).write_text("")
+        _nm = tmp_path / "NetworkManager"
+        if nm:
+            _nm.mkdir(exist_ok=True)
+        return {"os_release_path": str(_release), "ctrl_dir": str(_ctrl),
+                "nm_run_dir": str(_nm)}
+    return _system
+
+
+def test_running_networkmanager_wins(system):
+    _backend = detect_backend(**system(RASPBIAN, wpa=["wlan0"], nm=True))
+
+    assert isinstance(_backend, NetworkManagerBackend)
+
+
+def test_wpa_supplicant_socket_is_used(system):
+    _backend = detect_backend(**system(DEBIAN, wpa=["p2p-dev-wlan0",
+                                                    "wlan1"]))
+
+    assert isinstance(_backend, WpaSupplicantBackend)
+    assert _backend.interface == "wlan1"
+    assert _backend.ctrl_dir.endswith("wpa_supplicant")
+
+
+@pytest.mark.parametrize("release, expected", [
+    (RASPBIAN, WpaSupplicantBackend),
+    (DEBIAN, NetworkManagerBackend),
+    (UBUNTU, NetworkManagerBackend),
+    (FEDORA, SimulatedBackend),
+    (None, SimulatedBackend),
+])
+def test_os_release_decides_when_no_service_is_seen(system, release,
+                                                    expected):
+    _backend = detect_backend(**system(release))
+
+    assert type(_backend) is expected
+    assert _backend.interface == "wlan0"
+
+
+def test_given_interface_is_kept(system):
+    _backend = detect_backend("wlan3", **system(RASPBIAN, wpa=["wlan0"]))
+
+    assert _backend.interface == "wlan3"
+
+
+def test_read_os_release(system):
+    _path = system(UBUNTU)["os_release_path"]
+
+    assert read_os_release(_path) == {"ID": "ubuntu",
+                                      "ID_LIKE": "ubuntu debian"}
+    assert read_os_release(_path + ".missing") == {}
@@ -0,0 +1,117 @@
+# coding=utf-8
+import stat
+import time
+
+import pytest
+
+from octoprint_BLOCKS.executor import CommandExecutor
+
+
+def _stub(path, body):
+    path.write_text("#!/bin/sh\n" + body)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+
+@pytest.fixture
+def hang(tmp_path):
+    """A command that never finishes on its own."""
+    return _stub(tmp_path / "hang", "exec sleep 60\n")
+
+
+@pytest.fixture
+def slow(tmp_path):
+    """Counts its runs in a file, then takes a while to answer."""
+    _runs = tmp_path / "runs"
+    return _stub(tmp_path / "slow",
+                 "echo run >> %s\nsleep 0.5\necho done\n" % _runs), _runs
+
+
+@pytest.fixture
+def executor():
+    _executor = CommandExecutor(max_workers=2, timeout=5.0)
+    yield _executor
+    _executor.shutdown()
+
+
+def test_timeout_kills_the_command(executor, hang):
+    _start = time.monotonic()
+    _result = executor.run([hang], timeout=0.3)
+
+    assert time.monotonic() - _start < 2.0
+    assert _result.timed_out
+    assert not _result.ok
+    assert executor.stats()["timeouts"] == 1
+
+
+def test_identical_commands_share_one_run(executor, slow):
+    _argv, _runs = slow
+    _first = executor.submit([_argv])
+    _second = executor.submit([_argv])
+
+    assert _second is _first
+    assert _first.result(timeout=5).text() == "done\n"
+    assert _runs.read_text().count("run") == 1
+    assert executor.stats()["forks"] == 1
+    assert executor.stats()["shared"] == 1
+
+
+def test_finished_commands_are_not_shared(executor, slow):
+    _argv, _runs = slow
+    executor.run([_argv])
+    executor.run([_argv])
+
+    assert _runs.read_text().count("run") == 2
+    assert executor.stats()["shared"] == 0
+
+
+def test_run_gives_up_when_no_worker_is_free(hang):
+    _executor = CommandExecutor(max_workers=1, timeout=5.0)
+    try:
+        _executor.submit([hang])
+        _start = time.monotonic()
+        _result = _executor.run([hang, "other"], timeout=0.2)
+
+        assert time.monotonic() - _start < 1.0
+        assert _result.timed_out
+        assert _result.returncode is None
+    finally:
+        _executor.shutdown()
+
+
+def test_cancel_kills_running_commands(executor, hang):
+    _future = executor.submit([hang])
+    time.sleep(0.2)
+    executor.cancel()
+
+    assert _future.result(timeout=5).cancelled
+    assert executor.stats()["cancelled"] == 1
+
+
+def test_missing_program_fails_cleanly(executor, tmp_path):
+    _result = executor.run([str(tmp_path / "missing")])
+
+    assert _result.error
+    assert executor.stats()["failed"] == 1
+
+
+def test_repeated_timer_keeps_firing_on_hanging_commands(hang):
+    util = pytest.importorskip("octoprint.util")
+    _executor = CommandExecutor(max_workers=1, timeout=0.2)
+    _durations = []
+
+    def _poll():
+        _start = time.monotonic()
+        _executor.run([hang])
+        _durations.append(time.monotonic() - _start)
+
+    _timer = util.RepeatedTimer(0.05, _poll)
+    _timer.start()
+    try:
+        time.sleep(2.0)
+    finally:
+        _timer.cancel()
+        _executor.shutdown()
+
+    assert len(_durations) >= 3
+    assert max(_durations) < 2 * 0.2 + 0.3
@@ -0,0 +1,139 @@
+# coding=utf-8
+import os
+import shutil
+
+import pytest
+
+from octoprint_BLOCKS import hostname
+from octoprint_BLOCKS.executor import CommandResult
+from octoprint_BLOCKS.hostname import HostnameService
+
+FIXTURE_ROOT = os.path.join(os.path.dirname(__file__), "fixtures", "root")
+
+
+class Commands(object):
+    """Records the commands run, failing the programs in `failing`."""
+
+    def __init__(self, failing=()):
+        self.argv = []
+        self.failing = set(failing)
+
+    def __call__(self, argv):
+        self.argv.append(argv)
+        _failed = argv[1] in self.failing
+        return CommandResult(tuple(argv), 1 if _failed else 0)
+
+
+@pytest.fixture
+def root(tmp_path):
+    _root = str(tmp_path / "root")
+    shutil.copytree(FIXTURE_ROOT, _root)
+    return _root
+
+
+def _read(root, name):
+    with open(os.path.join(root, "etc", name)) as _fileHandle:
+        return _fileHandle.read()
+
+
+def test_current_reads_etc_hostname(root):
+    assert HostnameService(root, run=Commands()).current() == "blocks"
+
+
+def test_current_falls_back_to_the_kernel(tmp_path, monkeypatch):
+    monkeypatch.setattr(hostname.socket, "gethostname", lambda: "kernel")
+
+    assert HostnameService(str(tmp_path), run=Commands()).current() == "kernel"
+
+
+def test_change_rewrites_both_files(root):
+    _commands = Commands()
+
+    assert HostnameService(root, run=_commands).change(" printer2 \n")
+
+    assert _read(root, "hostname") == "printer2\n"
+    _hosts = _read(root, "hosts").splitlines()
+    assert _hosts[-1] == "127.0.1.1\tprinter2"
+    assert "blocks" not in _read(root, "hosts")
+    assert _hosts[:5] == _read(FIXTURE_ROOT, "hosts").splitlines()[:5]
+    assert _commands.argv == [
+        ["sudo", "hostnamectl", "set-hostname", "printer2"],
+        ["sudo", "avahi-set-host-name", "printer2"]]
+    # Nothing left over from the atomic writes
+    assert sorted(os.listdir(os.path.join(root, "etc"))) == \
+        ["hostname", "hosts"]
+
+
+def test_missing_host_line_is_added(root):
+    with open(os.path.join(root, "etc", "hosts"), "w") as _fileHandle:
+        _fileHandle.write("127.0.0.1\tlocalhost\n")
+
+    HostnameService(root, run=Commands()).change("printer2")
+
+    assert _read(root, "hosts") == "127.0.0.1\tlocalhost\n127.0.1.1\tprinter2\n"
+
+
+def test_hostname_is_used_without_hostnamectl(root):
+    _commands = Commands(failing=["hostnamectl"])
+
+    HostnameService(root, run=_commands).change("printer2")
+
+    assert ["sudo", "hostname", "printer2"] in _commands.argv
+
+
+def test_failed_change_restores_the_files(root):
+    _commands = Commands(failing=["hostnamectl", "hostname"])
+    _service = HostnameService(root, run=_commands)
+
+    assert not _service.change("printer2")
+
+    assert _read(root, "hostname") == _read(FIXTURE_ROOT, "hostname")
+    assert _read(root, "hosts") == _read(FIXTURE_ROOT, "hosts")
+    assert ["sudo", "avahi-set-host-name", "printer2"] not in _commands.argv
+    assert sorted(os.listdir(os.path.join(root, "etc"))) == \
+        ["hostname", "hosts"]
+    # Still the old name, so asking again retries
+    _commands.failing.clear()
+    assert _service.change("printer2")
+    assert _read(root, "hostname") == "printer2\n"
+
+
+def test_failed_hosts_write_restores_hostname(root, monkeypatch):
+    _service = HostnameService(root, run=Commands())
+    _write = _service._write_atomic
+
+    def _write_hostname_only(path, content):
+        if path == _service.hosts_path:
+            raise OSError("disk full")
+        _write(path, content)
+    monkeypatch.setattr(_service, "_write_atomic", _write_hostname_only)
+
+    assert not _service.change("printer2")
+
+    assert _read(root, "hostname") == "blocks\n"
+    assert _service.current() == "blocks"
+
+
+@pytest.mark.parametrize("name", ["blocks", "-printer", "printer_2",
+                                  "a" * 64, ""])
+def test_unchanged_or_invalid_names_are_left_alone(root, name):
+    _commands = Commands()
+
+    assert not HostnameService(root, run=_commands).change(name)
+    assert _commands.argv == []
+    assert _read(root, "hostname") == "blocks\n"
+
+
+def test_unwritable_etc_is_written_through_sudo(root, monkeypatch):
+    def _refuse(*args, **kwargs):
+        raise PermissionError("read-only")
+    monkeypatch.setattr(hostname.tempfile, "mkstemp", _refuse)
+    _commands = Commands()
+
+    assert HostnameService(root, run=_commands).change("printer2")
+
+    _staged = os.path.join(root, "etc", ".blocks-hostname")
+    assert _commands.argv[0][:4] == ["sudo", "install", "-m", "644"]
+    assert _commands.argv[0][5] == _staged
+    assert _commands.argv[1] == ["sudo", "mv", "-f", _staged,
+                                 os.path.join(root, "etc", "hostname")]
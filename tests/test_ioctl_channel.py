@@ -0,0 +1,90 @@
+# coding=utf-8
+import array
+import socket
+import threading
+
+from octoprint_BLOCKS.python3wifi import flags, layouts
+from octoprint_BLOCKS.python3wifi.iwlibs import IoctlChannel
+
+
+def interface_count(channel):
+    """Lists the interfaces with SIOCGIFCONF, which works on any socket."""
+    _buffer = array.array("B", bytes(layouts.IFREQ.size * 32))
+    _address, _length = _buffer.buffer_info()
+    _result = channel.ioctl(flags.SIOCGIFCONF,
+                            layouts.IFCONF.pack(_length, _address))
+    return layouts.IFCONF.unpack(_result)[0] // layouts.IFREQ.size
+
+
+class Sockets(object):
+    """Counts the sockets opened through socket.socket."""
+
+    def __init__(self, monkeypatch):
+        self.opened = 0
+        self._socket = socket.socket
+        self._lock = threading.Lock()
+        monkeypatch.setattr(socket, "socket", self)
+
+    def __call__(self, *args):
+        with self._lock:
+            self.opened += 1
+        return self._socket(*args)
+
+
+def test_opened_on_first_use(monkeypatch):
+    _sockets = Sockets(monkeypatch)
+    _channel = IoctlChannel()
+    assert _channel.closed and _sockets.opened == 0
+
+    assert interface_count(_channel) >= 1
+    interface_count(_channel)
+
+    assert not _channel.closed and _sockets.opened == 1
+    _channel.close()
+
+
+def test_reopened_after_close(monkeypatch):
+    _sockets = Sockets(monkeypatch)
+    _channel = IoctlChannel()
+    _count = interface_count(_channel)
+
+    _channel.close()
+    _channel.close()
+    assert _channel.closed
+
+    assert interface_count(_channel) == _count
+    assert _sockets.opened == 2
+    _channel.close()
+
+
+def test_context_manager_closes():
+    with IoctlChannel() as _channel:
+        assert not _channel.closed
+        interface_count(_channel)
+    assert _channel.closed
+
+
+def test_threads_share_one_socket(monkeypatch):
+    _sockets = Sockets(monkeypatch)
+    _channel = IoctlChannel()
+    _start = threading.Barrier(8)
+    _counts = []
+    _errors = []
+
+    def _use():
+        _start.wait()
+        try:
+            for _ in range(200):
+                _counts.append(interface_count(_channel))
+        except Exception as error:
+            _errors.append(error)
+    _threads = [threading.Thread(target=_use) for _ in range(8)]
+    for _thread in _threads:
+        _thread.start()
+    for _thread in _threads:
+        _thread.join()
+
+    assert _errors == []
+    assert len(_counts) == 1600 and len(set(_counts)) == 1
+    assert _sockets.opened == 1
+    _channel.close()
@@ -0,0 +1,221 @@
+# coding=utf-8
+import pytest
+
+from octoprint_BLOCKS.python3wifi import flags, iwlibs, nl80211
+from octoprint_BLOCKS.python3wifi.iwlibs import Iwquality, Iwscan, \
+    Iwscanresult
+
+from .scan_stream import cell, stream
+
+
+class NullChannel(object):
+    """An ioctl transport where every request succeeds with zeros."""
+
+    def ioctl(self, request, args):
+        return 0
+
+
+@pytest.fixture
+def scan(monkeypatch):
+    monkeypatch.setattr(iwlibs, "default_nl80211", None)
+    _scan = Iwscan("wlan0", fullscan=False, channel=NullChannel())
+    _scan.stream = stream(3) + cell(3, "weak", signal=-90) + \
+        cell(4, "strong", signal=-40)
+    return _scan
+
+
+def test_results_are_decoded_from_the_stream(scan):
+    _result = scan.aplist[1]
+
+    assert _result.bssid == "02:00:00:00:00:01"
+    assert _result.essid == b"net1"
+    assert _result.mode == flags.modes[3]
+    assert _result.frequency.getFrequency() == 2412000000
+    assert _result.getSignal() == -60
+    assert _result.rate == [[1000000, 2000000, 5500000, 11000000, 6000000,
+                             9000000, 12000000, 18000000]]
+    assert _result.wpa == 2
+
+
+def test_strongest_keeps_the_k_best(scan):
+    assert [_result.essid for _result in scan.strongest(2)] == \
+        [b"strong", b"net0"]
+    assert [_result.essid for _result in scan.strongest(10, -70)] == \
+        [b"strong", b"net0", b"net1", b"net2"]
+
+
+def test_nothing_read_yet_is_empty(scan):
+    scan.stream = None
+
+    assert scan.aplist is None
+    assert list(scan) == [] and len(scan) == 0
+    assert list(scan.results()) == [] and scan.strongest(3) == []
+
+
+def test_iterating_again_gives_the_same_results(scan):
+    _first = list(scan)
+
+    assert len(scan) == 5
+    assert list(scan) == _first
+
+
+def test_strongest_ties_keep_scan_order(scan):
+    scan.stream = cell(0, "a", signal=-50) + cell(1, "b", signal=-60) + \
+        cell(2, "c", signal=-50) + cell(3, "d", signal=-60) + \
+        cell(4, "e", signal=-50)
+
+    assert [_result.essid for _result in scan.strongest(2)] == \
+        [b"a", b"c"]
+    assert [_result.essid for _result in scan.strongest(4)] == \
+        [b"a", b"c", b"e", b"b"]
+
+
+def test_strongest_with_k_over_the_results(scan):
+    assert [_result.essid for _result in scan.strongest(50)] == \
+        [b"strong", b"net0", b"net1", b"net2", b"weak"]
+    assert [_result.essid for _result in scan.strongest(50, -60)] == \
+        [b"strong", b"net0", b"net1", b"net2"]
+    assert scan.strongest(0) == []
+
+
+def test_results_without_a_dbm_signal_come_last(scan):
+    # Quality and level updated, but not in dBm
+    scan.stream = cell(0, "relative", signal=90, updated=0x07) + \
+        cell(1, "dbm", signal=-70)
+
+    assert [_result.essid for _result in scan.strongest(5)] == \
+        [b"dbm", b"relative"]
+    assert [_result.essid for _result in scan.strongest(5, -90)] == \
+        [b"dbm"]
+
+
+def test_hand_set_fields_are_not_decoded(scan):
+    _result = next(scan.results())
+    _quality = Iwquality()
+    _quality.siglevel = -30
+    _result.quality = _quality
+    _result.essid = b"mine"
+
+    assert _result.mode == flags.modes[3]
+
+    assert _result.quality is _quality
+    assert _quality.siglevel == -30
+    assert _result.essid == b"mine"
+
+
+def test_fields_set_by_hand_skip_their_group(scan, monkeypatch):
+    _result = next(scan.results())
+    for _name in iwlibs.Iwscanresult._basic[0]:
+        setattr(_result, _name, None)
+
+    def _refuse(self, data):
+        raise AssertionError("handler ran on a hand-set field")
+    monkeypatch.setitem(iwlibs.Iwscanresult._handlers, flags.IWEVQUAL,
+                        _refuse)
+
+    _result._decode(*iwlibs.Iwscanresult._basic)
+
+    assert _result.quality is None
+
+
+def test_a_hand_set_rate_list_is_not_appended_to(scan):
+    _result = next(scan.results())
+    _rates = [[54000000]]
+    _result.rate = _rates
+
+    _result._decode(*iwlibs.Iwscanresult._groups["rate"])
+
+    assert _result.rate is _rates
+    assert _rates == [[54000000]]
+
+
+def decoded(result):
+    """Returns the names of the fields a result has filled in."""
+    _names = set()
+    for _name in Iwscanresult.__slots__:
+        try:
+            object.__getattribute__(result, _name)
+        except AttributeError:
+            continue
+        _names.add(_name)
+    return _names - {"range", "span", "_stream"}
+
+
+BASIC = set(Iwscanresult._basic[0])
+
+
+@pytest.mark.parametrize("name, fields", [
+    ("bssid", {"bssid"}),
+    ("essid", BASIC), ("quality", BASIC), ("frequency", BASIC),
+    ("mode", BASIC), ("encode", BASIC), ("protocol", BASIC),
+    ("rate", {"rate"}), ("custom", {"custom"}), ("wpa", {"wpa"})])
+def test_each_field_group_is_decoded_on_its_own(scan, name, fields):
+    _result = next(scan.results())
+    assert decoded(_result) == set()
+
+    getattr(_result, name)
+
+    assert decoded(_result) == fields
+
+
+def test_groups_decode_their_events(scan):
+    _result = next(scan.results())
+
+    assert _result.custom == [b"tsf=0000003b2a1c5e2d"]
+    assert _result.wpa == 2
+    assert _result.encode.flags == flags.IW_ENCODE_NOKEY
+    assert _result.protocol is None
+    assert decoded(_result) == BASIC | {"custom", "wpa"}
+    with pytest.raises(AttributeError):
+        _result.channel
+
+
+def bss(ies=b"", capability=nl80211.WLAN_CAPABILITY_ESS, frequency=2437,
+        signal=-55, signal_dbm=True):
+    return {"bssid": bytes.fromhex("b827eb123456"), "frequency": frequency,
+            "capability": capability, "signal": signal,
+            "signal_dbm": signal_dbm, "status": None, "seen_ms_ago": 20,
+            "ies": ies}
+
+
+def test_result_from_a_bss():
+    _result = Iwscanresult.fromBss(bss(
+        b"\x00\x06Blocks" + b"\x01\x04\x82\x84\x0b\x16" +
+        b"\x00\x05Other" + b"\x32\x02\x30\x48",
+        nl80211.WLAN_CAPABILITY_ESS | nl80211.WLAN_CAPABILITY_PRIVACY),
+        None)
+
+    assert (_result.bssid, _result.essid) == ("B8:27:EB:12:34:56", b"Blocks")
+    assert _result.rate == [[1000000, 2000000, 5500000, 11000000,
+                             24000000, 36000000]]
+    assert _result.mode == flags.modes[3]
+    assert _result.frequency.getFrequency() == 2437000000
+    assert _result.getSignal() == -55
+    assert _result.quality.quality == 55
+    assert not _result.encode.flags & flags.IW_ENCODE_DISABLED
+    assert _result.wpa is None
+    # Nothing to decode later, the rest keeps its defaults
+    assert _result.custom == [] and _result.protocol is None
+    assert _result.getChannel() is None
+
+
+def test_open_ibss_from_a_bss_with_wpa1_and_relative_signal():
+    _result = Iwscanresult.fromBss(bss(
+        b"\xdd\x0a\x00\x50\xf2\x01\x01\x00\x00\x50\xf2\x02",
+        nl80211.WLAN_CAPABILITY_IBSS, frequency=0, signal=70,
+        signal_dbm=False), None)
+
+    assert _result.essid is None and _result.rate == []
+    assert _result.mode == flags.modes[1]
+    assert _result.frequency is None
+    assert _result.getSignal() is None
+    assert _result.quality.quality == 70
+    assert _result.encode.flags & flags.IW_ENCODE_DISABLED
+    assert _result.wpa == 1
+
+
+def test_result_from_a_bss_without_signal():
+    _result = Iwscanresult.fromBss(bss(signal=None), None)
+
+    assert _result.getSignal() is None
+    assert _result.quality.updated == 0
@@ -0,0 +1,159 @@
+# coding=utf-8
+import errno
+import queue
+import struct
+
+import pytest
+
+from octoprint_BLOCKS.netlink import (
+    IFF_UP, RTM_DELADDR, RTM_DELLINK, RTM_NEWADDR, RTM_NEWLINK, LinkWatcher,
+    parse_messages)
+
+from .netlink_messages import UP, ScriptedSource, address, link, message
+
+SIOCGIWSCAN = 0x8B19
+SIOCGIWAP = 0x8B15
+
+
+class Changes(object):
+
+    def __init__(self):
+        self.interfaces = queue.Queue()
+
+    def __call__(self, interface):
+        self.interfaces.put(interface)
+
+    def next(self, timeout=2.0):
+        return self.interfaces.get(timeout=timeout)
+
+    def none(self):
+        try:
+            self.interfaces.get(timeout=0.2)
+        except queue.Empty:
+            return True
+        return False
+
+
+@pytest.fixture
+def source():
+    return ScriptedSource()
+
+
+@pytest.fixture
+def changes(source):
+    _changes = Changes()
+    _watcher = LinkWatcher(_changes, source=source)
+    _watcher.start()
+    yield _changes
+    _watcher.stop()
+    assert source.closed.wait(3.0)
+
+
+def test_parses_link_messages():
+    _events = parse_messages(link(RTM_NEWLINK, 3, "wlan0", UP,
+                                  wireless=(SIOCGIWAP, SIOCGIWSCAN)))
+
+    assert len(_events) == 1
+    _event = _events[0]
+    assert (_event.kind, _event.index, _event.name) == (RTM_NEWLINK, 3,
+                                                        "wlan0")
+    assert _event.up and _event.carrier
+    assert _event.wireless == (SIOCGIWAP, SIOCGIWSCAN)
+
+
+def test_parses_address_messages():
+    _events = parse_messages(address(RTM_NEWADDR, 3, "192.168.1.20",
+                                     peer="192.168.1.1"))
+
+    assert _events[0].address == "192.168.1.20"
+
+
+def test_parses_every_message_of_a_datagram():
+    _events = parse_messages(
+        link(RTM_NEWLINK, 2, "eth0", IFF_UP) +
+        address(RTM_DELADDR, 2, "10.0.0.2") +
+        message(99, b"\0" * 12) +
+        link(RTM_DELLINK, 3, "wlan0"))
+
+    assert [(_event.kind, _event.index) for _event in _events] == [
+        (RTM_NEWLINK, 2), (RTM_DELADDR, 2), (RTM_DELLINK, 3)]
+    assert _events[0].up and not _events[0].carrier
+
+
+def test_truncated_datagrams_are_cut_short():
+    _data = link(RTM_NEWLINK, 3, "wlan0", UP)
+
+    assert parse_messages(_data[:10]) == []
+    assert parse_messages(struct.pack("=IHHII", 4, RTM_NEWLINK, 0, 0, 0)) == []
+
+
+def test_reports_link_changes_once(source, changes):
+    source.push(link(RTM_NEWLINK, 3, "wlan0", UP))
+    assert changes.next() == "wlan0"
+
+    source.push(link(RTM_NEWLINK, 3, "wlan0", UP))
+    assert changes.none()
+
+    source.push(link(RTM_NEWLINK, 3, "wlan0", IFF_UP))
+    assert changes.next() == "wlan0"
+
+
+def test_dhcp_renewals_are_not_changes(source, changes):
+    source.push(link(RTM_NEWLINK, 3, "wlan0", UP))
+    changes.next()
+    source.push(address(RTM_NEWADDR, 3, "192.168.1.20"))
+    assert changes.next() == "wlan0"
+
+    source.push(address(RTM_NEWADDR, 3, "192.168.1.20"))
+    assert changes.none()
+
+    source.push(address(RTM_DELADDR, 3, "192.168.1.20"))
+    assert changes.next() == "wlan0"
+
+
+def test_removed_interfaces_are_reported_by_name(source, changes):
+    source.push(link(RTM_NEWLINK, 7, "wlan1", UP))
+    changes.next()
+
+    source.push(link(RTM_DELLINK, 7))
+    assert changes.next() == "wlan1"
+
+
+def test_lost_notifications_reset_the_state(source, changes):
+    source.push(link(RTM_NEWLINK, 3, "wlan0", UP))
+    changes.next()
+
+    source.push(OSError(errno.ENOBUFS, "No buffer space available"))
+    assert changes.next() is None
+
+    # Known state is gone, the same message counts as a change again
+    source.push(link(RTM_NEWLINK, 3, "wlan0", UP))
+    assert changes.next() == "wlan0"
+
+
+def test_callback_errors_dont_stop_the_watcher(source):
+    _seen = queue.Queue()
+
+    def _callback(interface):
+        _seen.put(interface)
+        raise RuntimeError("boom")
+
+    _watcher = LinkWatcher(_callback, source=source)
+    _watcher.start()
+    source.push(link(RTM_NEWLINK, 3, "wlan0", UP),
+                link(RTM_NEWLINK, 4, "eth0", UP))
+
+    assert _seen.get(timeout=2.0) == "wlan0"
+    assert _seen.get(timeout=2.0) == "eth0"
+    _watcher.stop()
+    _watcher.join(3.0)
+
+
+def test_socket_errors_end_the_watcher(source):
+    _watcher = LinkWatcher(Changes(), source=source)
+    _watcher.start()
+    source.push(OSError(errno.EBADF, "Bad file descriptor"))
+
+    _watcher.join(3.0)
+    assert not _watcher.is_alive()
+    assert source.opened and source.closed.is_set()
@@ -0,0 +1,234 @@
+# coding=utf-8
+import collections
+import errno
+import os
+
+import pytest
+
+from octoprint_BLOCKS.python3wifi import iwlibs, nl80211
+from octoprint_BLOCKS.python3wifi.iwlibs import Iwscanresult, Wireless
+from octoprint_BLOCKS.python3wifi.nl80211 import NLMSGHDR, Nl80211
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "nl80211")
+
+
+def recording(name):
+    """Returns the datagrams of a fixture: hex, one blank line between
+    datagrams, "#" comments.
+    """
+    with open(os.path.join(FIXTURES, name)) as _fileHandle:
+        _text = "".join(_line for _line in _fileHandle
+                        if not _line.startswith("#"))
+    return [bytes.fromhex(_datagram.replace("\n", ""))
+            for _datagram in _text.split("\n\n") if _datagram.strip()]
+
+
+def _with_seq(datagram, seq):
+    """Gives every message of a datagram the request's sequence number,
+    the kernel echoes it back.
+    """
+    _data = bytearray(datagram)
+    _offset = 0
+    while _offset + NLMSGHDR.size <= len(_data):
+        _length, _kind, _flags, _, _pid = NLMSGHDR.unpack_from(_data, _offset)
+        NLMSGHDR.pack_into(_data, _offset, _length, _kind, _flags, seq, _pid)
+        _offset += (_length + 3) & ~3
+    return bytes(_data)
+
+
+class Playback(object):
+    """A transport answering requests with recorded datagrams.
+
+    answers maps a generic netlink command to the fixture replying to
+    it, events is the fixture played once a multicast group is joined.
+
+    """
+
+    def __init__(self, answers, events=None):
+        self.answers = answers
+        self.events = events
+        self.sent = []
+        self.joined = []
+        self.closed = False
+        self._queue = collections.deque()
+
+    def open(self):
+        self.closed = False
+
+    def join(self, group):
+        self.joined.append(group)
+        if self.events is not None:
+            self._queue.extend(recording(self.events))
+
+    def send(self, data):
+        _, _family, _flags, _seq, _ = NLMSGHDR.unpack_from(data)
+        _cmd = data[NLMSGHDR.size]
+        self.sent.append((_family, _cmd, _flags))
+        if _cmd in self.answers:
+            self._queue.extend(_with_seq(_datagram, _seq) for _datagram
+                               in recording(self.answers[_cmd]))
+
+    def recv(self, timeout):
+        if not self._queue:
+            return None
+        return self._queue.popleft()
+
+    def close(self):
+        self.closed = True
+
+
+ANSWERS = {
+    nl80211.CTRL_CMD_GETFAMILY: "getfamily",
+    nl80211.NL80211_CMD_GET_INTERFACE: "get_interface",
+    nl80211.NL80211_CMD_GET_STATION: "get_station",
+    nl80211.NL80211_CMD_GET_SCAN: "get_scan",
+    nl80211.NL80211_CMD_TRIGGER_SCAN: "trigger_scan",
+}
+
+
+def played(events=None, **replaced):
+    """Returns an Nl80211 on recordings, and the transports it made.
+    A command replaced with None gets no answer.
+    """
+    _answers = dict(ANSWERS)
+    for _name, _fixture in replaced.items():
+        _answers[getattr(nl80211, _name)] = _fixture
+        if _fixture is None:
+            del _answers[getattr(nl80211, _name)]
+    _transports = []
+
+    def _transport():
+        _transports.append(Playback(_answers, events))
+        return _transports[-1]
+
+    return Nl80211(transport=_transport), _transports
+
+
+def test_family_and_groups_are_resolved_once():
+    _nl, _transports = played()
+
+    assert _nl.available()
+    assert _nl.available()
+    assert _nl.family_id == 0x1c
+    assert _nl.groups == {"config": 5, "scan": 6, "regulatory": 7, "mlme": 8}
+    assert _transports[0].sent == [(nl80211.GENL_ID_CTRL,
+                                    nl80211.CTRL_CMD_GETFAMILY,
+                                    nl80211.NLM_F_REQUEST)]
+
+
+def test_kernel_without_nl80211_is_unavailable():
+    _nl, _ = played(CTRL_CMD_GETFAMILY="getfamily_missing")
+
+    assert not _nl.available()
+
+
+def test_interface():
+    _nl, _ = played()
+
+    assert _nl.interface(3) == {
+        "ifindex": 3, "ifname": "wlan0", "iftype": 2, "wiphy": 0,
+        "mac": bytes.fromhex("b827eb123456"), "ssid": b"Blocks",
+        "frequency": 5180, "txpower": 3100}
+
+
+def test_station():
+    _nl, _transports = played()
+
+    assert _nl.station(3) == {
+        "mac": bytes.fromhex("001122334455"), "signal": -52,
+        "signal_avg": -54, "tx_bitrate": 433300000, "rx_bitrate": 54000000,
+        "tx_retries": 12, "tx_failed": 1, "rx_drop_misc": 5,
+        "beacon_loss": 0, "connected_time": 3600, "inactive_time": 40}
+    _, _cmd, _flags = _transports[0].sent[-1]
+    assert _cmd == nl80211.NL80211_CMD_GET_STATION
+    assert _flags & nl80211.NLM_F_DUMP == nl80211.NLM_F_DUMP
+
+
+def test_no_station_when_disconnected():
+    _nl, _ = played(NL80211_CMD_GET_STATION="get_station_empty")
+
+    assert _nl.station(3) is None
+
+
+def test_scan_results_span_datagrams():
+    _nl, _ = played()
+
+    _results = _nl.scan_results(3)
+
+    assert [(_bss["bssid"].hex(), _bss["frequency"], _bss["signal"],
+             _bss["signal_dbm"], _bss["status"]) for _bss in _results] == [
+        ("001122334455", 5180, -48, True, 1),
+        ("66778899aabb", 2437, 60, False, None)]
+    assert [_payload for _eid, _payload in
+            nl80211.elements(_results[1]["ies"])][0] == b"Workshop"
+
+
+def test_scan_results_become_iwscanresults():
+    _nl, _ = played()
+
+    _blocks, _workshop = [Iwscanresult.fromBss(_bss, None)
+                          for _bss in _nl.scan_results(3)]
+
+    assert (_blocks.bssid, _blocks.essid, _blocks.wpa) == \
+        ("00:11:22:33:44:55", b"Blocks", 2)
+    assert _blocks.getSignal() == -48
+    assert _workshop.wpa is None
+    assert _workshop.getSignal() is None
+    assert _workshop.quality.quality == 60
+
+
+def test_trigger_scan_is_acknowledged():
+    _nl, _transports = played()
+
+    _nl.trigger_scan(3)
+
+    _, _cmd, _flags = _transports[0].sent[-1]
+    assert _cmd == nl80211.NL80211_CMD_TRIGGER_SCAN
+    assert _flags & nl80211.NLM_F_ACK
+
+
+def test_refused_requests_raise_the_kernels_errno():
+    _nl, _ = played(NL80211_CMD_TRIGGER_SCAN="trigger_scan_busy")
+
+    with pytest.raises(OSError) as error:
+        _nl.trigger_scan(3)
+    assert error.value.errno == errno.EBUSY
+
+
+def test_silence_times_out(monkeypatch):
+    monkeypatch.setattr(Nl80211, "TIMEOUT", 0.05)
+    _nl, _ = played(NL80211_CMD_GET_INTERFACE=None)
+
+    with pytest.raises(OSError) as error:
+        _nl.interface(3)
+    assert error.value.errno == errno.ETIMEDOUT
+
+
+def test_scan_events_wait_for_their_interface():
+    _nl, _transports = played(events="scan_events")
+
+    _events = _nl.scan_events()
+
+    assert _transports[-1].joined == [6]
+    assert _events.wait(3, 0) == nl80211.NL80211_CMD_NEW_SCAN_RESULTS
+    assert _events.wait(3, 0) is None
+    _events.close()
+    assert _transports[-1].closed
+
+
+def test_essid_that_isnt_utf8_is_replaced(monkeypatch):
+    monkeypatch.setattr(iwlibs.socket, "if_nametoindex", lambda ifname: 3)
+    _nl, _ = played(NL80211_CMD_GET_INTERFACE="get_interface_latin1")
+
+    assert Wireless("wlan0", netlink=_nl).getEssid() == u"Caf\ufffd"
+
+
+def test_essid_is_empty_when_disconnected(monkeypatch):
+    monkeypatch.setattr(iwlibs.socket, "if_nametoindex", lambda ifname: 3)
+    _nl, _transports = played(
+        NL80211_CMD_GET_INTERFACE="get_interface_disconnected")
+
+    assert Wireless("wlan0", netlink=_nl).getEssid() == u""
+    # Not looked up in the BSS list
+    assert all(_cmd != nl80211.NL80211_CMD_GET_SCAN
+               for _, _cmd, _ in _transports[-1].sent)
@@ -0,0 +1,197 @@
+# coding=utf-8
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+
+jeepney = pytest.importorskip("jeepney")
+
+from jeepney import (DBusAddress, HeaderFields, MessageType,  # noqa: E402
+                     new_error, new_method_return, new_signal)
+from jeepney.bus_messages import message_bus  # noqa: E402
+from jeepney.io.blocking import open_dbus_connection  # noqa: E402
+
+from octoprint_BLOCKS.nm_dbus import (  # noqa: E402
+    NM_ACTIVE_IFACE, NM_AP_IFACE, NM_BUS_NAME, NM_DEVICE_IFACE, NM_IFACE,
+    NM_PATH, NM_WIRELESS_IFACE, NetworkManagerDBus, NetworkManagerError)
+
+pytestmark = pytest.mark.skipif(shutil.which("dbus-daemon") is None,
+                                reason="needs dbus-daemon for a private bus")
+
+DEVICE = NM_PATH + "/Devices/3"
+ACCESS_POINT = NM_PATH + "/AccessPoint/7"
+ACTIVE = NM_PATH + "/ActiveConnection/1"
+
+
+def wait_for(predicate, timeout=5.0):
+    _deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > _deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class MockNetworkManager(object):
+    """Serves the NetworkManager objects NetworkManagerDBus reads, on a
+    private bus, and counts the calls it gets.
+    """
+
+    def __init__(self, address):
+        self.properties = {
+            (NM_PATH, NM_IFACE): {"Devices": ("ao", [DEVICE]),
+                                  "Version": ("s", "1.42.4")},
+            (DEVICE, NM_DEVICE_IFACE): {"State": ("u", 100),
+                                        "ActiveConnection": ("o", ACTIVE)},
+            (DEVICE, NM_WIRELESS_IFACE): {
+                "ActiveAccessPoint": ("o", ACCESS_POINT)},
+            (ACCESS_POINT, NM_AP_IFACE): {"Ssid": ("ay", b"Blocks"),
+                                          "Strength": ("y", 67)},
+            (ACTIVE, NM_ACTIVE_IFACE): {"Id": ("s", "Blocks")},
+        }
+        self.devices = {"wlan0": DEVICE}
+        self.calls = []
+        self._conn = open_dbus_connection(bus=address)
+        self._conn.send_and_get_reply(message_bus.RequestName(NM_BUS_NAME))
+        # Signals go out on their own connection, the server thread owns
+        # the first one
+        self._signals = open_dbus_connection(bus=address)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._conn.close()
+        self._signals.close()
+
+    def change(self, path, interface, **changed):
+        """Changes properties and emits PropertiesChanged like NM does."""
+        _props = self.properties[(path, interface)]
+        _changed = {}
+        for _name, _value in changed.items():
+            _props[_name] = _changed[_name] = (_props[_name][0], _value)
+        self._signals.send(new_signal(
+            DBusAddress(path, interface="org.freedesktop.DBus.Properties"),
+            "PropertiesChanged", "sa{sv}as", (interface, _changed, [])))
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                _msg = self._conn.receive(timeout=0.1)
+            except TimeoutError:
+                continue
+            if _msg.header.message_type == MessageType.method_call:
+                self._conn.send(self._answer(_msg))
+
+    def _answer(self, msg):
+        _path = msg.header.fields[HeaderFields.path]
+        _member = msg.header.fields[HeaderFields.member]
+        self.calls.append((_member, _path) + tuple(msg.body))
+        if _member == "GetAll":
+            _props = self.properties.get((_path, msg.body[0]))
+            if _props is not None:
+                return new_method_return(msg, "a{sv}", (_props,))
+            return new_error(msg, "org.freedesktop.DBus.Error.UnknownInterface")
+        if _member == "GetDeviceByIpIface":
+            _device = self.devices.get(msg.body[0])
+            if _device is not None:
+                return new_method_return(msg, "o", (_device,))
+            return new_error(msg, NM_IFACE + ".UnknownDevice")
+        return new_error(msg, "org.freedesktop.DBus.Error.UnknownMethod")
+
+
+@pytest.fixture
+def bus():
+    _daemon = subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address=1"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    _address = _daemon.stdout.readline().decode().strip()
+    yield _address
+    _daemon.terminate()
+    _daemon.wait()
+
+
+@pytest.fixture
+def mock_nm(bus):
+    _mock = MockNetworkManager(bus)
+    yield _mock
+    _mock.close()
+
+
+@pytest.fixture
+def nm(bus, mock_nm):
+    _nm = NetworkManagerDBus(bus=bus)
+    _nm.open()
+    yield _nm
+    _nm.close()
+
+
+def test_reads_the_state_of_an_interface(nm):
+    assert nm.device_state("wlan0") == 100
+    assert nm.active_connection("wlan0") == "Blocks"
+    assert nm.active_ssid("wlan0") == "Blocks"
+    assert nm.signal_strength("wlan0") == 67
+
+
+def test_properties_are_read_once(nm, mock_nm):
+    nm.active_connection("wlan0")
+    nm.signal_strength("wlan0")
+    _calls = len(mock_nm.calls)
+
+    for _ in range(10):
+        nm.active_connection("wlan0")
+        nm.signal_strength("wlan0")
+        nm.device_state("wlan0")
+
+    assert len(mock_nm.calls) == _calls
+
+
+def test_properties_changed_updates_the_cache(nm, mock_nm):
+    assert nm.signal_strength("wlan0") == 67
+    _calls = len(mock_nm.calls)
+
+    mock_nm.change(ACCESS_POINT, NM_AP_IFACE, Strength=31)
+
+    assert wait_for(lambda: nm.signal_strength("wlan0") == 31)
+    assert len(mock_nm.calls) == _calls
+
+
+def test_losing_the_access_point_is_noticed(nm, mock_nm):
+    assert nm.signal_strength("wlan0") == 67
+
+    mock_nm.change(DEVICE, NM_WIRELESS_IFACE, ActiveAccessPoint="/")
+
+    assert wait_for(lambda: nm.signal_strength("wlan0") is None)
+    assert nm.active_ssid("wlan0") is None
+
+
+def test_unknown_interface_fails(nm):
+    with pytest.raises(NetworkManagerError):
+        nm.active_connection("wlan9")
+
+
+def test_reopening_outlives_the_old_listener(nm, mock_nm):
+    nm.signal_strength("wlan0")
+    _old = nm._listener
+
+    nm.close()
+    nm.open()
+    # the old listener wakes up on its closed connection
+    _old.join(5.0)
+
+    assert nm._conn is not None
+    assert nm.signal_strength("wlan0") == 67
+    mock_nm.change(ACCESS_POINT, NM_AP_IFACE, Strength=12)
+    assert wait_for(lambda: nm.signal_strength("wlan0") == 12)
+
+
+def test_open_fails_without_networkmanager(bus):
+    _nm = NetworkManagerDBus(bus=bus)
+
+    with pytest.raises(NetworkManagerError):
+        _nm.open()
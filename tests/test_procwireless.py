@@ -0,0 +1,89 @@
+# coding=utf-8
+import os
+import shutil
+
+import pytest
+
+from octoprint_BLOCKS.python3wifi import flags
+from octoprint_BLOCKS.python3wifi.procwireless import ProcWireless
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures",
+                       "proc_net_wireless")
+
+
+@pytest.fixture
+def proc():
+    _proc = ProcWireless(FIXTURE)
+    yield _proc
+    _proc.close()
+
+
+def test_every_interface_is_read_past_the_first_page(proc):
+    assert os.path.getsize(FIXTURE) > 4096
+
+    _stats = proc.read()
+
+    assert len(_stats) == 63
+    assert "ap59" in _stats
+    assert proc._size > 4096
+
+
+def test_header_lines_are_skipped(proc):
+    assert not {"Inter-", "face"} & set(proc.read())
+
+
+def test_values_and_update_markers(proc):
+    _wlan0 = proc.get("wlan0")
+
+    assert (_wlan0.status, _wlan0.quality, _wlan0.level, _wlan0.noise) == \
+        (0, 54, -56, -256)
+    assert _wlan0.updated == \
+        flags.IW_QUAL_QUAL_UPDATED | flags.IW_QUAL_LEVEL_UPDATED
+    assert _wlan0.discard == {"nwid": 0, "code": 0, "fragment": 0,
+                              "retries": 3, "misc": 77}
+    assert _wlan0.missed_beacon == 2
+
+
+def test_values_without_markers(proc):
+    _wlan1 = proc.get("wlan1")
+    _idle = proc.get("wlx00c0ca")
+
+    assert _wlan1.updated == \
+        flags.IW_QUAL_LEVEL_UPDATED | flags.IW_QUAL_NOISE_UPDATED
+    assert (_wlan1.level, _wlan1.noise) == (-40, -95)
+    assert _idle.updated == 0
+    assert (_idle.status, _idle.level) == (0x10, -110)
+
+
+def test_unlisted_interface(proc):
+    assert proc.get("eth0") is None
+
+
+def test_the_buffer_only_grows_once(proc):
+    proc.read()
+    _size = proc._size
+
+    proc.read()
+
+    assert proc._size == _size
+
+
+def test_file_is_kept_open(tmp_path):
+    _path = str(tmp_path / "wireless")
+    shutil.copy(FIXTURE, _path)
+    _proc = ProcWireless(_path)
+    try:
+        assert _proc.get("wlan0").quality == 54
+        with open(FIXTURE) as _fixture, open(_path, "r+") as _fileHandle:
+            _fileHandle.write(_fixture.read().replace("   54.", "   12."))
+        os.rename(_path, _path + ".moved")
+
+        # Same descriptor, new contents
+        assert _proc.get("wlan0").quality == 12
+    finally:
+        _proc.close()
+
+
+def test_missing_file_raises(tmp_path):
+    with pytest.raises(OSError):
+        ProcWireless(str(tmp_path / "missing")).read()
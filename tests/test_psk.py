@@ -0,0 +1,83 @@
+# coding=utf-8
+import hashlib
+
+import pytest
+
+from octoprint_BLOCKS.psk import PskCache, derive_psk
+
+# IEEE 802.11i-2004 H.4.3
+VECTORS = [
+    ("password", "IEEE",
+     "f42c6fc52df0ebef9ebb4b90b38a5f902e83fe1b135a70e23aed762e9710a12e"),
+    ("ThisIsAPassword", "ThisIsASSID",
+     "0dc0d6eb90555ed6419756b9a15ec3e3209b63df707dd508d14581f8982721af"),
+]
+
+
+@pytest.mark.parametrize("passphrase, ssid, psk", VECTORS)
+def test_derive_psk_matches_the_test_vectors(passphrase, ssid, psk):
+    _derived = bytes.fromhex(derive_psk(ssid, passphrase))
+
+    assert len(_derived) == 32
+    assert _derived == bytes.fromhex(psk)
+
+
+@pytest.mark.parametrize("passphrase, ssid, psk", VECTORS)
+def test_cache_returns_the_test_vectors(passphrase, ssid, psk):
+    _cache = PskCache()
+
+    assert _cache.get(ssid, passphrase) == psk
+    assert _cache.get(ssid, passphrase) == psk
+    assert _cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_hex_psk_is_passed_through():
+    _psk = VECTORS[0][2]
+
+    assert PskCache().get("IEEE", _psk.upper()) == _psk
+
+
+@pytest.mark.parametrize("passphrase", ["short", "x" * 64, "x" * 65,
+                                        u"pässwörd"])
+def test_invalid_passphrases_are_refused(passphrase):
+    with pytest.raises(ValueError):
+        PskCache().get("Blocks", passphrase)
+
+
+def test_least_recently_used_key_is_evicted():
+    _cache = PskCache()
+    for _n in range(16):
+        _cache.get("ssid%d" % _n, "passphrase")
+    # ssid0 becomes the most recently used, ssid1 the oldest
+    _cache.get("ssid0", "passphrase")
+    _cache.get("ssid16", "passphrase")
+
+    assert len(_cache._keys) == 16
+    _misses = _cache.stats()["misses"]
+    _cache.get("ssid0", "passphrase")
+    assert _cache.stats()["misses"] == _misses
+    _cache.get("ssid1", "passphrase")
+    assert _cache.stats()["misses"] == _misses + 1
+
+
+def test_entries_are_keyed_by_ssid_and_passphrase_hash():
+    _cache = PskCache()
+    _cache.get("Blocks", "passphrase")
+    _cache.get("Workshop", "passphrase")
+    _cache.get("Blocks", "another passphrase")
+
+    assert list(_cache._keys) == [
+        ("Blocks", hashlib.sha256(b"passphrase").digest()),
+        ("Workshop", hashlib.sha256(b"passphrase").digest()),
+        ("Blocks", hashlib.sha256(b"another passphrase").digest()),
+    ]
+    assert _cache.stats()["misses"] == 3
+
+
+def test_clear_forgets_every_key():
+    _cache = PskCache()
+    _cache.get("Blocks", "passphrase")
+    _cache.clear()
+    _cache.get("Blocks", "passphrase")
+
+    assert _cache.stats()["misses"] == 2
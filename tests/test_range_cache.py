@@ -0,0 +1,165 @@
+# coding=utf-8
+import errno
+
+import pytest
+
+from octoprint_BLOCKS.python3wifi import flags, iwlibs
+from octoprint_BLOCKS.python3wifi.iwlibs import Iwfreq, Iwquality, \
+    Iwrange, Iwscan, RangeCache
+
+from .scan_stream import cell
+from .wireless_range import DriverChannel, range_data
+
+CHANNELS_5GHZ = ((36, 5180), (40, 5200), (149, 5745))
+
+
+@pytest.fixture
+def channel():
+    return DriverChannel({flags.SIOCGIWRANGE: range_data()})
+
+
+@pytest.fixture
+def indexes(monkeypatch):
+    """Interface name -> ifindex, a missing name is a gone interface."""
+    _indexes = {"wlan0": 3, "wlan1": 4}
+
+    def _if_nametoindex(ifname):
+        if ifname not in _indexes:
+            raise OSError(errno.ENODEV, "No such device")
+        return _indexes[ifname]
+    monkeypatch.setattr(iwlibs.socket, "if_nametoindex", _if_nametoindex)
+    return _indexes
+
+
+def quality(value):
+    _quality = Iwquality()
+    _quality.quality = value
+    return _quality
+
+
+def test_range_is_asked_for_once_per_interface(channel, indexes):
+    _cache = RangeCache()
+
+    _range = _cache.get("wlan0", channel)
+    assert _cache.get("wlan0", channel) is _range
+    assert _cache.get("wlan1", channel) is not _range
+    assert channel.count(flags.SIOCGIWRANGE) == 2
+
+
+def test_failed_request_isnt_cached(indexes):
+    _cache = RangeCache()
+    _channel = DriverChannel()
+
+    with pytest.raises(OSError):
+        _cache.get("wlan0", _channel)
+    _channel.pointed[flags.SIOCGIWRANGE] = range_data()
+    assert _cache.get("wlan0", _channel).num_frequency == 13
+
+
+def test_gone_or_recreated_interfaces_are_dropped(channel, indexes):
+    _cache = RangeCache()
+    _wlan0 = _cache.get("wlan0", channel)
+    _wlan1 = _cache.get("wlan1", channel)
+
+    # Still there, with the same index
+    _cache.link_changed("wlan0")
+    assert _cache.get("wlan0", channel) is _wlan0
+    # Unplugged and plugged in again
+    indexes["wlan0"] = 7
+    _cache.link_changed("wlan0")
+    assert _cache.get("wlan0", channel) is not _wlan0
+    # Gone
+    del indexes["wlan1"]
+    _cache.link_changed("wlan1")
+    _cache.link_changed("wlan9")
+    assert channel.count(flags.SIOCGIWRANGE) == 3
+    indexes["wlan1"] = 4
+    assert _cache.get("wlan1", channel) is not _wlan1
+
+
+def test_missed_changes_drop_everything(channel, indexes):
+    _cache = RangeCache()
+    _cache.get("wlan0", channel)
+    _cache.get("wlan1", channel)
+
+    _cache.link_changed(None)
+    _cache.get("wlan0", channel)
+    _cache.get("wlan1", channel)
+
+    assert channel.count(flags.SIOCGIWRANGE) == 4
+
+
+def test_invalidate(channel, indexes):
+    _cache = RangeCache()
+    _wlan0 = _cache.get("wlan0", channel)
+    _wlan1 = _cache.get("wlan1", channel)
+
+    _cache.invalidate("wlan0")
+    assert _cache.get("wlan0", channel) is not _wlan0
+    assert _cache.get("wlan1", channel) is _wlan1
+    _cache.invalidate()
+    assert _cache.get("wlan1", channel) is not _wlan1
+
+
+@pytest.mark.parametrize("frequency, expected", [
+    ((2412, 6), 1), ((2437, 6), 6), ((2472, 6), 13),
+    # drivers may give the channel, or Hz
+    ((11, 0), 11), ((2462000000, 0), 11),
+    ((2484, 6), None), ((5180, 6), None)])
+def test_channel_lookup(channel, frequency, expected):
+    _range = Iwrange("wlan0", channel)
+
+    assert Iwfreq(frequency + (0, 0)).getChannel(_range) == expected
+
+
+def test_channel_lookup_on_5ghz():
+    _range = Iwrange("wlan0", DriverChannel(
+        {flags.SIOCGIWRANGE: range_data(CHANNELS_5GHZ)}))
+
+    assert _range.frequencies == [5180000000, 5200000000, 5745000000]
+    assert Iwfreq((5745, 6, 0, 0)).getChannel(_range) == 149
+    assert Iwfreq((2412, 6, 0, 0)).getChannel(_range) is None
+
+
+def test_range_without_frequencies():
+    _range = Iwrange("wlan0", DriverChannel(
+        {flags.SIOCGIWRANGE: range_data(())}))
+
+    assert _range.frequencies == [] and _range.channels == {}
+
+
+@pytest.mark.parametrize("value, percent", [(0, 0), (35, 50), (70, 100),
+                                            (90, 100)])
+def test_quality_percent(channel, value, percent):
+    assert Iwrange("wlan0", channel).getQualityPercent(quality(value)) == \
+        percent
+
+
+def test_quality_percent_without_a_maximum():
+    _range = Iwrange("wlan0", DriverChannel(
+        {flags.SIOCGIWRANGE: range_data(max_quality=0)}))
+
+    assert _range.getQualityPercent(quality(50)) is None
+
+
+def test_reparsed_range_replaces_its_tables():
+    _channel = DriverChannel({flags.SIOCGIWRANGE: range_data()})
+    _range = Iwrange("wlan0", _channel)
+
+    _channel.pointed[flags.SIOCGIWRANGE] = range_data(CHANNELS_5GHZ, 100)
+    _range.update()
+
+    assert sorted(_range.channels.values()) == [36, 40, 149]
+    assert _range.getQualityPercent(quality(70)) == 70
+
+
+def test_scan_results_use_the_cached_range(channel, monkeypatch):
+    monkeypatch.setattr(iwlibs, "iwranges", RangeCache())
+    _scan = Iwscan("wlan0", fullscan=False, netlink=False, channel=channel)
+    _scan.stream = cell(0, frequency=2437) + cell(1, frequency=5180)
+    _again = Iwscan("wlan0", fullscan=False, netlink=False, channel=channel)
+
+    assert _again.range is _scan.range
+    assert channel.count(flags.SIOCGIWRANGE) == 1
+    assert [(_result.getChannel(), _result.getQualityPercent())
+            for _result in _scan] == [(6, 71), (None, 71)]
@@ -0,0 +1,193 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from octoprint_BLOCKS.backends import WpaSupplicantBackend
+from octoprint_BLOCKS.registry import ConfigWatcher, NetworkRegistry, \
+    SavedNetwork
+
+from .fake_wpa import FakeWpaSupplicant
+
+inotify = pytest.mark.skipif(not ConfigWatcher.available(),
+                             reason="no inotify")
+
+
+class ConfigBackend(object):
+    """Reads the saved networks from a file, one "ssid priority" a line."""
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self.loads = 0
+
+    def saved_networks(self):
+        self.loads += 1
+        with open(self.config_path) as _fileHandle:
+            _lines = _fileHandle.read().split("\n")
+        return [SavedNetwork(_ssid, str(_id), int(_priority))
+                for _id, (_ssid, _priority) in enumerate(
+                    _line.split(" ") for _line in _lines if _line)]
+
+
+def write(path, text):
+    # Replaced by a rename like wpa_supplicant's SAVE_CONFIG does
+    with open(path + ".tmp", "w") as _fileHandle:
+        _fileHandle.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def touch_later(path):
+    # Another mtime even on filesystems with coarse timestamps
+    _stat = os.stat(path)
+    os.utime(path, ns=(_stat.st_atime_ns, _stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def config(tmp_path):
+    _path = str(tmp_path / "wpa_supplicant.conf")
+    write(_path, "Home 5\nWorkshop 10\n")
+    return _path
+
+
+@pytest.fixture
+def registry(config):
+    _registry = NetworkRegistry(ConfigBackend(config))
+    yield _registry
+    _registry.stop()
+
+
+def test_networks_are_loaded_once(registry):
+    assert [_network.ssid for _network in registry.networks()] == \
+        ["Workshop", "Home"]
+    assert registry.get("Home").priority == 5
+    assert registry.get("Cafe") is None
+    assert registry.backend.loads == 1
+
+
+def test_put_updates_the_index_in_place(registry, config):
+    registry.networks()
+    _entry = registry.get("Home")
+    # Our own write, followed by put()
+    write(config, "Home 5\nWorkshop 10\nBlocks 20\n")
+    touch_later(config)
+    registry.put(SavedNetwork("Blocks", "2", 20))
+    registry.mark_connected("Home")
+
+    assert [_network.ssid for _network in registry.networks()] == \
+        ["Blocks", "Workshop", "Home"]
+    assert registry.get("Home") is _entry
+    assert _entry.last_connected is not None
+    assert registry.backend.loads == 1
+
+
+def test_put_before_loading_is_left_to_the_load(registry):
+    registry.put(SavedNetwork("Blocks", "2", 20))
+    registry.mark_connected("Blocks")
+
+    assert registry.get("Blocks") is None
+    assert registry.backend.loads == 1
+
+
+def test_changed_file_is_reloaded_without_a_watcher(registry, config):
+    registry.networks()
+    write(config, "Home 5\n")
+    touch_later(config)
+
+    assert registry.get("Workshop") is None
+    assert registry.backend.loads == 2
+
+
+def test_invalidate_reloads(registry):
+    registry.networks()
+    registry.invalidate()
+    registry.networks()
+    assert registry.backend.loads == 2
+
+
+@inotify
+def test_watcher_reports_the_file_only(config):
+    _changed = threading.Event()
+    _watcher = ConfigWatcher(config, _changed.set)
+    _watcher.start()
+    try:
+        write(os.path.join(os.path.dirname(config), "other.conf"), "")
+        assert not _changed.wait(0.3)
+        write(config, "Home 1\n")
+        assert _changed.wait(2)
+    finally:
+        _watcher.stop()
+        _watcher.join(2)
+    assert not _watcher.is_alive()
+
+
+@inotify
+def test_watcher_of_a_directory_reports_any_file(tmp_path):
+    _changed = threading.Event()
+    _watcher = ConfigWatcher(str(tmp_path), _changed.set)
+    _watcher.start()
+    try:
+        write(str(tmp_path / "Blocks.nmconnection"), "")
+        assert _changed.wait(2)
+    finally:
+        _watcher.stop()
+
+
+def test_watching_a_missing_directory_fails(tmp_path):
+    _watcher = ConfigWatcher(str(tmp_path / "missing" / "wpa.conf"),
+                             lambda: None)
+    with pytest.raises(OSError):
+        _watcher.start()
+
+
+@inotify
+def test_watched_registry_drops_the_index_on_change(registry, config):
+    _reloaded = threading.Event()
+    _callback = registry._on_config_changed
+
+    def _on_config_changed():
+        _callback()
+        _reloaded.set()
+    registry._on_config_changed = _on_config_changed
+    assert registry.watch()
+    registry.networks()
+
+    write(config, "Home 5\n")
+    touch_later(config)
+
+    assert _reloaded.wait(2)
+    assert registry.get("Workshop") is None
+    assert registry.backend.loads == 2
+
+
+@pytest.fixture
+def wpa():
+    # Unix socket paths are short, pytest's tmp_path may be too long
+    _dir = tempfile.mkdtemp(prefix="wpa")
+    _fake = FakeWpaSupplicant(_dir, replies={
+        "LIST_NETWORKS": "network id / ssid / bssid / flags\n"
+                         "0\tCaf\\xc3\\xa9\tany\t[CURRENT]\n"
+                         "1\t\\\"Lab\\\"\tany\t[DISABLED]\n"
+                         "2\tWorkshop\tany\t\n",
+        "GET_NETWORK 0 priority": "-3\n",
+        "GET_NETWORK 1 priority": "12\n",
+        "GET_NETWORK 2 priority": "FAIL\n"})
+    _fake.start()
+    _backend = WpaSupplicantBackend(ctrl_dir=_dir)
+    yield _backend
+    _backend._wpa.close()
+    _fake.stop()
+    shutil.rmtree(_dir)
+
+
+def test_wpa_saved_networks_are_decoded(wpa):
+    _networks = {_network.ssid: _network for _network in wpa.saved_networks()}
+
+    assert sorted(_networks) == ['"Lab"', "Café", "Workshop"]
+    assert _networks["Café"].priority == -3
+    assert _networks["Café"].last_connected is not None
+    assert (_networks['"Lab"'].priority, _networks['"Lab"'].disabled) == \
+        (12, True)
+    assert _networks["Workshop"].priority == 0
@@ -0,0 +1,113 @@
+# coding=utf-8
+import errno
+
+import pytest
+
+from octoprint_BLOCKS.python3wifi import flags
+from octoprint_BLOCKS.python3wifi.iwlibs import ScanBuffer, ScanBufferPool
+
+from .wireless_range import DriverChannel
+
+
+@pytest.fixture
+def pool():
+    return ScanBufferPool()
+
+
+def scan_of(size, hint=True):
+    return DriverChannel({flags.SIOCGIWSCAN: bytes(range(256)) *
+                          (size // 256) + bytes(size % 256)}, hint=hint)
+
+
+def fetch(buffer, channel):
+    with buffer:
+        _length = buffer.fetch(channel)
+        return buffer.data(_length)
+
+
+def test_pool_keeps_one_buffer_per_interface(pool):
+    _wlan0 = pool.get("wlan0")
+
+    assert pool.get("wlan0") is _wlan0
+    assert pool.get("wlan1") is not _wlan0
+    assert pool.get("wlan1").ifname == "wlan1"
+    pool.clear()
+    assert pool.get("wlan0") is not _wlan0
+
+
+def test_buffer_is_reused_across_scans(pool):
+    _buffer = pool.get("wlan0")
+    _channel = scan_of(1000)
+
+    assert fetch(_buffer, _channel) == _channel.pointed[flags.SIOCGIWSCAN]
+    _array = _buffer.buff
+    for _ in range(5):
+        fetch(_buffer, _channel)
+
+    assert _buffer.buff is _array
+    assert _buffer.size == flags.IW_SCAN_MAX_DATA
+    assert pool.stats() == {"scans": 0, "reallocations": 1, "retries": 0}
+
+
+def test_buffer_grows_to_the_size_the_driver_asks_for(pool):
+    _buffer = pool.get("wlan0")
+    _channel = scan_of(10000)
+
+    assert len(fetch(_buffer, _channel)) == 10000
+    assert _buffer.size == int(10000 * ScanBuffer.HEADROOM)
+    assert pool.stats()["retries"] == 1
+    # The next scans of that size fit the first time
+    fetch(_buffer, _channel)
+    fetch(_buffer, scan_of(12000))
+    assert pool.stats() == {"scans": 0, "reallocations": 2, "retries": 1}
+
+
+def test_buffer_doubles_when_the_driver_doesnt_say(pool):
+    _buffer = pool.get("wlan0")
+
+    assert len(fetch(_buffer, scan_of(10000, hint=False))) == 10000
+    assert _buffer.size == 4 * flags.IW_SCAN_MAX_DATA
+    assert pool.stats()["retries"] == 2
+    assert pool.stats()["reallocations"] == 3
+
+
+def test_buffer_shrinks_after_scans_get_small(pool):
+    _buffer = pool.get("wlan0")
+    fetch(_buffer, scan_of(60000))
+    assert _buffer.size == ScanBuffer.MAX_SIZE
+
+    # Sized after the last scan, the one after a small scan is smaller
+    fetch(_buffer, scan_of(100))
+    assert _buffer.size == ScanBuffer.MAX_SIZE
+    fetch(_buffer, scan_of(100))
+    assert _buffer.size == flags.IW_SCAN_MAX_DATA
+
+
+def test_scan_larger_than_iw_point_allows_fails(pool):
+    _buffer = pool.get("wlan0")
+
+    with pytest.raises(OSError) as error:
+        fetch(_buffer, scan_of(ScanBuffer.MAX_SIZE + 1))
+    assert error.value.errno == errno.E2BIG
+    assert _buffer.size == ScanBuffer.MAX_SIZE
+
+
+def test_unfinished_scan_is_counted_and_raised(pool):
+    class _Scanning(object):
+        def ioctl(self, request, args):
+            raise OSError(errno.EAGAIN, "Resource temporarily unavailable")
+
+    with pytest.raises(OSError) as error:
+        fetch(pool.get("wlan0"), _Scanning())
+    assert error.value.errno == errno.EAGAIN
+    assert pool.stats()["retries"] == 1
+
+
+def test_data_is_a_copy(pool):
+    _buffer = pool.get("wlan0")
+    _data = fetch(_buffer, scan_of(300))
+
+    fetch(_buffer, scan_of(300, hint=False))
+    _buffer.buff[0] = 255
+
+    assert isinstance(_data, bytes) and _data[0] == 0
@@ -0,0 +1,84 @@
+# coding=utf-8
+import struct
+
+import pytest
+
+from octoprint_BLOCKS.python3wifi import flags
+from octoprint_BLOCKS.python3wifi.iwlibs import Iwscan
+
+from .scan_stream import cell, event, point, stream
+from .wireless_range import DriverChannel, range_data
+
+
+@pytest.fixture
+def parse():
+    _scan = Iwscan("wlan0", fullscan=False, netlink=False,
+                   channel=DriverChannel({flags.SIOCGIWRANGE: range_data()}))
+
+    def _parse(data):
+        return list(_scan._iterParse(data))
+    return _parse
+
+
+@pytest.mark.parametrize("data", [b"", b"\x08\x00", event(0, b"")[:3]])
+def test_nothing_to_parse(parse, data):
+    assert parse(data) == []
+
+
+def test_spans_cover_the_stream(parse):
+    _data = stream(50)
+    _results = parse(_data)
+
+    assert len(_results) == 50
+    assert _results[0].span[0] == 0
+    assert _results[-1].span[1] == len(_data)
+    assert all(_previous.span[1] == _next.span[0]
+               for _previous, _next in zip(_results, _results[1:]))
+    assert [_result.essid for _result in _results[-2:]] == \
+        [b"net48", b"net49"]
+
+
+def test_events_before_an_address_are_refused(parse):
+    with pytest.raises(RuntimeError):
+        parse(point(flags.SIOCGIWESSID, b"orphan", 1) + cell(0))
+
+
+@pytest.mark.parametrize("command", [flags.SIOCGIWSCAN, 0x1234])
+def test_unknown_events_are_refused(parse, command):
+    with pytest.raises(ValueError):
+        parse(cell(0) + event(command, b"\0" * 4))
+
+
+def test_a_too_short_event_ends_the_stream(parse):
+    _data = cell(0) + cell(1) + struct.pack("=HH", 2, flags.SIOCGIWAP) + \
+        cell(2)
+    _results = parse(_data)
+
+    assert [_result.essid for _result in _results] == [b"net0", b"net1"]
+
+
+def test_a_cut_off_event_is_left_out(parse):
+    # The quality event loses its last bytes
+    _data = cell(0) + cell(1, signal=-40)
+    _cut = _data.rindex(struct.pack("=HH", 8, flags.IWEVQUAL)) + 6
+    _results = parse(_data[:_cut])
+
+    assert [_result.essid for _result in _results] == [b"net0", b"net1"]
+    assert _results[1].frequency.getFrequency() == 2412000000
+    assert _results[1].getSignal() is None
+    assert _results[1].custom == [] and _results[1].wpa is None
+
+
+def test_a_cut_off_address_is_left_out(parse):
+    _data = cell(0) + cell(1)
+    _results = parse(_data[:len(cell(0)) + 6])
+
+    assert [_result.bssid for _result in _results] == ["02:00:00:00:00:00"]
+
+
+def test_a_large_scan_is_parsed_in_order(parse):
+    _results = parse(stream(3000))
+
+    assert len(_results) == 3000
+    assert _results[2999].bssid == "02:00:00:00:0B:B7"
+    assert _results[1234].essid == b"net1234"
@@ -0,0 +1,179 @@
+# coding=utf-8
+import threading
+import time
+
+import pytest
+
+from octoprint_BLOCKS.backends import SimulatedBackend
+from octoprint_BLOCKS.scancache import ScanCache
+from octoprint_BLOCKS.scanresults import ScanRecord
+
+OLD = [ScanRecord("Blocks", "00:11:22:33:44:55", -60, 2412, "WPA2")]
+NEW = [ScanRecord("Blocks", "00:11:22:33:44:55", -52, 2412, "WPA2"),
+       ScanRecord("Workshop", "66:77:88:99:aa:bb", -70, 5180, "WPA2")]
+
+
+class ScanningBackend(object):
+    """Answers scan_results() with the last finished scan, like
+    wpa_supplicant does, a scan only finishes when the test says so.
+    """
+
+    interface = "wlan0"
+    instant_scan = False
+
+    def __init__(self, results=OLD):
+        self.results = results
+        self.requests = 0
+        self.accept = True
+
+    def request_scan(self):
+        self.requests += 1
+        return self.accept
+
+    def scan_results(self):
+        return self.results
+
+    def finish(self, results, after=0.0):
+        if not after:
+            self.results = results
+            return
+        _timer = threading.Timer(after, self.finish, (results,))
+        _timer.daemon = True
+        _timer.start()
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def backend():
+    return ScanningBackend()
+
+
+@pytest.fixture
+def cache(backend):
+    _cache = ScanCache(backend, scan_time=0.5, poll_interval=0.05)
+    _cache.update(OLD)
+    return _cache
+
+
+def test_forced_scan_waits_for_new_results(cache, backend):
+    backend.finish(NEW, after=0.2)
+
+    assert cache.get(force=True) is NEW
+    assert cache.age() < 0.1
+    assert backend.requests == 1
+
+
+def test_unchanged_scan_is_stored_after_scan_time(cache, backend):
+    time.sleep(0.1)
+    _start = time.monotonic()
+
+    assert cache.get(force=True) is OLD
+    assert 0.5 <= time.monotonic() - _start < 1.0
+    assert cache.age() < 0.1
+    assert cache.stats()["unchanged"] == 1
+
+
+def test_unchanged_site_is_scanned_once(backend):
+    _cache = ScanCache(backend, scan_time=0.2, poll_interval=0.05)
+
+    for _ in range(5):
+        assert _cache.get() is OLD
+
+    assert backend.requests == 1
+    assert _cache.stats()["misses"] == 1
+    assert _cache.stats()["hits"] == 4
+    assert _cache.age() is not None
+
+
+def test_update_wakes_up_the_waiting_caller(backend):
+    _cache = ScanCache(backend, scan_time=5.0, poll_interval=10.0)
+    _timer = threading.Timer(0.2, _cache.update, (NEW,))
+    _timer.start()
+    _start = time.monotonic()
+
+    assert _cache.get(force=True) is NEW
+    assert time.monotonic() - _start < 2.0
+
+
+def test_concurrent_forced_scans_share_one_request(cache, backend):
+    backend.finish(NEW, after=0.2)
+    _results = []
+    _threads = [threading.Thread(
+        target=lambda: _results.append(cache.get(force=True)))
+        for _ in range(3)]
+    for _thread in _threads:
+        _thread.start()
+    for _thread in _threads:
+        _thread.join()
+
+    assert _results == [NEW] * 3
+    assert backend.requests == 1
+
+
+def test_refused_scan_serves_the_backend_unstamped(backend):
+    backend.accept = False
+    _cache = ScanCache(backend, scan_time=0.2, poll_interval=0.05)
+
+    assert _cache.get() is OLD
+    assert _cache.age() is None
+
+
+def test_stale_results_are_served_while_scanning(backend):
+    _clock = Clock()
+    _cache = ScanCache(backend, ttl=25, scan_time=5, clock=_clock)
+    _cache.update(OLD)
+    _clock.now += 30
+
+    assert _cache.get() is OLD
+    assert backend.requests == 1
+    assert _cache.age() == 30
+
+    backend.finish(NEW)
+    _clock.now += 2
+    # Not given its scan_time yet
+    assert _cache.get() is OLD
+    _clock.now += 4
+
+    assert _cache.get() is NEW
+    assert _cache.age() == 0
+    assert backend.requests == 1
+
+
+def test_unchanged_background_scan_refreshes_the_age(backend):
+    _clock = Clock()
+    _cache = ScanCache(backend, ttl=25, scan_time=5, clock=_clock)
+    _cache.update(OLD)
+    _clock.now += 30
+    _cache.get()
+    _clock.now += 6
+
+    assert _cache.get() is OLD
+    assert _cache.age() == 0
+    assert backend.requests == 1
+    assert _cache.get() is OLD
+    assert backend.requests == 1
+
+
+def test_fresh_results_are_not_rescanned(cache, backend):
+    assert cache.get() is OLD
+    assert backend.requests == 0
+    assert cache.stats()["hits"] == 1
+
+
+def test_instant_backends_are_stored_at_once():
+    _backend = SimulatedBackend()
+    _cache = ScanCache(_backend, scan_time=5.0)
+    _start = time.monotonic()
+
+    assert [_record.ssid for _record in _cache.get(force=True)] == \
+        ["Blocks", "Workshop"]
+    assert time.monotonic() - _start < 1.0
+    assert _cache.age() is not None
@@ -0,0 +1,93 @@
+# coding=utf-8
+import pytest
+
+from octoprint_BLOCKS.scanresults import (
+    BAND_2GHZ, BAND_5GHZ, parse_nmcli_scan, parse_scan_results,
+    unescape_ssid)
+
+from .benchmarks.scanresults import HEADER, dump
+
+
+def results(*lines):
+    return HEADER + "\n".join(lines)
+
+
+@pytest.mark.parametrize("printed, ssid", [
+    ("Blocks", "Blocks"),
+    ("Caf\\xc3\\xa9", "Café"),
+    ("\\xe2\\x9c\\x93 ok", "✓ ok"),
+    ('say \\"hi\\"', 'say "hi"'),
+    ("back\\\\slash", "back\\slash"),
+    ("tab\\there", "tab\there"),
+    ("\\xff\\xfe", "��"),
+])
+def test_unescape_ssid(printed, ssid):
+    assert unescape_ssid(printed) == ssid
+
+
+def test_escaped_ssid_is_decoded():
+    _records = parse_scan_results(results(
+        "00:11:22:33:44:55\t2412\t-50\t[WPA2-PSK-CCMP][ESS]\tCaf\\xc3\\xa9",
+        "00:11:22:33:44:66\t5180\t-70\t[ESS]\t\\\"quoted\\\""))
+    assert [_record.ssid for _record in _records] == ["Café", '"quoted"']
+    assert _records[1].security == "open"
+
+
+def test_escaped_and_plain_bsses_merge():
+    _records = parse_scan_results(results(
+        "00:11:22:33:44:55\t2412\t-60\t[WPA2-PSK-CCMP][ESS]\tCaf\\xc3\\xa9",
+        "00:11:22:33:44:56\t5180\t-55\t[WPA2-PSK-CCMP][ESS]\tCafé"))
+    assert len(_records) == 1
+    assert _records[0].count == 2
+
+
+def test_hidden_networks_are_left_out():
+    _records = parse_scan_results(results(
+        "00:11:22:33:44:55\t2412\t-40\t[WPA2-PSK-CCMP][ESS]\t",
+        "00:11:22:33:44:66\t2437\t-60\t[WPA2-PSK-CCMP][ESS]\tBlocks"))
+    assert [_record.ssid for _record in _records] == ["Blocks"]
+
+
+def test_bsses_merge_by_ssid():
+    _records = parse_scan_results(results(
+        "00:11:22:33:44:55\t2412\t-70\t[WPA-PSK-TKIP][ESS]\tBlocks",
+        "00:11:22:33:44:66\t5180\t-48\t[WPA2-SAE-CCMP][ESS]\tBlocks",
+        "00:11:22:33:44:77\t2462\t-80\t[ESS]\tWorkshop",
+        "00:11:22:33:44:88\t2437\t-65\t[WPA2-PSK-CCMP][ESS]\tBlocks"))
+    assert [_record.ssid for _record in _records] == ["Blocks", "Workshop"]
+    _blocks = _records[0]
+    assert (_blocks.bssid, _blocks.signal, _blocks.frequency,
+            _blocks.security) == ("00:11:22:33:44:66", -48, 5180, "WPA3")
+    assert _blocks.bands == BAND_2GHZ | BAND_5GHZ
+    assert _blocks.count == 3
+    assert _blocks.to_wire() == ["Blocks", -48, 3, "WPA3"]
+
+
+def test_malformed_lines_are_skipped():
+    _records = parse_scan_results(results(
+        "00:11:22:33:44:55\tnot-a-frequency\t-50\t[ESS]\tBroken",
+        "00:11:22:33:44:66\t2412",
+        "",
+        "00:11:22:33:44:77\t2412\t-60\t[ESS]\tBlocks"))
+    assert [_record.ssid for _record in _records] == ["Blocks"]
+
+
+def test_synthetic_dump_is_sorted_by_signal():
+    _records = parse_scan_results(dump(200))
+    _signals = [_record.signal for _record in _records]
+    assert _signals == sorted(_signals, reverse=True)
+    assert sum(_record.count for _record in _records) < 200
+    assert any(_record.ssid.startswith("Café") for _record in _records)
+    assert all(_record.ssid for _record in _records)
+
+
+def test_nmcli_escaped_colons_and_strength():
+    _records = parse_nmcli_scan(
+        "00\\:11\\:22\\:33\\:44\\:55:2412 MHz:100:WPA2:Blocks\\:Lab\n"
+        "00\\:11\\:22\\:33\\:44\\:66:5180 MHz:0:WPA1 WPA2:Blocks\\:Lab\n"
+        "00\\:11\\:22\\:33\\:44\\:77:2437 MHz:50::Open\n")
+    assert [(_record.ssid, _record.signal) for _record in _records] == [
+        ("Blocks:Lab", -40), ("Open", -70)]
+    assert _records[0].bssid == "00:11:22:33:44:55"
+    assert _records[0].bands == BAND_2GHZ | BAND_5GHZ
+    assert _records[1].security == "open"
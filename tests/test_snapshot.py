@@ -0,0 +1,185 @@
+# coding=utf-8
+import errno
+
+from octoprint_BLOCKS.python3wifi import flags, iwlibs, layouts
+from octoprint_BLOCKS.python3wifi.iwlibs import LinkTelemetry, Wireless
+
+from .wireless_range import DriverChannel, stats_data
+
+STATISTICS = set(LinkTelemetry.STATISTICS)
+# Every value snapshot() fills in or reports an error for
+VALUES = {"apaddr", "essid", "bitrate", "frequency", "txpower",
+          "power"} | STATISTICS
+
+
+def driver(*missing):
+    """Returns a DriverChannel answering every snapshot ioctl, but the
+    missing ones; never SIOCGIWRANGE.
+    """
+    _pointed = {
+        flags.SIOCGIWESSID: b"Blocks",
+        flags.SIOCGIWSTATS: stats_data(quality=50, signal=-60, noise=-95),
+    }
+    _inline = {
+        flags.SIOCGIWAP: bytes(2) + bytes.fromhex("001122334455"),
+        flags.SIOCGIWRATE: layouts.IW_PARAM.pack(54000000, 0, 0, 0),
+        flags.SIOCGIWFREQ: layouts.IW_FREQ.pack(2412, 6, 1, 0),
+        flags.SIOCGIWTXPOW: layouts.IW_PARAM.pack(20, 0, 0, 0),
+        flags.SIOCGIWPOWER: layouts.IW_PARAM.pack(0, 0, 1, 0),
+    }
+    for _request in missing:
+        _pointed.pop(_request, None)
+        _inline.pop(_request, None)
+    return DriverChannel(_pointed, _inline)
+
+
+class Station(object):
+    """An nl80211 stand-in: `station` is what GET_STATION answers, None
+    when disconnected; `error` is raised by every request.
+    """
+
+    def __init__(self, station=None, error=None):
+        self._station = station
+        self._error = error
+
+    def available(self):
+        return True
+
+    def station(self, ifindex):
+        if self._error is not None:
+            raise self._error
+        return self._station
+
+    def interface(self, ifindex):
+        return {"ssid": b"Blocks", "frequency": 5180, "txpower": 2000}
+
+
+def wireless(channel, netlink=False):
+    return Wireless("wlan0", channel=channel, netlink=netlink)
+
+
+def test_every_value_read_in_one_snapshot():
+    _channel = driver()
+
+    _link = wireless(_channel).snapshot()
+
+    assert _link.errors == {}
+    assert (_link.apaddr, _link.essid, _link.bitrate, _link.frequency,
+            _link.txpower, _link.power) == \
+        ("00:11:22:33:44:55", "Blocks", 54000000, 2412000000, 20, False)
+    assert (_link.quality.quality, _link.quality.siglevel,
+            _link.quality.nlevel) == (50, -60, -95)
+    assert _link.status == (0, 0)
+    assert _link.missed_beacon == 0
+    assert sorted(_channel.requests) == sorted(LinkTelemetry.READINGS.values())
+
+
+def test_missing_statistics_are_reported_per_field():
+    _link = wireless(driver(flags.SIOCGIWSTATS)).snapshot()
+
+    assert set(_link.errors) == STATISTICS
+    assert all(_error.errno == errno.EOPNOTSUPP
+               for _error in _link.errors.values())
+    assert (_link.quality.quality, _link.quality.siglevel,
+            _link.quality.nlevel, _link.quality.updated) == (0, 0, 0, 0)
+    assert (_link.status, _link.discard, _link.missed_beacon) == \
+        (None, {}, None)
+    # The rest is still read
+    assert (_link.apaddr, _link.essid, _link.bitrate) == \
+        ("00:11:22:33:44:55", "Blocks", 54000000)
+
+
+def test_range_is_not_needed():
+    _channel = driver()
+
+    _link = wireless(_channel).snapshot()
+
+    assert flags.SIOCGIWRANGE not in _channel.requests
+    # Raw driver values, not scaled by a range
+    assert _link.quality.quality == 50
+
+
+def test_nothing_answered_leaves_every_value_unset():
+    _link = wireless(DriverChannel()).snapshot()
+
+    assert set(_link.errors) == VALUES
+    assert (_link.apaddr, _link.essid, _link.bitrate, _link.frequency,
+            _link.txpower, _link.power, _link.status,
+            _link.missed_beacon) == (None,) * 8
+
+
+def test_one_failure_doesnt_hide_the_others():
+    _link = wireless(driver(flags.SIOCGIWRATE, flags.SIOCGIWESSID)).snapshot()
+
+    assert set(_link.errors) == {"bitrate", "essid"}
+    assert (_link.bitrate, _link.essid) == (None, None)
+    assert _link.frequency == 2412000000
+    assert _link.quality.siglevel == -60
+
+
+def test_record_is_reused_and_cleared():
+    _channel = driver()
+    _wifi = wireless(_channel)
+    _first = _wifi.snapshot()
+
+    del _channel.pointed[flags.SIOCGIWSTATS]
+    _second = _wifi.snapshot()
+
+    assert _second is _first
+    assert set(_second.errors) == STATISTICS
+    # Nothing left from the first snapshot
+    assert _second.quality.siglevel == 0
+    assert (_second.status, _second.discard) == (None, {})
+
+
+def test_given_record_is_filled_in():
+    _record = LinkTelemetry("wlan0")
+    _wifi = wireless(driver())
+
+    assert _wifi.snapshot(_record) is _record
+    assert _wifi.snapshot() is not _record
+    assert _record.essid == "Blocks"
+
+
+def test_disconnected_station_falls_back_to_the_statistics_ioctl(
+        monkeypatch):
+    monkeypatch.setattr(iwlibs.socket, "if_nametoindex", lambda ifname: 3)
+    _channel = driver(flags.SIOCGIWSTATS)
+
+    _link = wireless(_channel, Station()).snapshot()
+
+    # nl80211 answered these, without a station
+    assert (_link.apaddr, _link.essid, _link.frequency, _link.txpower) == \
+        ("00:00:00:00:00:00", "Blocks", 5180000000, 20)
+    assert set(_link.errors) == STATISTICS
+    assert _link.bitrate == 54000000
+    assert sorted(_channel.requests) == sorted([
+        flags.SIOCGIWRATE, flags.SIOCGIWPOWER, flags.SIOCGIWSTATS])
+
+
+def test_station_statistics_need_no_ioctl(monkeypatch):
+    monkeypatch.setattr(iwlibs.socket, "if_nametoindex", lambda ifname: 3)
+    _channel = driver(flags.SIOCGIWSTATS)
+    _station = {"mac": bytes.fromhex("001122334455"), "signal": -52,
+                "tx_bitrate": 72200000, "tx_failed": 1, "rx_drop_misc": 5,
+                "beacon_loss": 0}
+
+    _link = wireless(_channel, Station(_station)).snapshot()
+
+    assert _link.errors == {}
+    assert (_link.quality.siglevel, _link.quality.quality) == (-52, 58)
+    assert _link.discard["retries"] == 1
+    assert _channel.requests == [flags.SIOCGIWPOWER]
+
+
+def test_failing_nl80211_falls_back_to_the_ioctls(monkeypatch):
+    monkeypatch.setattr(iwlibs.socket, "if_nametoindex", lambda ifname: 3)
+    _error = OSError(errno.ETIMEDOUT, "Connection timed out")
+    _channel = driver(flags.SIOCGIWSTATS)
+
+    _link = wireless(_channel, Station(error=_error)).snapshot()
+
+    assert set(_link.errors) == STATISTICS
+    assert _link.apaddr == "00:11:22:33:44:55"
+    assert _link.frequency == 2412000000
+    assert flags.SIOCGIWSTATS in _channel.requests
@@ -0,0 +1,189 @@
+# coding=utf-8
+import threading
+import time
+
+import pytest
+
+from octoprint_BLOCKS import backends, wifisetup
+from octoprint_BLOCKS.backends import NetworkManagerBackend, SimulatedBackend
+from octoprint_BLOCKS.wifisetup import Wifisetup
+
+
+class Radio(SimulatedBackend):
+    """A simulated interface with its own link quality, and a status
+    that can take a while.
+    """
+
+    def __init__(self, interface, connected=None, quality=70, delay=0.0):
+        SimulatedBackend.__init__(self, interface)
+        self.connected = connected
+        self.quality = quality
+        self.delay = delay
+        self.stats_calls = 0
+
+    def status(self, interface):
+        time.sleep(self.delay)
+        return SimulatedBackend.status(self, interface)
+
+    def stats(self, interface):
+        self.stats_calls += 1
+        return {"Quality": self.quality
+                if SimulatedBackend.status(self, interface) else None}
+
+
+@pytest.fixture
+def radios(monkeypatch):
+    monkeypatch.setattr(wifisetup, "getWNICnames", lambda: ["wlan0", "wlan1"])
+    return (Radio("wlan0", "Blocks", quality=40),
+            Radio("wlan1", "Workshop", quality=80))
+
+
+@pytest.fixture
+def setup(radios):
+    _setup = Wifisetup(backend=radios[0])
+    _setup.add_backend(radios[1])
+    yield _setup
+    _setup.shutdown()
+
+
+def test_primary_interface_comes_first(radios, monkeypatch):
+    monkeypatch.setattr(wifisetup, "getWNICnames", lambda: ["wlan0", "wlan1"])
+    _setup = Wifisetup(backend=radios[1])
+    try:
+        assert _setup.interfaces() == ["wlan1", "wlan0"]
+    finally:
+        _setup.shutdown()
+
+
+def test_every_interface_is_asked(setup):
+    _connections = setup.connections()
+
+    assert list(_connections) == ["wlan0", "wlan1"]
+    assert [_status.ssid for _status in _connections.values()] == \
+        ["Blocks", "Workshop"]
+    assert [_status.quality for _status in _connections.values()] == [40, 80]
+
+
+def test_primary_policy_keeps_the_primary(setup):
+    assert setup.find_connection() == ("wlan0", "Blocks")
+
+
+def test_primary_policy_falls_back_to_the_strongest(setup, radios):
+    radios[0].connected = None
+
+    assert setup.find_connection() == ("wlan1", "Workshop")
+
+
+def test_strongest_policy(setup):
+    setup.indicator_policy = "strongest"
+
+    assert setup.find_connection() == ("wlan1", "Workshop")
+
+
+def test_interface_policy(setup, radios):
+    setup.indicator_policy = "wlan1"
+    assert setup.find_connection() == ("wlan1", "Workshop")
+
+    radios[1].connected = None
+    assert setup.find_connection() is None
+
+
+def test_interface_that_times_out_is_reported(setup, radios):
+    setup.TIMEOUT = 0.2
+    radios[1].delay = 1.0
+    _start = time.monotonic()
+
+    _connections = setup.connections()
+
+    assert time.monotonic() - _start < 0.9
+    assert _connections["wlan0"].connected
+    assert not _connections["wlan1"].connected
+    assert _connections["wlan1"].error is not None
+    setup.indicator_policy = "strongest"
+    assert setup.indicator_interface(_connections).interface == "wlan0"
+
+
+def test_interfaces_are_asked_at_once(setup, radios):
+    radios[0].delay = radios[1].delay = 0.3
+    _start = time.monotonic()
+
+    setup.connections()
+
+    assert time.monotonic() - _start < 0.55
+
+
+def test_interfaces_share_one_deadline(setup, radios):
+    radios[0].delay = radios[1].delay = 1.0
+    _start = time.monotonic()
+
+    _connections = setup.connections(timeout=0.2)
+
+    assert time.monotonic() - _start < 0.35
+    assert all(isinstance(_status.error, TimeoutError)
+               for _status in _connections.values())
+
+
+def test_single_interface_is_bounded_too(setup, radios, monkeypatch):
+    monkeypatch.setattr(wifisetup, "getWNICnames", lambda: ["wlan0"])
+    radios[0].delay = 1.0
+    _start = time.monotonic()
+
+    _connections = setup.connections(timeout=0.1)
+
+    assert time.monotonic() - _start < 0.5
+    assert isinstance(_connections["wlan0"].error, TimeoutError)
+
+
+def test_hung_interface_holds_one_worker(setup, radios):
+    _release = threading.Event()
+    _asked = []
+
+    def _hung(interface):
+        _asked.append(interface)
+        _release.wait(5)
+        return "Workshop"
+    radios[1].status = _hung
+    try:
+        # More ticks than workers, the other interface still answers
+        for _ in range(setup.MAX_WORKERS + 2):
+            _connections = setup.connections(timeout=0.05)
+            assert _connections["wlan0"].connected
+            assert isinstance(_connections["wlan1"].error, TimeoutError)
+    finally:
+        _release.set()
+    assert _asked == ["wlan1"]
+
+    # Asked again once the call is over
+    setup._calls[(setup._interface_status, "wlan1")].result(timeout=1)
+    assert setup.connections()["wlan1"].ssid == "Workshop"
+    assert _asked == ["wlan1", "wlan1"]
+
+
+def test_connection_stats_are_reused(setup, radios):
+    setup.find_connection()
+    _calls = radios[1].stats_calls
+
+    _stats = setup.get_connection_stats({"Interface": "wlan1"})
+
+    assert _stats["Quality"] == 80
+    assert radios[1].stats_calls == _calls
+
+
+def test_each_interface_scans_into_its_own_cache(setup):
+    _networks = setup.scan_interfaces()
+
+    assert set(_networks) == {"wlan0", "wlan1"}
+    assert setup._scan_cache_for("wlan1") is not setup.scan_cache
+    assert [_record.ssid for _record in _networks["wlan1"]] == \
+        ["Blocks", "Workshop"]
+
+
+def test_nmcli_status_is_read_per_device(monkeypatch):
+    _backend = NetworkManagerBackend("wlan0")
+    monkeypatch.setattr(_backend, "nm_query", lambda query, *args: False)
+    monkeypatch.setattr(backends, "run_command", lambda argv, timeout=None: (
+        b"eth0:Wired connection 1\nwlan1:Workshop\nwlan0:Blocks\\:5G\n"))
+
+    assert _backend.status("wlan0") == "Blocks:5G"
+    assert _backend.status("wlan1") == "Workshop"
+    assert _backend.status("wlan2") is None
@@ -0,0 +1,118 @@
+# coding=utf-8
+import os
+
+import pytest
+
+from octoprint_BLOCKS.python3wifi import iwlibs
+from octoprint_BLOCKS.python3wifi.iwlibs import WirelessClassifier
+
+
+class Sysfs(object):
+    """A /sys tree: devices under devices/, class/net/<ifname> symlinks
+    to them, the way the kernel lays it out.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.net = os.path.join(root, "class", "net")
+        os.makedirs(self.net)
+
+    def add(self, ifname, marker=None):
+        """Adds an interface, with a wireless/ directory or a phy80211
+        link as marker.
+        """
+        _device = os.path.join(self.root, "devices", "platform", ifname)
+        os.makedirs(os.path.join(_device, "statistics"))
+        if marker == "wireless":
+            os.mkdir(os.path.join(_device, "wireless"))
+        elif marker == "phy80211":
+            _phy = os.path.join(self.root, "class", "ieee80211",
+                                "phy-" + ifname)
+            os.makedirs(_phy)
+            os.symlink(_phy, os.path.join(_device, "phy80211"))
+        os.symlink(_device, os.path.join(self.net, ifname))
+
+    def remove(self, ifname):
+        os.unlink(os.path.join(self.net, ifname))
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    _sysfs = Sysfs(str(tmp_path))
+    _sysfs.add("lo")
+    _sysfs.add("eth0")
+    _sysfs.add("wlan0", "wireless")
+    _sysfs.add("wlan1", "phy80211")
+    return _sysfs
+
+
+@pytest.fixture
+def classifier(sysfs):
+    return WirelessClassifier(sysfs=sysfs.net)
+
+
+def test_finds_wireless_interfaces_by_their_markers(classifier):
+    assert classifier.names() == ["wlan0", "wlan1"]
+    assert classifier.is_wireless("wlan1")
+    assert not classifier.is_wireless("eth0")
+
+
+def test_classification_is_kept(classifier, sysfs):
+    classifier.names()
+    sysfs.add("wlan2", "phy80211")
+
+    assert classifier.names() == ["wlan0", "wlan1"]
+    # A known interface changing state isn't an interface coming or going
+    classifier.link_changed("wlan0")
+    assert classifier.names() == ["wlan0", "wlan1"]
+
+
+def test_new_interfaces_are_classified(classifier, sysfs):
+    classifier.names()
+    sysfs.add("wlan2", "wireless")
+    sysfs.add("eth1")
+
+    classifier.link_changed("wlan2")
+
+    assert classifier.names() == ["wlan0", "wlan1", "wlan2"]
+
+
+def test_removed_interfaces_are_forgotten(classifier, sysfs):
+    classifier.names()
+    sysfs.remove("wlan1")
+
+    classifier.link_changed("wlan1")
+
+    assert classifier.names() == ["wlan0"]
+
+
+def test_missed_changes_drop_the_classification(classifier, sysfs):
+    classifier.names()
+    sysfs.remove("wlan0")
+
+    classifier.link_changed(None)
+
+    assert classifier.names() == ["wlan1"]
+
+
+def test_invalidate_drops_the_classification(classifier, sysfs):
+    classifier.names()
+    sysfs.add("wlan2", "wireless")
+
+    classifier.invalidate()
+
+    assert classifier.names() == ["wlan0", "wlan1", "wlan2"]
+
+
+def test_changes_before_the_first_listing_are_ignored(classifier, sysfs):
+    classifier.link_changed("wlan0")
+
+    assert classifier.names() == ["wlan0", "wlan1"]
+
+
+def test_without_sysfs_the_kernel_is_asked(tmp_path, monkeypatch):
+    monkeypatch.setattr(iwlibs, "getConfiguredWNICnames", lambda: ["wlan9"])
+    _classifier = WirelessClassifier(sysfs=str(tmp_path / "missing"))
+
+    assert _classifier.names() == ["wlan9"]
+    assert _classifier._wireless is None
@@ -0,0 +1,171 @@
+# coding=utf-8
+import asyncio
+import ctypes
+import errno
+import threading
+import time
+
+import pytest
+
+from octoprint_BLOCKS.netlink import RTM_NEWLINK
+from octoprint_BLOCKS.python3wifi import flags, iwlibs, layouts
+from octoprint_BLOCKS.wirelessscan import AsyncScanner
+
+from .netlink_messages import UP, ScriptedSource, link
+from .scan_stream import stream
+
+
+class EagainChannel(object):
+    """An ioctl transport whose scan is done after EAGAIN `again` times.
+
+    SIOCGIWSCAN copies `results` into the caller's buffer like the
+    kernel, E2BIG when it doesn't fit. Every other request succeeds.
+
+    """
+
+    def __init__(self, results, again=0, errors=None):
+        self.results = results
+        self.again = again
+        self.errors = errors or {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def count(self, request):
+        with self._lock:
+            return self.requests.count(request)
+
+    def ioctl(self, request, args):
+        with self._lock:
+            self.requests.append(request)
+            if request in self.errors:
+                raise OSError(self.errors[request], "refused")
+            if request != flags.SIOCGIWSCAN:
+                return 0
+            if self.again:
+                self.again -= 1
+                raise OSError(errno.EAGAIN, "Resource temporarily unavailable")
+        _pointer, _length, _ = layouts.IW_POINT.unpack_from(
+            args, flags.IFNAMSIZE)
+        layouts.IW_POINT.pack_into(args, flags.IFNAMSIZE, _pointer,
+                                   len(self.results), 0)
+        if len(self.results) > _length:
+            raise OSError(errno.E2BIG, "Argument list too long")
+        ctypes.memmove(_pointer, self.results, len(self.results))
+        return 0
+
+
+@pytest.fixture(autouse=True)
+def wireless_extensions(monkeypatch):
+    # The scans go through the channel even where the kernel has nl80211
+    monkeypatch.setattr(iwlibs, "default_nl80211", None)
+
+
+def scanner_for(channel, source=False, poll_interval=0.05):
+    return AsyncScanner(channel=channel, source=source,
+                        poll_interval=poll_interval)
+
+
+def _wait_idle(scanner, timeout=2.0):
+    _deadline = time.monotonic() + timeout
+    while scanner._thread is not None:
+        if time.monotonic() > _deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_scan_is_read_once_eagain_stops():
+    _channel = EagainChannel(stream(5), again=3)
+    _retries = iwlibs.scan_buffers.stats()["retries"]
+    _scanner = scanner_for(_channel)
+
+    _results = _scanner.scan("wlan0").result(timeout=2)
+
+    assert [_result.essid for _result in _results] == \
+        [b"net%d" % _n for _n in range(5)]
+    assert _channel.count(flags.SIOCSIWSCAN) == 1
+    assert _channel.count(flags.SIOCGIWSCAN) == 4
+    assert iwlibs.scan_buffers.stats()["retries"] - _retries == 3
+    assert _wait_idle(_scanner)
+
+
+def test_results_larger_than_the_buffer_are_read():
+    _results = stream(60)
+    assert len(_results) > flags.IW_SCAN_MAX_DATA
+
+    _found = scanner_for(EagainChannel(_results, again=1)).scan("wlan1") \
+        .result(timeout=2)
+
+    assert len(_found) == 60
+
+
+def test_scan_past_its_deadline_times_out():
+    _scanner = scanner_for(EagainChannel(stream(5), again=10 ** 6))
+
+    with pytest.raises(TimeoutError) as error:
+        _scanner.scan("wlan0", deadline=0.3).result(timeout=2)
+    assert error.value.errno == errno.ETIMEDOUT
+    assert _wait_idle(_scanner)
+
+
+def test_scans_on_one_interface_are_joined():
+    _channel = EagainChannel(stream(3), again=2)
+    _scanner = scanner_for(_channel)
+
+    _first = _scanner.scan("wlan0")
+    _second = _scanner.scan("wlan0")
+
+    assert _first.result(timeout=2) is _second.result(timeout=2)
+    assert _channel.count(flags.SIOCSIWSCAN) == 1
+
+
+def test_cancelled_scan_stops_polling():
+    _channel = EagainChannel(stream(3), again=10 ** 6)
+    _scanner = scanner_for(_channel)
+    _future = _scanner.scan("wlan0")
+    time.sleep(0.1)
+
+    assert _future.cancel()
+    assert _wait_idle(_scanner)
+    _polls = _channel.count(flags.SIOCGIWSCAN)
+    time.sleep(0.2)
+    assert _channel.count(flags.SIOCGIWSCAN) == _polls
+
+
+def test_refused_trigger_fails_the_scan():
+    _channel = EagainChannel(stream(3), errors={flags.SIOCSIWSCAN: errno.EPERM})
+
+    _future = scanner_for(_channel).scan("wlan0")
+
+    assert _future.done()
+    assert _future.exception().errno == errno.EPERM
+
+
+def test_scan_async_can_be_gathered():
+    _channel = EagainChannel(stream(4), again=4)
+    _scanner = scanner_for(_channel)
+
+    async def _both():
+        return await asyncio.gather(_scanner.scan_async("wlan0"),
+                                    _scanner.scan_async("wlan0"))
+
+    _first, _second = asyncio.run(_both())
+
+    assert len(_first) == 4
+    assert _first is _second
+
+
+def test_scan_complete_event_reads_the_results_at_once():
+    _source = ScriptedSource()
+    _channel = EagainChannel(stream(2))
+    _scanner = scanner_for(_channel, source=_source, poll_interval=5.0)
+    _start = time.monotonic()
+
+    _future = _scanner.scan("wlan0")
+    _source.push(link(RTM_NEWLINK, 3, "wlan0", UP,
+                      wireless=(flags.SIOCGIWSCAN,)))
+
+    assert len(_future.result(timeout=2)) == 2
+    assert time.monotonic() - _start < 1.0
+    assert _source.opened
+    assert _source.closed.wait(2.0)
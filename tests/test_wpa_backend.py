@@ -0,0 +1,123 @@
+# coding=utf-8
+import shutil
+import tempfile
+
+import pytest
+
+from octoprint_BLOCKS.backends import WpaSupplicantBackend
+from octoprint_BLOCKS.registry import SavedNetwork
+
+from .fake_wpa import FakeWpaSupplicant
+
+# 0 is in use, 1 was disabled by the user, 2 is enabled
+NETWORKS = ("network id / ssid / bssid / flags\n"
+            "0\tHome\tany\t[CURRENT]\n"
+            "1\tOld\tany\t[DISABLED]\n"
+            "2\tWorkshop\tany\t\n")
+CONNECTED = "wpa_state=COMPLETED\nid=3\nssid=Blocks\nip_address=10.0.0.7\n"
+
+
+@pytest.fixture
+def wpa():
+    # Unix socket paths are short, pytest's tmp_path may be too long
+    _dir = tempfile.mkdtemp(prefix="wpa")
+    _fake = FakeWpaSupplicant(_dir, replies={
+        "LIST_NETWORKS": NETWORKS, "ADD_NETWORK": "3\n",
+        "SET_NETWORK": "OK\n", "SELECT_NETWORK": "OK\n",
+        "ENABLE_NETWORK": "OK\n", "REMOVE_NETWORK": "OK\n",
+        "REASSOCIATE": "OK\n", "SAVE_CONFIG": "OK\n", "STATUS": CONNECTED})
+    _fake.start()
+    yield _fake
+    _fake.stop()
+    shutil.rmtree(_dir)
+
+
+@pytest.fixture
+def backend(wpa, monkeypatch):
+    monkeypatch.setattr(WpaSupplicantBackend, "POLL_INTERVAL", 0.01)
+    _backend = WpaSupplicantBackend(ctrl_dir=wpa.path.rsplit("/", 1)[0])
+    _backend.apply_timeout = 0.2
+    yield _backend
+    _backend._wpa.close()
+
+
+def sent(wpa, verb):
+    return [_command for _command in wpa.received
+            if _command.split(" ", 1)[0] == verb]
+
+
+def test_connected_network_is_saved(wpa, backend):
+    _result = backend.add_network("Blocks", "secret password")
+    assert _result.ok and _result.network_id == "3"
+    assert sent(wpa, "SET_NETWORK")[0] == (
+        "SET_NETWORK 3 ssid %s" % b"Blocks".hex())
+    assert "SELECT_NETWORK 3" in wpa.received
+    # The user's disabled network stays disabled in the saved config
+    assert sent(wpa, "ENABLE_NETWORK") == ["ENABLE_NETWORK 0",
+                                           "ENABLE_NETWORK 2"]
+    assert wpa.received.index("ENABLE_NETWORK 2") < \
+        wpa.received.index("SAVE_CONFIG")
+    assert sent(wpa, "REMOVE_NETWORK") == []
+
+
+def test_replaced_network_keeps_its_priority(wpa, backend):
+    _existing = SavedNetwork("Workshop", "2", priority=-5)
+    assert backend.add_network("Workshop", "secret password", _existing)
+    assert "SET_NETWORK 3 priority -5" in wpa.received
+    assert sent(wpa, "REMOVE_NETWORK") == ["REMOVE_NETWORK 2"]
+    assert sent(wpa, "ENABLE_NETWORK") == ["ENABLE_NETWORK 0"]
+
+
+def test_wrong_password_rolls_back(wpa, backend):
+    wpa.replies["STATUS"] = "wpa_state=SCANNING\n"
+    wpa.replies["LIST_NETWORKS"] = (
+        NETWORKS + "3\tBlocks\tany\t[TEMP-DISABLED]\n")
+    _result = backend.add_network("Blocks", "wrong password")
+    assert not _result.ok and _result.reason == "auth-failed"
+    assert "SAVE_CONFIG" not in wpa.received
+    assert sent(wpa, "REMOVE_NETWORK") == ["REMOVE_NETWORK 3"]
+    assert sent(wpa, "ENABLE_NETWORK") == ["ENABLE_NETWORK 0",
+                                           "ENABLE_NETWORK 2"]
+    assert wpa.received[-1] == "REASSOCIATE"
+
+
+def test_missing_address_rolls_back(wpa, backend):
+    wpa.replies["STATUS"] = "wpa_state=COMPLETED\nid=3\nssid=Blocks\n"
+    _existing = SavedNetwork("Blocks", "2")
+    _result = backend.add_network("Blocks", "secret password", _existing)
+    assert _result.reason == "dhcp-timeout"
+    assert "SAVE_CONFIG" not in wpa.received
+    # The entry it would have replaced is kept, and enabled as it was
+    assert sent(wpa, "REMOVE_NETWORK") == ["REMOVE_NETWORK 3"]
+    assert sent(wpa, "ENABLE_NETWORK") == ["ENABLE_NETWORK 0",
+                                           "ENABLE_NETWORK 2"]
+
+
+def test_no_association_times_out(wpa, backend):
+    wpa.replies["STATUS"] = "wpa_state=SCANNING\n"
+    assert backend.add_network("Blocks", "secret password").reason == \
+        "association-timeout"
+
+
+def test_rejected_command_rolls_back(wpa, backend):
+    wpa.replies["SELECT_NETWORK"] = "FAIL\n"
+    _result = backend.add_network("Blocks", "secret password")
+    assert _result.reason == "rejected"
+    assert _result.detail == "SELECT_NETWORK: FAIL"
+    assert "STATUS" not in wpa.received
+    assert sent(wpa, "REMOVE_NETWORK") == ["REMOVE_NETWORK 3"]
+    assert sent(wpa, "ENABLE_NETWORK") == ["ENABLE_NETWORK 0",
+                                           "ENABLE_NETWORK 2"]
+
+
+def test_refused_network_is_not_staged(wpa, backend):
+    wpa.replies["ADD_NETWORK"] = "FAIL\n"
+    _result = backend.add_network("Blocks", "secret password")
+    assert _result.reason == "rejected"
+    assert sent(wpa, "SET_NETWORK") == sent(wpa, "ENABLE_NETWORK") == []
+
+
+def test_failed_save_is_reported(wpa, backend):
+    wpa.replies["SAVE_CONFIG"] = "FAIL\n"
+    _result = backend.add_network("Blocks", "secret password")
+    assert (_result.ok, _result.reason) == (False, "save-failed")
@@ -0,0 +1,123 @@
+# coding=utf-8
+import errno
+import shutil
+import tempfile
+import time
+
+import pytest
+
+from octoprint_BLOCKS.wpa_ctrl import WpaCtrl, WpaCtrlError
+
+from .fake_wpa import FakeWpaSupplicant
+
+
+@pytest.fixture
+def ctrl_dir():
+    # Unix socket paths are short, pytest's tmp_path may be too long
+    _dir = tempfile.mkdtemp(prefix="wpa")
+    yield _dir
+    shutil.rmtree(_dir)
+
+
+@pytest.fixture
+def wpa(ctrl_dir):
+    _fake = FakeWpaSupplicant(ctrl_dir)
+    _fake.start()
+    yield _fake
+    if _fake.running:
+        _fake.stop()
+
+
+@pytest.fixture
+def ctrl(ctrl_dir):
+    _ctrl = WpaCtrl("wlan0", ctrl_dir=ctrl_dir, timeout=0.3)
+    yield _ctrl
+    _ctrl.close()
+
+
+class _Failing(object):
+    """A socket whose sends fail with the given error."""
+
+    def __init__(self, sock, error):
+        self._sock = sock
+        self._error = error
+
+    def send(self, data):
+        raise self._error
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def test_replies_are_matched_to_requests(ctrl, wpa):
+    wpa.replies["STATUS"] = "wpa_state=COMPLETED\nssid=Blocks\n"
+
+    assert ctrl.request("PING") == "PONG"
+    assert ctrl.request("STATUS") == "wpa_state=COMPLETED\nssid=Blocks"
+    assert wpa.received == ["PING", "STATUS"]
+
+
+def test_one_socket_serves_every_request(ctrl, wpa):
+    for _ in range(5):
+        assert ctrl.request("PING") == "PONG"
+
+    assert len(wpa.clients) == 1
+
+
+def test_event_lines_are_not_taken_for_the_reply(ctrl, wpa):
+    wpa.replies["SCAN"] = ["<3>CTRL-EVENT-SCAN-STARTED ", "<2>Trying", "OK\n"]
+
+    assert ctrl.request("SCAN") == "OK"
+
+
+def test_extra_replies_are_drained_before_the_next_request(ctrl, wpa):
+    wpa.replies["LIST_NETWORKS"] = ["network id / ssid\n", "stale\n"]
+
+    assert ctrl.request("LIST_NETWORKS") == "network id / ssid"
+    time.sleep(0.1)
+    assert ctrl.request("PING") == "PONG"
+
+
+def test_reply_after_the_timeout_is_not_taken_for_the_next(ctrl, wpa):
+    wpa.delays["SCAN"] = 0.5
+
+    _start = time.monotonic()
+    with pytest.raises(WpaCtrlError):
+        ctrl.request("SCAN")
+    assert time.monotonic() - _start < 0.5
+    assert not ctrl.connected
+    # the late OK arrives while the next request waits
+    time.sleep(0.3)
+    assert ctrl.request("PING") == "PONG"
+
+
+@pytest.mark.parametrize("error", [
+    ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused"),
+    FileNotFoundError(errno.ENOENT, "No such file or directory"),
+])
+def test_reconnects_when_the_socket_is_gone(ctrl, wpa, error):
+    ctrl.open()
+    _stale = ctrl._sock
+    ctrl._sock = _Failing(_stale, error)
+
+    assert ctrl.request("PING") == "PONG"
+    assert ctrl._sock is not _stale
+    assert len(wpa.clients) == 1
+
+
+def test_reconnects_after_wpa_supplicant_restarts(ctrl, wpa):
+    assert ctrl.request("PING") == "PONG"
+    wpa.stop()
+    wpa.start()
+
+    assert ctrl.request("PING") == "PONG"
+    assert len(wpa.clients) == 2
+
+
+def test_fails_while_wpa_supplicant_is_down(ctrl, wpa):
+    wpa.stop()
+
+    with pytest.raises(WpaCtrlError):
+        ctrl.request("PING")
+    wpa.start()
+    assert ctrl.request("PING") == "PONG"
@@ -0,0 +1,111 @@
+# coding=utf-8
+import shutil
+import tempfile
+import time
+import queue
+
+import pytest
+
+from octoprint_BLOCKS.wpa_ctrl import WpaMonitor
+
+from .fake_wpa import FakeWpaSupplicant
+
+
+def wait_for(predicate, timeout=5.0):
+    _deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > _deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.fixture
+def ctrl_dir():
+    _dir = tempfile.mkdtemp(prefix="wpa")
+    yield _dir
+    shutil.rmtree(_dir)
+
+
+@pytest.fixture
+def wpa(ctrl_dir):
+    _fake = FakeWpaSupplicant(ctrl_dir)
+    _fake.start()
+    yield _fake
+    if _fake.running:
+        _fake.stop()
+
+
+@pytest.fixture
+def events():
+    return queue.Queue()
+
+
+@pytest.fixture
+def monitor(ctrl_dir, wpa, events):
+    _monitor = WpaMonitor(lambda event, text: events.put((event, text)),
+                          ctrl_dir=ctrl_dir, retry_interval=0.1,
+                          ping_interval=1.0)
+    _monitor.start()
+    assert wait_for(lambda: wpa.attached)
+    yield _monitor
+    _monitor.stop()
+    _monitor.join(5.0)
+
+
+def test_scan_and_connection_events_are_pushed(monitor, wpa, events):
+    wpa.send_event("CTRL-EVENT-SCAN-RESULTS ")
+    wpa.send_event("CTRL-EVENT-BSS-ADDED 0 00:11:22:33:44:55")
+    wpa.send_event("CTRL-EVENT-CONNECTED - Connection to 00:11:22:33:44:55 "
+                   "completed [id=0 id_str=]")
+    wpa.send_event("CTRL-EVENT-DISCONNECTED bssid=00:11:22:33:44:55 "
+                   "reason=3 locally_generated=1")
+
+    assert events.get(timeout=2) == ("CTRL-EVENT-SCAN-RESULTS", "")
+    assert events.get(timeout=2) == (
+        "CTRL-EVENT-CONNECTED",
+        "- Connection to 00:11:22:33:44:55 completed [id=0 id_str=]")
+    assert events.get(timeout=2)[0] == "CTRL-EVENT-DISCONNECTED"
+    assert events.empty()
+
+
+def test_nothing_is_pushed_while_nothing_happens(monitor, events):
+    time.sleep(0.3)
+
+    assert events.empty()
+
+
+def test_a_failing_callback_keeps_the_monitor_running(ctrl_dir, wpa, events):
+    def _callback(event, text):
+        events.put(event)
+        raise RuntimeError("plugin bug")
+
+    _monitor = WpaMonitor(_callback, ctrl_dir=ctrl_dir)
+    _monitor.start()
+    assert wait_for(lambda: wpa.attached)
+    wpa.send_event("CTRL-EVENT-SCAN-RESULTS ")
+    wpa.send_event("CTRL-EVENT-SCAN-RESULTS ")
+
+    assert events.get(timeout=2) == events.get(timeout=2)
+    assert _monitor.is_alive()
+    _monitor.stop()
+    _monitor.join(5.0)
+
+
+def test_stop_detaches(monitor, wpa):
+    monitor.stop()
+    monitor.join(5.0)
+
+    assert not monitor.is_alive()
+    assert wpa.received[-1] == "DETACH"
+    assert not wpa.attached
+
+
+def test_attaches_again_after_wpa_supplicant_restarts(monitor, wpa, events):
+    wpa.stop()
+    wpa.start()
+
+    # the dead socket is noticed by the next PING
+    assert wait_for(lambda: wpa.attached)
+    wpa.send_event("CTRL-EVENT-SCAN-RESULTS ")
+    assert events.get(timeout=2) == ("CTRL-EVENT-SCAN-RESULTS", "")
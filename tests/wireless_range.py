@@ -0,0 +1,81 @@
+# coding=utf-8
+"""Builds what wireless extension drivers answer to SIOCGIWRANGE and
+SIOCGIWSTATS, and an ioctl transport that answers with it.
+"""
+import ctypes
+import errno
+import threading
+
+from octoprint_BLOCKS.python3wifi import flags, layouts
+
+# Field positions in layouts.IW_RANGE
+_MAX_QUAL = 12
+_NUM_FREQUENCY = 95
+_FREQUENCIES = 96
+
+CHANNELS_2GHZ = tuple((_channel, 2407 + 5 * _channel)
+                      for _channel in range(1, 14))
+
+
+def range_data(channels=CHANNELS_2GHZ, max_quality=70):
+    """Returns a struct iw_range listing (channel, MHz) pairs."""
+    _fields = [0] * len(layouts.IW_RANGE.unpack(bytes(layouts.IW_RANGE.size)))
+    _fields[_MAX_QUAL] = max_quality
+    _fields[_NUM_FREQUENCY - 1] = _fields[_NUM_FREQUENCY] = len(channels)
+    for _index, (_channel, _mhz) in enumerate(channels):
+        _offset = _FREQUENCIES + 4 * _index
+        _fields[_offset:_offset + 4] = [_mhz, 6, _channel, 0]
+    return layouts.IW_RANGE.pack(*_fields)
+
+
+def stats_data(quality=50, signal=-60, noise=-95, updated=0x4f):
+    """Returns a struct iw_statistics."""
+    return layouts.IW_STATISTICS.pack(0, 0, quality, signal, noise, updated,
+                                      0, 0, 0, 0, 0, 0)
+
+
+class DriverChannel(object):
+    """An ioctl transport answering like a driver would.
+
+    Requests in `pointed` get their bytes copied to the buffer the request
+    points to, E2BIG if they don't fit, with the size needed written back
+    when `hint` is set like the kernel does for SIOCGIWSCAN. Requests in
+    `inline` get their bytes written into the request after the interface
+    name. Any other request fails with EOPNOTSUPP.
+
+    """
+
+    def __init__(self, pointed=None, inline=None, hint=True):
+        self.pointed = dict(pointed or {})
+        self.inline = dict(inline or {})
+        self.hint = hint
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def count(self, request):
+        with self._lock:
+            return self.requests.count(request)
+
+    def ioctl(self, request, args):
+        with self._lock:
+            self.requests.append(request)
+        if request in self.pointed:
+            _data = self.pointed[request]
+            _pointer, _length, _ = layouts.IW_POINT.unpack_from(
+                args, flags.IFNAMSIZE)
+            if len(_data) > _length:
+                if self.hint:
+                    layouts.IW_POINT.pack_into(args, flags.IFNAMSIZE,
+                                               _pointer,
+                                               min(len(_data), 0xFFFF), 0)
+                raise OSError(errno.E2BIG, "Argument list too long")
+            ctypes.memmove(_pointer, _data, len(_data))
+            layouts.IW_POINT.pack_into(args, flags.IFNAMSIZE, _pointer,
+                                       len(_data), 0)
+            return 0
+        if request in self.inline:
+            _data = self.inline[request]
+            args[flags.IFNAMSIZE:flags.IFNAMSIZE + len(_data)] = \
+                type(args)("B", _data)
+            return 0
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")